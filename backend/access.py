@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+from fastapi import Depends, HTTPException
+from database import db
+from auth_utils import get_current_user
+
+ACCESS_CACHE_TTL = float(os.environ.get("ACCESS_CACHE_TTL", "30"))
+ACCESS_CACHE_SIZE = int(os.environ.get("ACCESS_CACHE_SIZE", "10000"))
+# Operators allowed to see cross-society admin reports
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+# (user_id, society_id) -> (expires_at, access dict or None)
+_cache: dict = {}
+
+
+async def _resolve(user_id: str, society_id: str):
+    membership, flat_members = await asyncio.gather(
+        db.memberships.find_one(
+            {"user_id": user_id, "society_id": society_id, "status": "active"},
+            {"_id": 0, "id": 1, "role": 1},
+        ),
+        db.flat_members.find(
+            {"society_id": society_id, "user_id": user_id}, {"_id": 0, "flat_id": 1}
+        ).to_list(100),
+    )
+    if not membership:
+        return None
+    return {
+        "user_id": user_id,
+        "society_id": society_id,
+        "membership_id": membership["id"],
+        "role": membership["role"],
+        "flat_ids": [fm["flat_id"] for fm in flat_members],
+    }
+
+
+async def get_society_access(user_id: str, society_id: str):
+    """Role and linked flat ids of a user in a society, or None if not a member.
+
+    Results (including misses) are cached in-process for ACCESS_CACHE_TTL
+    seconds. Writers to memberships/flat_members call invalidate_access();
+    other workers see the change once their entry expires.
+    """
+    key = (user_id, society_id)
+    now = time.monotonic()
+    hit = _cache.get(key)
+    if hit and hit[0] > now:
+        return hit[1]
+
+    access = await _resolve(user_id, society_id)
+    if len(_cache) >= ACCESS_CACHE_SIZE:
+        _cache.pop(next(iter(_cache)))
+    _cache[key] = (now + ACCESS_CACHE_TTL, access)
+    return access
+
+
+def invalidate_access(society_id: str = None, user_id: str = None):
+    """Drop cached access for a user in a society, a whole society, or everything."""
+    if society_id is None:
+        _cache.clear()
+    elif user_id is not None:
+        _cache.pop((user_id, society_id), None)
+    else:
+        for key in [k for k in _cache if k[1] == society_id]:
+            del _cache[key]
+
+
+def require_access(*roles: str):
+    """FastAPI dependency factory: caller must be an active member with one of `roles`."""
+    async def dependency(society_id: str, current_user: dict = Depends(get_current_user)) -> dict:
+        access = await get_society_access(current_user["sub"], society_id)
+        if not access:
+            raise HTTPException(status_code=403, detail="Not a member of this society")
+        if roles and access["role"] not in roles:
+            raise HTTPException(status_code=403, detail="Insufficient permissions")
+        return access
+    return dependency
+
+
+async def require_admin(current_user: dict = Depends(get_current_user)) -> dict:
+    """FastAPI dependency: caller's email must be listed in ADMIN_EMAILS."""
+    if current_user.get("email", "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
@@ -1,9 +1,16 @@
 from datetime import datetime, timezone, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pymongo.errors import DuplicateKeyError
+from database import db
+import asyncio
+import hashlib
 import os
+import time
 
 SECRET_KEY = os.environ.get('JWT_SECRET', 'sfm-jwt-secret-2024-prod')
 ALGORITHM = "HS256"
@@ -12,6 +19,24 @@ ACCESS_TOKEN_EXPIRE = 1440
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# bcrypt runs off the event loop on a bounded pool ("thread" or "process")
+PASSWORD_POOL_KIND = os.environ.get("PASSWORD_POOL_KIND", "thread")
+PASSWORD_POOL_WORKERS = int(os.environ.get("PASSWORD_POOL_WORKERS", os.cpu_count() or 2))
+PASSWORD_POOL_MAX_CONCURRENCY = int(os.environ.get("PASSWORD_POOL_MAX_CONCURRENCY", PASSWORD_POOL_WORKERS))
+
+_password_pool = None
+_password_slots = None
+_password_stats = {"in_flight": 0, "waiting": 0, "max_waiting": 0, "completed": 0}
+
+# Verified JWT payloads, keyed by sha256 of the token, kept until their exp.
+# Revocations live in the revoked_tokens collection (TTL on expires_at) so
+# every worker sees them; a cached token is re-checked against it once it
+# has been cached for TOKEN_REVOCATION_CHECK seconds.
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_REVOCATION_CHECK = float(os.environ.get("TOKEN_REVOCATION_CHECK", "30"))
+_token_cache: OrderedDict = OrderedDict()  # digest -> (checked_at, payload)
+_token_stats = {"hits": 0, "misses": 0, "evictions": 0, "revocation_checks": 0}
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -21,6 +46,56 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+def _get_password_pool():
+    global _password_pool, _password_slots
+    if _password_pool is None:
+        pool_cls = ProcessPoolExecutor if PASSWORD_POOL_KIND == "process" else ThreadPoolExecutor
+        _password_pool = pool_cls(max_workers=PASSWORD_POOL_WORKERS)
+        _password_slots = asyncio.Semaphore(PASSWORD_POOL_MAX_CONCURRENCY)
+    return _password_pool
+
+
+async def _run_in_password_pool(fn, *args):
+    pool = _get_password_pool()
+    _password_stats["waiting"] += 1
+    _password_stats["max_waiting"] = max(_password_stats["max_waiting"], _password_stats["waiting"])
+    try:
+        await _password_slots.acquire()
+    finally:
+        _password_stats["waiting"] -= 1
+    _password_stats["in_flight"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    finally:
+        _password_stats["in_flight"] -= 1
+        _password_stats["completed"] += 1
+        _password_slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_password_pool(hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    return await _run_in_password_pool(verify_password, plain, hashed)
+
+
+def password_pool_stats() -> dict:
+    return {
+        "kind": PASSWORD_POOL_KIND,
+        "workers": PASSWORD_POOL_WORKERS,
+        "max_concurrency": PASSWORD_POOL_MAX_CONCURRENCY,
+        **_password_stats,
+    }
+
+
+def shutdown_password_pool():
+    global _password_pool
+    if _password_pool is not None:
+        _password_pool.shutdown(wait=False)
+        _password_pool = None
+
+
 def create_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE)
@@ -28,12 +103,76 @@ def create_token(data: dict) -> str:
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def revoke_token(token: str):
+    """Reject a token on every worker until it expires (logout)."""
+    digest = _token_digest(token)
+    cached = _token_cache.pop(digest, None)
+    if cached is not None:
+        payload = cached[1]
+    else:
+        try:
+            payload = jwt.get_unverified_claims(token)
+        except JWTError:
+            return
+    exp = datetime.fromtimestamp(payload.get("exp", time.time()), timezone.utc)
+    try:
+        await db.revoked_tokens.update_one(
+            {"digest": digest}, {"$set": {"expires_at": exp}}, upsert=True,
+        )
+    except DuplicateKeyError:
+        # A concurrent logout of the same token already stored it
+        pass
+
+
+async def _is_revoked(digest: str) -> bool:
+    _token_stats["revocation_checks"] += 1
+    return await db.revoked_tokens.find_one({"digest": digest}, {"_id": 0, "digest": 1}) is not None
+
+
+def token_cache_stats() -> dict:
+    lookups = _token_stats["hits"] + _token_stats["misses"]
+    return {
+        "size": len(_token_cache),
+        "max_size": TOKEN_CACHE_SIZE,
+        "hit_rate": round(_token_stats["hits"] / lookups, 4) if lookups else 0,
+        **_token_stats,
+    }
+
+
 async def get_current_user(cred: HTTPAuthorizationCredentials = Depends(security)):
+    digest = _token_digest(cred.credentials)
+    now = time.time()
+    cached = _token_cache.get(digest)
+    if cached is not None:
+        checked_at, payload = cached
+        if payload["exp"] > now:
+            if now - checked_at >= TOKEN_REVOCATION_CHECK:
+                if await _is_revoked(digest):
+                    _token_cache.pop(digest, None)
+                    raise HTTPException(status_code=401, detail="Invalid or expired token")
+                _token_cache[digest] = (now, payload)
+            _token_cache.move_to_end(digest)
+            _token_stats["hits"] += 1
+            return dict(payload)
+        del _token_cache[digest]
+    _token_stats["misses"] += 1
+
     try:
         payload = jwt.decode(cred.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
-        return payload
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if await _is_revoked(digest):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    _token_cache[digest] = (now, payload)
+    if len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+        _token_stats["evictions"] += 1
+    return dict(payload)
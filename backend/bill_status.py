@@ -0,0 +1,91 @@
+"""Effective bill status and late fee, evaluated at read time.
+
+A pending or partial bill whose due date has passed is overdue, and an
+overdue bill carries the late fee from the society's maintenance settings,
+whether or not a sweep has written that yet. effective_bill() applies this
+to one document; effective_fields() gives the same rules as an $addFields
+stage so aggregations agree with the listings. Fees are only written
+(materialized, with their ledger debit) by the overdue sweep or when a
+payment is recorded against the bill.
+"""
+
+UNPAID_STATUSES = ["pending", "partial"]
+
+
+def late_fee_for(amount: float, settings: dict) -> float:
+    """Late fee on a bill amount under the society's settings."""
+    fee = settings.get("late_fee_amount", 0)
+    if fee <= 0:
+        return 0
+    if settings.get("late_fee_type") == "percentage":
+        return round(amount * fee / 100, 2)
+    return round(fee, 2)
+
+
+def effective_bill(bill: dict, settings: dict, today: str) -> dict:
+    status = bill.get("status")
+    if status in UNPAID_STATUSES and bill.get("due_date") and bill["due_date"] < today:
+        status = "overdue"
+    fee = 0
+    if status == "overdue" and not bill.get("late_fee"):
+        fee = late_fee_for(bill["final_payable_amount"], settings)
+    if status == bill.get("status") and not fee:
+        return bill
+    bill = {**bill, "status": status}
+    if fee:
+        bill["late_fee"] = fee
+        bill["final_payable_amount"] = round(bill["final_payable_amount"] + fee, 2)
+    return bill
+
+
+def _past_due_expr(today: str) -> dict:
+    # null/missing sort before strings, so require a non-empty due_date as
+    # effective_bill() does
+    return {"$and": [
+        {"$in": ["$status", UNPAID_STATUSES]},
+        {"$gt": ["$due_date", ""]},
+        {"$lt": ["$due_date", today]},
+    ]}
+
+
+def status_expr(today: str) -> dict:
+    return {"$cond": [_past_due_expr(today), "overdue", "$status"]}
+
+
+def late_fee_expr(settings: dict, today: str) -> dict:
+    stored = {"$ifNull": ["$late_fee", 0]}
+    fee = settings.get("late_fee_amount", 0)
+    if fee <= 0:
+        return stored
+    if settings.get("late_fee_type") == "percentage":
+        charge = {"$round": [{"$multiply": ["$final_payable_amount", fee / 100]}, 2]}
+    else:
+        charge = round(fee, 2)
+    return {"$cond": [
+        {"$and": [{"$eq": [stored, 0]}, {"$eq": [status_expr(today), "overdue"]}]},
+        charge, stored,
+    ]}
+
+
+def effective_fields(settings: dict, today: str) -> dict:
+    """$addFields body setting status, late_fee and final_payable_amount to their effective values."""
+    late_fee = late_fee_expr(settings, today)
+    return {
+        "status": status_expr(today),
+        "late_fee": late_fee,
+        "final_payable_amount": {"$add": [
+            "$final_payable_amount", {"$subtract": [late_fee, {"$ifNull": ["$late_fee", 0]}]},
+        ]},
+    }
+
+
+def status_filter(status: str, today: str) -> dict:
+    """Query matching bills whose effective status is `status`."""
+    if status == "overdue":
+        return {"$or": [
+            {"status": "overdue"},
+            {"status": {"$in": UNPAID_STATUSES}, "due_date": {"$gt": "", "$lt": today}},
+        ]}
+    if status in UNPAID_STATUSES:
+        return {"status": status, "due_date": {"$not": {"$gt": "", "$lt": today}}}
+    return {"status": status}
@@ -0,0 +1,37 @@
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import db
+from datetime import date, datetime, timezone
+
+
+def financial_year(d=None) -> str:
+    """Indian financial year label (April-March) for a date, e.g. '2026-27'."""
+    if d is None:
+        d = datetime.now(timezone.utc).date()
+    elif isinstance(d, str):
+        d = date.fromisoformat(d[:10])
+    start = d.year if d.month >= 4 else d.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+async def reserve(society_id: str, name: str, period: str, count: int = 1) -> int:
+    """Atomically reserve `count` consecutive values and return the first one."""
+    query = {"society_id": society_id, "name": name, "period": period}
+    for _ in range(2):
+        try:
+            doc = await db.counters.find_one_and_update(
+                query, {"$inc": {"seq": count}},
+                projection={"_id": 0, "seq": 1}, upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            return doc["seq"] - count + 1
+        except DuplicateKeyError:
+            # Two first-time upserts raced; the loser retries against the existing doc
+            continue
+    raise RuntimeError(f"Could not allocate counter {name} for {society_id}/{period}")
+
+
+async def allocate_receipt_numbers(society_id: str, count: int = 1, on_date=None) -> list[str]:
+    """Allocate a block of receipt numbers for the financial year of `on_date`."""
+    fy = financial_year(on_date)
+    first = await reserve(society_id, "receipt", fy, count)
+    return [f"RCP-{fy}-{n:05d}" for n in range(first, first + count)]
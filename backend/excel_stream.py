@@ -0,0 +1,117 @@
+"""Stream an .xlsx file while its rows are still being read.
+
+The workbook is an openpyxl write-only workbook built in a worker thread,
+so neither row serialisation nor zip compression runs on the event loop.
+The thread pulls row batches from an async iterator on the loop, and its
+output goes through a bounded queue to the response. A slow client
+therefore holds back the thread, and the thread holds back the database
+cursor, so memory stays bounded by the queue and one batch.
+
+Write-only sheets keep their rows in a temporary file, and the zip archive
+is only written once the last row is in. The response starts right away,
+but most of the bytes come at the end.
+"""
+import asyncio
+import threading
+
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_QUEUE_CHUNKS = 16
+_PUT_POLL_SECONDS = 1
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _QueueWriter:
+    """Write-only file object handing EXPORT_CHUNK_BYTES chunks to an asyncio queue."""
+
+    def __init__(self, loop, queue: asyncio.Queue, cancelled: threading.Event):
+        self.loop = loop
+        self.queue = queue
+        self.cancelled = cancelled
+        self.buffer = bytearray()
+
+    def _put(self, item):
+        while True:
+            if self.cancelled.is_set():
+                raise _Cancelled()
+            put = asyncio.wait_for(self.queue.put(item), _PUT_POLL_SECONDS)
+            try:
+                return asyncio.run_coroutine_threadsafe(put, self.loop).result()
+            except TimeoutError:
+                continue
+
+    def write(self, data) -> int:
+        if self.cancelled.is_set():
+            # Let the abandoned zip archive close quietly once the build has stopped
+            if self.buffer is None:
+                return len(data)
+            self.buffer = None
+            raise _Cancelled()
+        self.buffer += data
+        if len(self.buffer) >= EXPORT_CHUNK_BYTES:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+        return len(data)
+
+    def flush(self):
+        if self.cancelled.is_set():
+            return
+        if self.buffer:
+            self._put(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def _build(loop, title: str, header: list, batches, writer: _QueueWriter):
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(header)
+    while True:
+        if writer.cancelled.is_set():
+            raise _Cancelled()
+        try:
+            rows = asyncio.run_coroutine_threadsafe(batches.__anext__(), loop).result()
+        except StopAsyncIteration:
+            break
+        for row in rows:
+            ws.append(row)
+    wb.save(writer)
+    writer.flush()
+
+
+async def stream_workbook(title: str, header: list, batches):
+    """Yield the bytes of a one-sheet workbook whose rows come from `batches`,
+    an async iterator of lists of rows."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    writer = _QueueWriter(loop, queue, cancelled)
+    done = object()
+
+    def run():
+        try:
+            _build(loop, title, header, batches, writer)
+            writer._put(done)
+        except _Cancelled:
+            pass
+        except Exception as e:
+            try:
+                writer._put(e)
+            except _Cancelled:
+                pass
+
+    worker = asyncio.create_task(asyncio.to_thread(run))
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is done:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        # Client went away or the build failed: stop the thread and wait for it
+        cancelled.set()
+        await worker
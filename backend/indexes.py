@@ -0,0 +1,237 @@
+"""Index declarations for every query shape used by the route modules.
+
+ensure_indexes() runs at application startup and is idempotent; it only
+changes existing indexes in place. Run `python indexes.py` to rebuild
+indexes whose options changed, drop retired ones, and print missing,
+undeclared and unused indexes.
+"""
+from pymongo import ASCENDING as ASC, DESCENDING as DESC, IndexModel
+from pymongo.errors import OperationFailure
+from database import db
+from notification_retention import TTL_SECONDS
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASC)], unique=True),
+        IndexModel([("id", ASC)], unique=True),
+    ],
+    "societies": [
+        IndexModel([("id", ASC)], unique=True),
+    ],
+    "memberships": [
+        IndexModel([("user_id", ASC), ("society_id", ASC)]),
+        IndexModel([("society_id", ASC), ("role", ASC), ("status", ASC)]),
+        IndexModel([("id", ASC)]),
+    ],
+    "flats": [
+        IndexModel([("society_id", ASC), ("id", ASC)]),
+        IndexModel([("id", ASC)]),
+    ],
+    "flat_members": [
+        IndexModel([("flat_id", ASC), ("society_id", ASC)]),
+        IndexModel([("society_id", ASC), ("user_id", ASC)]),
+        IndexModel([("society_id", ASC), ("is_primary", ASC), ("flat_id", ASC)]),
+        IndexModel([("id", ASC)]),
+    ],
+    "transactions": [
+        IndexModel([("id", ASC)]),
+        IndexModel([("society_id", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("society_id", ASC), ("txn_date", ASC)]),
+    ],
+    "txn_rollups": [
+        IndexModel(
+            [("society_id", ASC), ("year", ASC), ("month", ASC), ("type", ASC), ("category", ASC)], unique=True
+        ),
+    ],
+    "maintenance_bills": [
+        IndexModel([("society_id", ASC), ("month", ASC), ("year", ASC)]),
+        IndexModel([("society_id", ASC), ("status", ASC)]),
+    ],
+    "maintenance_bills_v2": [
+        IndexModel([("id", ASC)], unique=True),
+        IndexModel([("society_id", ASC), ("year", ASC), ("month", ASC)]),
+        IndexModel([("society_id", ASC), ("flat_id", ASC)]),
+        IndexModel([("society_id", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("society_id", ASC), ("status", ASC), ("due_date", ASC)]),
+        IndexModel([("status", ASC), ("due_date", ASC), ("society_id", ASC)]),
+        IndexModel([("society_id", ASC), ("late_fee_run_id", ASC)], sparse=True),
+    ],
+    "maintenance_settings": [
+        IndexModel([("society_id", ASC)], unique=True),
+    ],
+    "discount_schemes": [
+        IndexModel([("society_id", ASC)]),
+        IndexModel([("id", ASC)]),
+    ],
+    "maintenance_payments": [
+        IndexModel([("society_id", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("society_id", ASC), ("flat_id", ASC)]),
+        # Unique among imported rows: keeps statement imports idempotent, while
+        # manual payments may share references such as "CASH"
+        IndexModel([("society_id", ASC), ("transaction_reference", ASC)], unique=True,
+                   partialFilterExpression={"source": "import"}),
+        IndexModel([("society_id", ASC), ("payment_date", ASC)]),
+        IndexModel([("id", ASC)]),
+    ],
+    "member_ledger": [
+        IndexModel([("id", ASC)], unique=True),
+        IndexModel([("society_id", ASC), ("flat_id", ASC), ("seq", DESC)]),
+    ],
+    "member_accounts": [
+        IndexModel([("society_id", ASC), ("flat_id", ASC)], unique=True),
+    ],
+    "counters": [
+        IndexModel([("society_id", ASC), ("name", ASC), ("period", ASC)], unique=True),
+    ],
+    "revoked_tokens": [
+        IndexModel([("digest", ASC)], unique=True),
+        IndexModel([("expires_at", ASC)], expireAfterSeconds=0),
+    ],
+    "jobs": [
+        IndexModel([("id", ASC)], unique=True),
+        IndexModel([("active_key", ASC)], unique=True, sparse=True),
+        IndexModel([("status", ASC), ("created_at", ASC)]),
+        IndexModel([("type", ASC), ("params.run_date", ASC)]),
+    ],
+    "reconciliations": [
+        IndexModel([("society_id", ASC), ("period", ASC)], unique=True),
+    ],
+    "reconciliation_items": [
+        IndexModel([("run_id", ASC), ("status", ASC), ("line_no", ASC)]),
+    ],
+    "approvals": [
+        IndexModel([("society_id", ASC), ("status", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("society_id", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("id", ASC)]),
+    ],
+    "notification_counters": [
+        IndexModel([("user_id", ASC), ("society_id", ASC)], unique=True),
+    ],
+    "notifications": [
+        IndexModel([("id", ASC)], unique=True),
+        IndexModel([("user_id", ASC), ("read", ASC)]),
+        IndexModel([("user_id", ASC), ("created_at", DESC), ("id", DESC)]),
+        IndexModel([("user_id", ASC), ("society_id", ASC), ("read", ASC), ("created_at", DESC)]),
+        IndexModel([("read_at", ASC)], expireAfterSeconds=TTL_SECONDS),
+    ],
+}
+
+
+# Indexes no query uses any more; `python indexes.py` drops them
+RETIRED = {
+    "transactions": [[("society_id", ASC), ("year", ASC), ("month", ASC)]],
+    "member_ledger": [[("society_id", ASC), ("flat_id", ASC), ("entry_date", DESC), ("seq", DESC)]],
+}
+
+
+def _key(spec) -> tuple:
+    return tuple((field, int(direction)) for field, direction in spec)
+
+
+_OPTIONS = ("unique", "expireAfterSeconds", "partialFilterExpression", "sparse")
+
+
+async def _sync_options(name: str, models: list, rebuild: bool = False) -> list:
+    """Bring existing indexes whose options differ from their declaration in line.
+
+    A changed TTL is applied in place. A plain index that became unique is
+    converted with collMod (MongoDB 6.0+). Other changes need the index
+    dropped and rebuilt, which only happens with `rebuild` (the CLI; workers
+    starting side by side would race on it); the old index is restored if
+    the new one cannot be built (e.g. the collection holds duplicates).
+    Returns the declarations left for a rebuild.
+    """
+    pending = []
+    existing = {_key(info["key"]): (idx_name, info) for idx_name, info in (await db[name].index_information()).items()}
+    for m in models:
+        found = existing.get(_key(m.document["key"].items()))
+        if not found:
+            continue
+        idx_name, info = found
+        declared = {o: m.document[o] for o in _OPTIONS if o in m.document}
+        current = {o: info[o] for o in _OPTIONS if o in info}
+        if declared == current:
+            continue
+        key = dict(m.document["key"])
+        if {o for o in _OPTIONS if declared.get(o) != current.get(o)} == {"expireAfterSeconds"}:
+            await db.command("collMod", name, index={"keyPattern": key, "expireAfterSeconds": declared["expireAfterSeconds"]})
+        elif declared.get("unique") and {**current, "unique": True} == declared:
+            await db.command("collMod", name, index={"keyPattern": key, "prepareUnique": True})
+            await db.command("collMod", name, index={"keyPattern": key, "unique": True})
+        elif not rebuild:
+            pending.append(m)
+        else:
+            await db[name].drop_index(idx_name)
+            try:
+                await db[name].create_indexes([m])
+            except OperationFailure:
+                await db[name].create_index(list(info["key"]), name=idx_name, **current)
+                raise
+    return pending
+
+
+async def ensure_indexes(rebuild: bool = False):
+    """Create every declared index; existing identical indexes are left alone."""
+    for name, models in INDEXES.items():
+        try:
+            await db[name].create_indexes(models)
+        except OperationFailure as e:
+            try:
+                pending = await _sync_options(name, models, rebuild)
+                if pending:
+                    names = ", ".join(m.document["name"] for m in pending)
+                    logger.warning(f"Indexes on {name} need a rebuild ({names}): run python indexes.py")
+                await db[name].create_indexes([m for m in models if m not in pending])
+                continue
+            except OperationFailure:
+                pass
+            # e.g. an index with the same keys but different options already exists
+            logger.warning(f"Index creation failed on {name}: {e}")
+
+
+async def index_report() -> dict:
+    """Per collection: declared indexes that are missing, and existing ones that
+    are undeclared or have not been used since the server started."""
+    report = {}
+    for name, models in INDEXES.items():
+        declared = {_key(m.document["key"].items()) for m in models}
+        existing = {}
+        for idx_name, info in (await db[name].index_information()).items():
+            if idx_name != "_id_":
+                existing[_key(info["key"])] = idx_name
+        usage = {}
+        async for stat in db[name].aggregate([{"$indexStats": {}}]):
+            usage[stat["name"]] = stat["accesses"]["ops"]
+
+        report[name] = {
+            "missing": [dict(k) for k in declared - existing.keys()],
+            "undeclared": [existing[k] for k in existing.keys() - declared],
+            "unused": sorted(n for n in existing.values() if usage.get(n, 0) == 0),
+        }
+    return report
+
+
+async def drop_retired():
+    for name, specs in RETIRED.items():
+        existing = {_key(info["key"]): idx_name for idx_name, info in (await db[name].index_information()).items()}
+        for spec in specs:
+            idx_name = existing.get(_key(spec))
+            if idx_name:
+                await db[name].drop_index(idx_name)
+                print(f"{name}: dropped {idx_name}")
+
+
+async def _main():
+    await ensure_indexes(rebuild=True)
+    await drop_retired()
+    for name, entry in (await index_report()).items():
+        if any(entry.values()):
+            print(f"{name}: {entry}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
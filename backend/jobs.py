@@ -0,0 +1,270 @@
+"""Durable background jobs stored in the `jobs` collection.
+
+A job is claimed by one worker at a time through a lease. Handlers save
+their position with ctx.checkpoint(); if the process dies, the lease runs
+out and the next worker to claim the job resumes from the last checkpoint.
+active_key (unique, released once the job completes or fails for good)
+keeps two jobs for the same piece of work from running side by side.
+"""
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import db
+from datetime import datetime, timezone, timedelta
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "15"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+WORKER_ID = f"{os.uname().nodename}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_handlers = {}
+_schedules = {}
+_once = {}
+_tasks = set()
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class JobContext:
+    def __init__(self, job: dict):
+        self.job = job
+
+    @property
+    def state(self) -> dict:
+        return self.job.get("state", {})
+
+    @property
+    def resumed(self) -> bool:
+        """True when an earlier attempt of this job was interrupted."""
+        return self.job.get("claims", 1) > 1
+
+    async def _update(self, fields: dict):
+        now = datetime.now(timezone.utc)
+        doc = await db.jobs.find_one_and_update(
+            {"id": self.job["id"], "lease_owner": WORKER_ID, "lease_expires_at": {"$gt": now}},
+            {"$set": {
+                **fields,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                "updated_at": now.isoformat(),
+            }},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            raise LeaseLost(self.job["id"])
+        self.job = doc
+
+    async def renew(self):
+        """Extend the lease, raising LeaseLost if another worker has taken the job.
+
+        Call before writes that must not run twice side by side.
+        """
+        await self._update({})
+
+    async def checkpoint(self, state: dict, progress: dict):
+        """Persist the handler's position and progress, renewing the lease."""
+        await self._update({"state": state, "progress": progress})
+
+
+def handler(job_type: str):
+    def register(fn):
+        _handlers[job_type] = fn
+        return fn
+    return register
+
+
+def schedule_daily(job_type: str, at: str):
+    """Queue job_type once a day, at or after `at` (HH:MM, UTC)."""
+    _schedules[job_type] = at
+
+
+def schedule_once(job_type: str, key: str):
+    """Queue job_type a single time for `key`, by whichever worker polls first."""
+    _once[job_type] = key
+
+
+def public_view(job: dict) -> dict:
+    hidden = ("_id", "state", "lease_owner", "lease_expires_at", "active_key", "released_key")
+    return {k: v for k, v in job.items() if k not in hidden}
+
+
+async def submit(job_type: str, society_id: str, params: dict, created_by: str,
+                 active_key: str = None, progress: dict = None, start: bool = True,
+                 claim: bool = False) -> dict:
+    """Store a queued job and, unless start is False, start it in this process.
+
+    With claim=True the job is stored already leased to this worker and is
+    not started; the caller runs it with run_claimed(), and no other worker
+    can pick it up first.
+
+    Raises DuplicateKeyError when another job holds the same active_key.
+    """
+    now = datetime.now(timezone.utc)
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": job_type,
+        "society_id": society_id,
+        "params": params,
+        "status": "queued",
+        "state": {},
+        "progress": progress or {},
+        "attempts": 0,
+        "claims": 0,
+        "error": "",
+        "created_by": created_by,
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+    }
+    if active_key:
+        job["active_key"] = active_key
+    if claim:
+        job.update({
+            "status": "running",
+            "lease_owner": WORKER_ID,
+            "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            "attempts": 1,
+            "claims": 1,
+        })
+    await db.jobs.insert_one(job)
+    job.pop("_id", None)
+    if start and not claim:
+        _start(job["id"])
+    return job
+
+
+def _start(job_id: str = None):
+    task = asyncio.create_task(run(job_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def _claim(job_id: str = None):
+    now = datetime.now(timezone.utc)
+    query = {
+        "status": {"$in": ["queued", "running"]},
+        "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}],
+    }
+    if job_id:
+        query["id"] = job_id
+    return await db.jobs.find_one_and_update(
+        query,
+        {"$set": {
+            "status": "running",
+            "lease_owner": WORKER_ID,
+            "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            "updated_at": now.isoformat(),
+        }, "$inc": {"attempts": 1, "claims": 1}},
+        projection={"_id": 0}, sort=[("created_at", 1)], return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _finish(job_id: str, update: dict, release: bool):
+    update["updated_at"] = datetime.now(timezone.utc).isoformat()
+    change = {"$set": update, "$unset": {"lease_owner": "", "lease_expires_at": ""}}
+    if release:
+        # Kept aside so retry() can give a failed job its key back
+        change["$rename"] = {"active_key": "released_key"}
+    await db.jobs.update_one({"id": job_id, "lease_owner": WORKER_ID}, change)
+
+
+async def run(job_id: str = None) -> dict:
+    """Claim a job (a specific one, or the oldest claimable) and run it to completion."""
+    job = await _claim(job_id)
+    if job is None:
+        return None
+    return await run_claimed(job)
+
+
+async def run_claimed(job: dict) -> dict:
+    """Run a job this worker already holds the lease on."""
+    fn = _handlers.get(job["type"])
+    if fn is None:
+        await _finish(job["id"], {"status": "failed", "error": f"Unknown job type {job['type']}"}, True)
+        return job
+    if job["attempts"] > JOB_MAX_ATTEMPTS:
+        await _finish(job["id"], {"status": "failed", "error": job.get("error") or "Too many attempts"}, True)
+        return job
+
+    ctx = JobContext(job)
+    try:
+        result = await fn(ctx)
+    except LeaseLost:
+        logger.warning(f"Job {job['id']} lease lost; another worker will resume it")
+        return job
+    except asyncio.CancelledError:
+        # Shutdown: leave the job claimed; the lease expires and it resumes elsewhere
+        raise
+    except Exception as e:
+        logger.exception(f"Job {job['id']} failed")
+        status = "queued" if job["attempts"] < JOB_MAX_ATTEMPTS else "failed"
+        await _finish(job["id"], {"status": status, "error": str(e)}, status == "failed")
+        return job
+    await _finish(job["id"], {
+        "status": "completed", "result": result or {}, "error": "",
+        "completed_at": datetime.now(timezone.utc).isoformat(),
+    }, True)
+    return job
+
+
+async def retry(job_id: str) -> bool:
+    """Requeue a failed job; it resumes from its last checkpoint.
+
+    Raises DuplicateKeyError when a newer job has taken its active_key.
+    """
+    result = await db.jobs.update_one(
+        {"id": job_id, "status": "failed"},
+        {"$set": {"status": "queued", "attempts": 0, "updated_at": datetime.now(timezone.utc).isoformat()},
+         "$rename": {"released_key": "active_key"}},
+    )
+    if result.modified_count:
+        _start(job_id)
+    return bool(result.modified_count)
+
+
+async def _submit_scheduled():
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    for job_type, at in _schedules.items():
+        if now.strftime("%H:%M") < at:
+            continue
+        if await db.jobs.find_one({"type": job_type, "params.run_date": today}, {"_id": 0, "id": 1}):
+            continue
+        try:
+            await submit(job_type, "", {"run_date": today}, "scheduler", active_key=f"{job_type}:{today}", start=False)
+        except DuplicateKeyError:
+            # Another process queued it first
+            pass
+    for job_type, key in _once.items():
+        if await db.jobs.find_one({"type": job_type, "params.once": key}, {"_id": 0, "id": 1}):
+            continue
+        try:
+            await submit(job_type, "", {"once": key}, "scheduler", active_key=f"{job_type}:{key}", start=False)
+        except DuplicateKeyError:
+            pass
+
+
+async def worker_loop():
+    """Queue scheduled jobs, then pick up queued jobs and jobs whose worker died, until cancelled."""
+    while True:
+        try:
+            await _submit_scheduled()
+            while await run() is not None:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Job worker poll failed")
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+def shutdown():
+    for task in list(_tasks):
+        task.cancel()
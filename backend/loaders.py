@@ -0,0 +1,59 @@
+import asyncio
+from database import db
+
+# Fields routes actually need from a user; never pull password_hash
+USER_PROJECTION = {"_id": 0, "id": 1, "name": 1, "email": 1}
+
+
+class UserLoader:
+    """Per-request batching loader for user documents.
+
+    `load()` calls made in the same event-loop tick are collected and resolved
+    with a single `users.find({"id": {"$in": [...]}})`. Results are memoised for
+    the lifetime of the loader, which is one request.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._queue = []
+        self._dispatch_task = None
+
+    async def load(self, user_id: str):
+        if not user_id:
+            return None
+        fut = self._futures.get(user_id)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._futures[user_id] = fut
+            self._queue.append(user_id)
+            if len(self._queue) == 1:
+                # Runs after every load() already scheduled in this tick has queued its id
+                self._dispatch_task = asyncio.ensure_future(self._dispatch())
+        return await fut
+
+    async def load_many(self, user_ids) -> dict:
+        """Load many users at once; returns {user_id: user_doc} for those found."""
+        ids = list({i for i in user_ids if i})
+        docs = await asyncio.gather(*(self.load(i) for i in ids))
+        return {i: d for i, d in zip(ids, docs) if d}
+
+    async def name(self, user_id: str) -> str:
+        user = await self.load(user_id)
+        return user["name"] if user else ""
+
+    async def _dispatch(self):
+        ids, self._queue = self._queue, []
+        try:
+            docs = await db.users.find({"id": {"$in": ids}}, USER_PROJECTION).to_list(None)
+        except Exception as e:
+            for i in ids:
+                self._futures.pop(i).set_exception(e)
+            return
+        by_id = {d["id"]: d for d in docs}
+        for i in ids:
+            self._futures[i].set_result(by_id.get(i))
+
+
+def get_user_loader() -> UserLoader:
+    """FastAPI dependency: a fresh loader per request."""
+    return UserLoader()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
 
 
@@ -251,6 +251,7 @@ class LedgerEntryResponse(BaseModel):
     debit_amount: float = 0
     credit_amount: float = 0
     balance_after_entry: float = 0
+    seq: int = 0
     notes: str = ""
 
 
@@ -279,6 +280,22 @@ class RecordPaymentRequest(BaseModel):
     discount_scheme_id: Optional[str] = None
 
 
+class ImportPaymentRow(BaseModel):
+    flat_number: str = ""
+    flat_id: str = ""
+    amount_paid: float
+    payment_date: str = ""
+    payment_mode: str = "upi"
+    transaction_reference: str
+    remarks: str = ""
+
+    @field_validator("flat_number", "flat_id", "transaction_reference", mode="before")
+    @classmethod
+    def _as_str(cls, v):
+        # JSON statements may carry flat numbers and references as numbers
+        return str(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else v
+
+
 class PaymentResponse(BaseModel):
     id: str
     society_id: str
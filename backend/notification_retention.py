@@ -0,0 +1,97 @@
+"""Retention for the notifications collection.
+
+Notifications get a read_at date when marked read, and a TTL index on
+read_at removes them NOTIFY_RETENTION_DAYS later. Unread notifications are
+never expired.
+
+With NOTIFY_ARCHIVE_DIR set, a daily job first moves notifications past
+retention into gzip-compressed JSONL files there (one file per run date)
+and deletes them; the TTL index then waits ARCHIVE_GRACE_DAYS longer, as a
+backstop should the job fall behind. A crash between writing a batch and
+deleting it can leave that batch in the archive twice; lines carry the
+notification id.
+"""
+from database import db
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import asyncio
+import gzip
+import json
+import logging
+import os
+import jobs
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_RETENTION_DAYS = int(os.environ.get("NOTIFY_RETENTION_DAYS", "90"))
+NOTIFY_ARCHIVE_DIR = os.environ.get("NOTIFY_ARCHIVE_DIR", "")
+NOTIFY_RETENTION_AT = os.environ.get("NOTIFY_RETENTION_AT", "02:00")
+ARCHIVE_GRACE_DAYS = 7
+ARCHIVE_BATCH_SIZE = 1000
+
+TTL_SECONDS = (NOTIFY_RETENTION_DAYS + (ARCHIVE_GRACE_DAYS if NOTIFY_ARCHIVE_DIR else 0)) * 86400
+
+
+def _append_archive(path: Path, docs: list):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Appending starts a new gzip member; gzip readers concatenate them
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, default=str) + "\n")
+
+
+async def archive_expired(run_date: str) -> int:
+    """Move notifications read more than NOTIFY_RETENTION_DAYS ago to the archive."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=NOTIFY_RETENTION_DAYS)
+    path = Path(NOTIFY_ARCHIVE_DIR) / f"notifications-{run_date}.jsonl.gz"
+    archived = 0
+    while True:
+        docs = await db.notifications.find(
+            {"read_at": {"$lt": cutoff}}, {"_id": 0},
+        ).sort("read_at", 1).to_list(ARCHIVE_BATCH_SIZE)
+        if not docs:
+            return archived
+        await asyncio.to_thread(_append_archive, path, docs)
+        await db.notifications.delete_many({"id": {"$in": [d["id"] for d in docs]}})
+        archived += len(docs)
+
+
+@jobs.handler("notification_retention")
+async def _retention_job(ctx: jobs.JobContext) -> dict:
+    # Notifications read before read_at existed start their retention now
+    result = await db.notifications.update_many(
+        {"read": True, "read_at": {"$exists": False}},
+        {"$set": {"read_at": datetime.now(timezone.utc)}},
+    )
+    archived = 0
+    if NOTIFY_ARCHIVE_DIR:
+        archived = await archive_expired(ctx.job["params"]["run_date"])
+        logger.info(f"Archived {archived} notifications to {NOTIFY_ARCHIVE_DIR}")
+    return {"read_at_backfilled": result.modified_count, "archived": archived}
+
+
+jobs.schedule_daily("notification_retention", NOTIFY_RETENTION_AT)
+
+
+async def volume_by_society() -> list:
+    """Notification counts per society, largest first."""
+    return await db.notifications.aggregate([
+        {"$group": {
+            "_id": "$society_id",
+            "total": {"$sum": 1},
+            "unread": {"$sum": {"$cond": ["$read", 0, 1]}},
+            "oldest": {"$min": "$created_at"},
+            "newest": {"$max": "$created_at"},
+        }},
+        {"$sort": {"total": -1}},
+        {"$lookup": {
+            "from": "societies", "localField": "_id", "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "name": 1}}], "as": "society",
+        }},
+        {"$project": {
+            "_id": 0, "society_id": "$_id",
+            "society_name": {"$ifNull": [{"$first": "$society.name"}, ""]},
+            "total": 1, "unread": 1, "read": {"$subtract": ["$total", "$unread"]},
+            "oldest": 1, "newest": 1,
+        }},
+    ]).to_list(None)
@@ -0,0 +1,172 @@
+"""In-process outbox for notifications.
+
+Request handlers call notify() and return without waiting on the write; a
+background writer drains the queue and inserts notifications with
+insert_many, flushing once NOTIFY_BATCH_SIZE are waiting or NOTIFY_FLUSH_MS
+after the first of a batch arrived. shutdown() writes whatever is still
+queued before the database client is closed.
+
+Notifications queued in a process that dies before a flush are lost. They
+only announce records that are already committed, so nothing else depends
+on them.
+"""
+from pymongo.errors import BulkWriteError, PyMongoError
+from database import db
+import pubsub
+import unread
+from datetime import datetime, timezone
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", "500"))
+NOTIFY_FLUSH_MS = int(os.environ.get("NOTIFY_FLUSH_MS", "200"))
+NOTIFY_WRITE_ATTEMPTS = 3
+
+_STOP = object()
+_queue = None
+_writer = None
+
+
+def notification(society_id: str, user_id: str, title: str, message: str,
+                 type: str, created_at: str = None) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "society_id": society_id,
+        "user_id": user_id,
+        "title": title,
+        "message": message,
+        "type": type,
+        "read": False,
+        "created_at": created_at or datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+    return _queue
+
+
+def start():
+    global _writer
+    if _writer is None or _writer.done():
+        _writer = asyncio.create_task(_run())
+
+
+def enqueue(*docs: dict):
+    """Queue notification documents for the background writer."""
+    queue = _get_queue()
+    for doc in docs:
+        queue.put_nowait(doc)
+    if docs:
+        start()
+
+
+def notify(society_id: str, user_id: str, title: str, message: str, type: str, created_at: str = None):
+    enqueue(notification(society_id, user_id, title, message, type, created_at))
+
+
+async def _inserted(docs: list):
+    try:
+        await unread.add_unread(docs)
+    except PyMongoError:
+        # The daily recount corrects the counters
+        logger.exception("Unread counter update failed")
+    pubsub.publish_notifications(docs)
+
+
+async def _write(batch: list):
+    pending = batch
+    for attempt in range(1, NOTIFY_WRITE_ATTEMPTS + 1):
+        try:
+            await db.notifications.insert_many(pending, ordered=False)
+            inserted, pending = pending, []
+        except BulkWriteError as e:
+            # insert_many set _id on every document, so rows that landed on an
+            # earlier attempt come back as duplicate key errors and are done
+            errors = {err["index"]: err.get("code") for err in e.details.get("writeErrors", [])}
+            inserted = [d for i, d in enumerate(pending) if i not in errors]
+            pending = [pending[i] for i, code in sorted(errors.items()) if code != 11000]
+            if pending:
+                logger.warning(f"Notification batch write failed for {len(pending)} rows (attempt {attempt})")
+        except PyMongoError as e:
+            inserted = []
+            logger.warning(f"Notification batch write failed (attempt {attempt}): {e}")
+        if inserted:
+            await _inserted(inserted)
+        if not pending:
+            return
+        await asyncio.sleep(0.5 * attempt)
+    logger.error(f"Dropped {len(pending)} notifications after {NOTIFY_WRITE_ATTEMPTS} attempts")
+
+
+async def _run():
+    queue = _get_queue()
+    loop = asyncio.get_running_loop()
+    batch = []
+    try:
+        while True:
+            doc = await queue.get()
+            if doc is _STOP:
+                return
+            batch = [doc]
+            deadline = loop.time() + NOTIFY_FLUSH_MS / 1000
+            stop = False
+            while len(batch) < NOTIFY_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    doc = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if doc is _STOP:
+                    stop = True
+                    break
+                batch.append(doc)
+            await _write(batch)
+            batch = []
+            if stop:
+                return
+    except asyncio.CancelledError:
+        # Hand the unwritten batch back so shutdown() can flush it
+        for doc in batch:
+            queue.put_nowait(doc)
+        raise
+
+
+async def flush():
+    """Write everything queued so far, in batches, from the caller's task."""
+    queue = _get_queue()
+    batch = []
+    while not queue.empty():
+        doc = queue.get_nowait()
+        if doc is _STOP:
+            continue
+        batch.append(doc)
+        if len(batch) >= NOTIFY_BATCH_SIZE:
+            await _write(batch)
+            batch = []
+    if batch:
+        await _write(batch)
+
+
+async def shutdown(timeout: float = 10):
+    """Stop the writer once it has written its current batch, then flush the rest."""
+    if _writer is not None and not _writer.done():
+        _get_queue().put_nowait(_STOP)
+        try:
+            await asyncio.wait_for(asyncio.shield(_writer), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Notification writer did not stop in time")
+            _writer.cancel()
+            try:
+                await _writer
+            except asyncio.CancelledError:
+                pass
+    await flush()
@@ -0,0 +1,39 @@
+import base64
+import json
+from fastapi import HTTPException, Response
+
+# Every keyset-paginated listing sorts newest first with id as tie-breaker
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["created_at"], doc["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, doc_id = json.loads(raw)
+        return str(created_at), str(doc_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(query: dict, cursor: str) -> dict:
+    """Restrict `query` to documents that sort after `cursor` in KEYSET_SORT order."""
+    created_at, doc_id = decode_cursor(cursor)
+    keyset = {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": doc_id}},
+    ]}
+    if "$or" in query:
+        return {"$and": [query, keyset]}
+    return {**query, **keyset}
+
+
+def set_next_cursor(response: Response, docs: list, limit: int):
+    """Expose the cursor for the following page when this page was full."""
+    if len(docs) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1])
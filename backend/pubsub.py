@@ -0,0 +1,112 @@
+"""In-process pub/sub feeding the notification event stream.
+
+Each open stream subscribes a bounded queue for its user. Events are
+("notification", doc) for a new notification and ("unread", {society_id,
+delta}) when the user's unread count changes; publishing never blocks. A
+subscriber that falls NOTIFY_STREAM_BUFFER events behind is closed, and
+its client reconnects and refetches.
+
+Publishes only reach streams served by the same process. With
+NOTIFY_CHANGE_STREAM=1 events come instead from a MongoDB change stream on
+the notifications collection (replica set required), so every worker sees
+writes made by the others; local publishes are then skipped so each event
+is delivered once.
+"""
+from database import db
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_STREAM_BUFFER = int(os.environ.get("NOTIFY_STREAM_BUFFER", "100"))
+NOTIFY_CHANGE_STREAM = os.environ.get("NOTIFY_CHANGE_STREAM", "").lower() in ("1", "true", "yes")
+
+_subscribers = {}
+
+
+def subscribe(user_id: str) -> asyncio.Queue:
+    queue = asyncio.Queue(maxsize=NOTIFY_STREAM_BUFFER)
+    _subscribers.setdefault(user_id, set()).add(queue)
+    return queue
+
+
+def unsubscribe(user_id: str, queue: asyncio.Queue):
+    queues = _subscribers.get(user_id)
+    if queues is not None:
+        queues.discard(queue)
+        if not queues:
+            del _subscribers[user_id]
+
+
+def _close(queue: asyncio.Queue):
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(None)
+
+
+def _deliver(user_id: str, event: tuple):
+    for queue in list(_subscribers.get(user_id, ())):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            unsubscribe(user_id, queue)
+            _close(queue)
+
+
+def _notification_events(doc: dict):
+    doc = {k: v for k, v in doc.items() if k != "_id"}
+    _deliver(doc["user_id"], ("notification", doc))
+    if not doc.get("read"):
+        _deliver(doc["user_id"], ("unread", {"society_id": doc["society_id"], "delta": 1}))
+
+
+def publish_notifications(docs: list):
+    """Announce notifications that have just been written."""
+    if NOTIFY_CHANGE_STREAM:
+        return
+    for doc in docs:
+        if doc["user_id"] in _subscribers:
+            _notification_events(doc)
+
+
+def publish_unread(user_id: str, society_id: str, delta: int):
+    """Announce a change in a user's unread count (society_id None: across societies)."""
+    if NOTIFY_CHANGE_STREAM or not delta:
+        return
+    _deliver(user_id, ("unread", {"society_id": society_id, "delta": delta}))
+
+
+async def watch_changes():
+    """Publish notification inserts and reads seen by a change stream, until cancelled."""
+    pipeline = [{"$match": {"$or": [
+        {"operationType": "insert"},
+        {"operationType": "update", "updateDescription.updatedFields.read": True},
+    ]}}]
+    resume_token = None
+    while True:
+        try:
+            async with db.notifications.watch(pipeline, full_document="updateLookup",
+                                              resume_after=resume_token) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    doc = change.get("fullDocument")
+                    if not doc or doc.get("user_id") not in _subscribers:
+                        continue
+                    if change["operationType"] == "insert":
+                        _notification_events(doc)
+                    else:
+                        _deliver(doc["user_id"], ("unread", {"society_id": doc["society_id"], "delta": -1}))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Notification change stream failed; reopening")
+            await asyncio.sleep(5)
+
+
+def close_all():
+    """End every open stream (shutdown)."""
+    for user_id in list(_subscribers):
+        for queue in list(_subscribers.get(user_id, ())):
+            unsubscribe(user_id, queue)
+            _close(queue)
@@ -0,0 +1,230 @@
+"""Bank statement reconciliation.
+
+Statement lines are matched against the books (maintenance payments for
+credits, other approved transactions for both directions) in two passes:
+
+1. exact: the line's reference equals a payment's transaction_reference,
+   looked up in a dict keyed on the normalised reference.
+2. fuzzy: remaining lines and records are bucketed by signed amount; a line
+   matches the unused record of the same amount closest in date, within
+   +/- window_days. A tie for closest makes the line ambiguous and nothing
+   is consumed.
+
+Each bucket's records are sorted by date once; the nearest unused record on
+either side of a line's date is found by bisection plus skip pointers over
+used records, so both passes are O(n log n) however many lines share an
+amount.
+"""
+from bisect import bisect_left
+from datetime import date, datetime
+import csv
+import io
+import json
+
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d-%b-%Y", "%d %b %Y", "%d/%m/%y", "%d-%m-%y"]
+
+COLUMN_ALIASES = {
+    "date": "date", "txn date": "date", "transaction date": "date", "value date": "date",
+    "amount": "amount",
+    "credit": "credit", "deposit": "credit", "deposits": "credit", "cr": "credit",
+    "debit": "debit", "withdrawal": "debit", "withdrawals": "debit", "dr": "debit",
+    "reference": "reference", "ref": "reference", "ref no": "reference", "utr": "reference",
+    "cheque no": "reference", "chq/ref no": "reference", "transaction_reference": "reference",
+    "description": "description", "narration": "description", "particulars": "description",
+}
+
+
+def normalise_reference(ref) -> str:
+    return "".join(str(ref or "").split()).upper()
+
+
+def parse_date(value) -> date:
+    value = str(value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    # ISO timestamps
+    return date.fromisoformat(value[:10])
+
+
+def _amount(value) -> float:
+    if value in (None, ""):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).replace(",", "").replace("₹", "").strip() or 0)
+
+
+def parse_statement(filename: str, content: bytes) -> tuple[list, list]:
+    """Statement lines from a CSV or JSON file, and the lines that could not
+    be read ({line_no, raw, reason}).
+
+    Credits are positive amounts and debits negative, whether the file has a
+    signed amount column or separate credit/debit columns. Raises ValueError
+    when the file as a whole cannot be read.
+    """
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        rows = json.loads(text)
+        if isinstance(rows, dict):
+            rows = rows.get("lines", [])
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    if not isinstance(rows, list):
+        raise ValueError("Statement must be a list of lines")
+
+    lines, invalid = [], []
+    for i, raw in enumerate(rows, start=1):
+        if not isinstance(raw, dict):
+            invalid.append({"line_no": i, "raw": str(raw)[:200], "reason": "not an object"})
+            continue
+        row = {COLUMN_ALIASES.get(str(k).strip().lower()): v for k, v in raw.items() if k}
+        try:
+            d = parse_date(row.get("date"))
+        except ValueError:
+            invalid.append({"line_no": i, "raw": _raw(raw), "reason": f"invalid date {row.get('date')!r}"})
+            continue
+        try:
+            if "amount" in row and row["amount"] not in (None, ""):
+                amount = _amount(row["amount"])
+            else:
+                amount = _amount(row.get("credit")) - _amount(row.get("debit"))
+        except ValueError:
+            invalid.append({"line_no": i, "raw": _raw(raw), "reason": "invalid amount"})
+            continue
+        if amount == 0:
+            continue
+        lines.append({
+            "line_no": i,
+            "date": d.isoformat(),
+            "amount": round(amount, 2),
+            "reference": str(row.get("reference") or "").strip(),
+            "description": str(row.get("description") or "").strip(),
+        })
+    return lines, invalid
+
+
+def _raw(row: dict) -> dict:
+    return {str(k): str(v)[:200] for k, v in row.items() if k}
+
+
+def _cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+def _find(skip: list, i: int) -> int:
+    # Follow skip pointers (with path halving) to the first unused slot
+    while skip[i] != i:
+        skip[i] = skip[skip[i]]
+        i = skip[i]
+    return i
+
+
+class _Bucket:
+    """Records of one amount sorted by date, with used ones skipped in O(α(n))."""
+
+    MAX_TIED = 10
+
+    def __init__(self, records: list):
+        self.records = sorted(records, key=lambda r: r["date"])
+        self.ordinals = [date.fromisoformat(r["date"]).toordinal() for r in self.records]
+        n = len(self.records)
+        self.next = list(range(n + 1))  # slot n: sentinel past the end
+        self.prev = list(range(n + 1))  # slot k stands for record k - 1; slot 0: sentinel
+
+    def use(self, i: int):
+        self.next[i] = i + 1
+        self.prev[i + 1] = i
+
+    def _after(self, i: int) -> int:
+        """Index of the first unused record at or after i (len when none)."""
+        return _find(self.next, i)
+
+    def _before(self, i: int) -> int:
+        """Index of the last unused record before i (-1 when none)."""
+        return _find(self.prev, i) - 1
+
+    def nearest(self, day: int, window_days: int) -> list:
+        """Indexes of the unused records closest to `day` within the window."""
+        p = bisect_left(self.ordinals, day)
+        n = len(self.records)
+        r, l = self._after(p), self._before(p)
+        right = self.ordinals[r] - day if r < n and self.ordinals[r] - day <= window_days else None
+        left = day - self.ordinals[l] if l >= 0 and day - self.ordinals[l] <= window_days else None
+        if right is None and left is None:
+            return []
+        distance = min(d for d in (left, right) if d is not None)
+        tied = []
+        i = r
+        while right == distance and i < n and self.ordinals[i] == day + distance and len(tied) < self.MAX_TIED:
+            tied.append(i)
+            i = self._after(i + 1)
+        i = l
+        while left == distance and i >= 0 and self.ordinals[i] == day - distance and len(tied) < self.MAX_TIED:
+            tied.append(i)
+            i = self._before(i)
+        return tied
+
+
+def match(lines: list, records: list, window_days: int = 3) -> dict:
+    """Match statement lines to book records.
+
+    records carry id, kind, date (YYYY-MM-DD), signed amount and reference.
+    Returns matched [(line, record, method)], ambiguous [(line, [records])],
+    unmatched_lines and unmatched_records.
+    """
+    used = set()
+    matched, ambiguous = [], []
+
+    # Pass 1: exact reference
+    by_ref = {}
+    for r in records:
+        ref = normalise_reference(r.get("reference"))
+        if ref:
+            by_ref.setdefault(ref, []).append(r)
+    remaining = []
+    for line in lines:
+        candidates = by_ref.get(normalise_reference(line["reference"]), []) if line["reference"] else []
+        candidates = [r for r in candidates if r["id"] not in used and (r["amount"] > 0) == (line["amount"] > 0)]
+        if len(candidates) == 1:
+            used.add(candidates[0]["id"])
+            matched.append((line, candidates[0], "reference"))
+        elif len(candidates) > 1:
+            ambiguous.append((line, candidates))
+        else:
+            remaining.append(line)
+
+    # Pass 2: same amount, closest date within the window
+    line_buckets, record_buckets = {}, {}
+    for line in remaining:
+        line_buckets.setdefault(_cents(line["amount"]), []).append(line)
+    for r in records:
+        if r["id"] not in used:
+            record_buckets.setdefault(_cents(r["amount"]), []).append(r)
+
+    unmatched_lines = []
+    for cents, bucket_lines in line_buckets.items():
+        bucket = _Bucket(record_buckets.get(cents, []))
+        for line in sorted(bucket_lines, key=lambda l: l["date"]):
+            day = date.fromisoformat(line["date"]).toordinal()
+            nearest = bucket.nearest(day, window_days)
+            if len(nearest) == 1:
+                record = bucket.records[nearest[0]]
+                bucket.use(nearest[0])
+                used.add(record["id"])
+                matched.append((line, record, "amount_date"))
+            elif nearest:
+                ambiguous.append((line, [bucket.records[i] for i in nearest]))
+            else:
+                unmatched_lines.append(line)
+
+    ambiguous_ids = {r["id"] for _, candidates in ambiguous for r in candidates}
+    unmatched_records = [r for r in records if r["id"] not in used and r["id"] not in ambiguous_ids]
+    return {
+        "matched": matched,
+        "ambiguous": ambiguous,
+        "unmatched_lines": sorted(unmatched_lines, key=lambda l: l["line_no"]),
+        "unmatched_records": unmatched_records,
+    }
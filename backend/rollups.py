@@ -0,0 +1,139 @@
+"""Monthly transaction rollups.
+
+txn_rollups holds one document per (society_id, year, month, type, category)
+with the summed amount and count of approved transactions. It is maintained
+with $inc whenever a transaction becomes approved, so reports read a few
+hundred small documents instead of the full transaction history.
+Transactions without a readable date are left out of the rollups.
+
+A one-off job rebuilds every society's rollups on first deploy.
+Backfill / repair:  python rollups.py [society_id ...]
+"""
+from pymongo import UpdateOne
+from database import db
+from txn_dates import date_fields
+from typing import Optional
+import asyncio
+import jobs
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def _period(txn: dict) -> Optional[tuple[int, int]]:
+    if "year" in txn and "month" in txn:
+        return txn["year"], txn["month"]
+    fields = date_fields(txn.get("date", ""), txn.get("created_at", ""))
+    return (fields["year"], fields["month"]) if fields else None
+
+
+def _rollup_op(society_id: str, year: int, month: int, type_: str, category: str, amount: float, count: int):
+    return UpdateOne(
+        {"society_id": society_id, "year": year, "month": month, "type": type_, "category": category},
+        {"$inc": {"amount": amount, "count": count}},
+        upsert=True,
+    )
+
+
+async def record_transactions(txns: list):
+    """Add approved transactions to their rollups (one bulk upsert per key)."""
+    totals = {}
+    for t in txns:
+        if t.get("approval_status", "approved") != "approved":
+            continue
+        period = _period(t)
+        if period is None:
+            logger.warning(f"Transaction {t.get('id')} has no readable date; left out of rollups")
+            continue
+        key = (t["society_id"], *period, t["type"], t["category"])
+        amount, count = totals.get(key, (0, 0))
+        totals[key] = (amount + t["amount"], count + 1)
+    if totals:
+        ops = [_rollup_op(*key, amount, count) for key, (amount, count) in totals.items()]
+        await db.txn_rollups.bulk_write(ops, ordered=False)
+
+
+async def record_transaction(txn: dict):
+    await record_transactions([txn])
+
+
+def _to_int(expr) -> dict:
+    return {"$convert": {"input": expr, "to": "int", "onError": None, "onNull": None}}
+
+
+async def rebuild(society_id: str) -> int:
+    """Recompute a society's rollups from its approved transactions.
+
+    Corrections are applied as $inc of the difference, so transactions
+    recorded while the rebuild runs are not lost.
+    """
+    pipeline = [
+        {"$match": {"society_id": society_id, "approval_status": "approved"}},
+        {"$project": {
+            "type": 1, "category": 1, "amount": 1,
+            "year": 1, "month": 1,
+            "period": {"$ifNull": ["$date", "$created_at"]},
+        }},
+        {"$group": {
+            "_id": {
+                "year": {"$ifNull": ["$year", _to_int({"$substrCP": ["$period", 0, 4]})]},
+                "month": {"$ifNull": ["$month", _to_int({"$substrCP": ["$period", 5, 2]})]},
+                "type": "$type",
+                "category": "$category",
+            },
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+    ]
+    actual = {}
+    async for row in db.transactions.aggregate(pipeline):
+        key = row["_id"]
+        if key["year"] is None or key["month"] is None or not 1 <= key["month"] <= 12:
+            logger.warning(f"{society_id}: {row['count']} transactions have no readable date; left out of rollups")
+            continue
+        actual[(key["year"], key["month"], key["type"], key["category"])] = (row["amount"], row["count"])
+    current = {
+        (r["year"], r["month"], r["type"], r["category"]): (r["amount"], r["count"])
+        async for r in db.txn_rollups.find({"society_id": society_id}, {"_id": 0})
+    }
+    ops = []
+    for key in actual.keys() | current.keys():
+        amount, count = actual.get(key, (0, 0))
+        have_amount, have_count = current.get(key, (0, 0))
+        delta_amount, delta_count = round(amount - have_amount, 2), count - have_count
+        if delta_amount or delta_count:
+            ops.append(_rollup_op(society_id, *key, delta_amount, delta_count))
+    for i in range(0, len(ops), 1000):
+        await db.txn_rollups.bulk_write(ops[i:i + 1000], ordered=False)
+    await db.txn_rollups.delete_many({"society_id": society_id, "count": 0})
+    return len(ops)
+
+
+@jobs.handler("rollup_rebuild")
+async def _rebuild_job(ctx: jobs.JobContext) -> dict:
+    done = set(ctx.state.get("done", []))
+    corrected = 0
+    for sid in await db.transactions.distinct("society_id"):
+        if sid in done:
+            continue
+        await ctx.renew()
+        corrected += await rebuild(sid)
+        done.add(sid)
+        await ctx.checkpoint({"done": sorted(done)}, {"societies": len(done)})
+    return {"societies": len(done), "corrected": corrected}
+
+
+jobs.schedule_once("rollup_rebuild", "seed")
+
+
+async def _main(society_ids: list):
+    if not society_ids:
+        society_ids = await db.transactions.distinct("society_id")
+    for sid in society_ids:
+        count = await rebuild(sid)
+        print(f"{sid}: {count} rollups corrected")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -1,49 +1,66 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from database import db
 from auth_utils import get_current_user
+from access import require_access
+from pagination import KEYSET_SORT, after_cursor, set_next_cursor
 from models import ApprovalResponse, ApprovalAction
-import uuid
+from rollups import record_transaction
+from outbox import notify
+from pymongo import ReturnDocument
 from datetime import datetime, timezone
 
 router = APIRouter(prefix="/api/societies/{society_id}/approvals", tags=["Approvals"])
 
 
-async def _verify(user_id, society_id, roles=None):
-    q = {"user_id": user_id, "society_id": society_id, "status": "active"}
-    m = await db.memberships.find_one(q, {"_id": 0})
-    if not m:
-        raise HTTPException(status_code=403, detail="Not a member")
-    if roles and m["role"] not in roles:
-        raise HTTPException(status_code=403, detail="Insufficient permissions")
-    return m
+def _user_name_lookup(local_field: str, as_field: str) -> dict:
+    return {"$lookup": {
+        "from": "users", "localField": local_field, "foreignField": "id",
+        "pipeline": [{"$project": {"_id": 0, "name": 1}}], "as": as_field,
+    }}
 
 
 @router.get("/", response_model=list[ApprovalResponse])
 async def list_approvals(society_id: str, status: str = None,
-                         current_user: dict = Depends(get_current_user)):
-    await _verify(current_user["sub"], society_id)
+                         limit: int = Query(100, ge=1, le=200),
+                         cursor: str = None, response: Response = None,
+                         current_user: dict = Depends(get_current_user),
+                         access: dict = Depends(require_access())):
     query = {"society_id": society_id}
     if status:
         query["status"] = status
-    approvals = await db.approvals.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+    if cursor:
+        query = after_cursor(query, cursor)
+
+    # One round trip: the page of approvals joined with transaction and user names
+    pipeline = [
+        {"$match": query},
+        {"$sort": dict(KEYSET_SORT)},
+        {"$limit": limit},
+        {"$lookup": {
+            "from": "transactions", "localField": "transaction_id", "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0}}], "as": "transaction",
+        }},
+        _user_name_lookup("requested_by", "requester"),
+        _user_name_lookup("approved_by", "approver"),
+        {"$project": {"_id": 0}},
+    ]
+    approvals = await db.approvals.aggregate(pipeline).to_list(limit)
+    set_next_cursor(response, approvals, limit)
 
     result = []
     for a in approvals:
-        txn = await db.transactions.find_one({"id": a["transaction_id"]}, {"_id": 0})
-        requester = await db.users.find_one({"id": a["requested_by"]}, {"_id": 0})
-        approver_name = ""
-        if a.get("approved_by"):
-            approver = await db.users.find_one({"id": a["approved_by"]}, {"_id": 0})
-            approver_name = approver["name"] if approver else ""
+        txn = a["transaction"][0] if a["transaction"] else {}
+        requester = a["requester"][0]["name"] if a["requester"] else ""
+        approver = a["approver"][0]["name"] if a["approver"] else ""
         result.append(ApprovalResponse(
             id=a["id"],
             transaction_id=a["transaction_id"],
-            transaction=txn or {},
+            transaction=txn,
             requested_by=a["requested_by"],
-            requested_by_name=requester["name"] if requester else "",
+            requested_by_name=requester,
             status=a["status"],
             approved_by=a.get("approved_by", ""),
-            approved_by_name=approver_name,
+            approved_by_name=approver,
             comments=a.get("comments", ""),
             created_at=a["created_at"],
         ))
@@ -52,9 +69,8 @@ async def list_approvals(society_id: str, status: str = None,
 
 @router.post("/{approval_id}/approve")
 async def approve_expense(society_id: str, approval_id: str, data: ApprovalAction,
-                          current_user: dict = Depends(get_current_user)):
-    await _verify(current_user["sub"], society_id, ["committee", "manager"])
-
+                          current_user: dict = Depends(get_current_user),
+                          access: dict = Depends(require_access("committee", "manager"))):
     appr = await db.approvals.find_one({"id": approval_id, "society_id": society_id}, {"_id": 0})
     if not appr:
         raise HTTPException(status_code=404, detail="Approval not found")
@@ -66,31 +82,26 @@ async def approve_expense(society_id: str, approval_id: str, data: ApprovalActio
         {"id": approval_id},
         {"$set": {"status": "approved", "approved_by": current_user["sub"], "comments": data.comments}},
     )
-    await db.transactions.update_one(
-        {"id": appr["transaction_id"]},
+    txn = await db.transactions.find_one_and_update(
+        {"id": appr["transaction_id"], "approval_status": {"$ne": "approved"}},
         {"$set": {"approval_status": "approved"}},
+        {"_id": 0},
+        return_document=ReturnDocument.AFTER,
     )
+    if txn:
+        await record_transaction(txn)
 
     # Notify requester
-    await db.notifications.insert_one({
-        "id": str(uuid.uuid4()),
-        "society_id": society_id,
-        "user_id": appr["requested_by"],
-        "title": "Expense Approved",
-        "message": f"Your expense request has been approved by committee",
-        "type": "approval",
-        "read": False,
-        "created_at": now,
-    })
+    notify(society_id, appr["requested_by"], "Expense Approved",
+           "Your expense request has been approved by committee", "approval", now)
 
     return {"status": "approved"}
 
 
 @router.post("/{approval_id}/reject")
 async def reject_expense(society_id: str, approval_id: str, data: ApprovalAction,
-                         current_user: dict = Depends(get_current_user)):
-    await _verify(current_user["sub"], society_id, ["committee", "manager"])
-
+                         current_user: dict = Depends(get_current_user),
+                         access: dict = Depends(require_access("committee", "manager"))):
     appr = await db.approvals.find_one({"id": approval_id, "society_id": society_id}, {"_id": 0})
     if not appr:
         raise HTTPException(status_code=404, detail="Approval not found")
@@ -106,15 +117,7 @@ async def reject_expense(society_id: str, approval_id: str, data: ApprovalAction
         {"$set": {"approval_status": "rejected"}},
     )
 
-    await db.notifications.insert_one({
-        "id": str(uuid.uuid4()),
-        "society_id": society_id,
-        "user_id": appr["requested_by"],
-        "title": "Expense Rejected",
-        "message": f"Your expense request was rejected. Reason: {data.comments or 'No reason given'}",
-        "type": "approval",
-        "read": False,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-    })
+    notify(society_id, appr["requested_by"], "Expense Rejected",
+           f"Your expense request was rejected. Reason: {data.comments or 'No reason given'}", "approval")
 
     return {"status": "rejected"}
@@ -1,6 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends
 from database import db
-from auth_utils import hash_password, verify_password, create_token, get_current_user
+from fastapi.security import HTTPAuthorizationCredentials
+from auth_utils import (
+    hash_password_async, verify_password_async, create_token, get_current_user,
+    revoke_token, security,
+)
 from models import UserCreate, UserLogin, UserResponse, TokenResponse
 import uuid
 from datetime import datetime, timezone
@@ -20,7 +24,7 @@ async def register(data: UserCreate):
         "name": data.name,
         "email": data.email,
         "phone": data.phone,
-        "password_hash": hash_password(data.password),
+        "password_hash": await hash_password_async(data.password),
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
     await db.users.insert_one(user_doc)
@@ -35,7 +39,7 @@ async def register(data: UserCreate):
 @router.post("/login", response_model=TokenResponse)
 async def login(data: UserLogin):
     user = await db.users.find_one({"email": data.email}, {"_id": 0})
-    if not user or not verify_password(data.password, user["password_hash"]):
+    if not user or not await verify_password_async(data.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     token = create_token({"sub": user["id"], "email": user["email"], "name": user["name"]})
@@ -61,3 +65,10 @@ async def get_me(current_user: dict = Depends(get_current_user)):
         email=user["email"],
         phone=user.get("phone", ""),
     )
+
+
+@router.post("/logout")
+async def logout(cred: HTTPAuthorizationCredentials = Depends(security),
+                 current_user: dict = Depends(get_current_user)):
+    await revoke_token(cred.credentials)
+    return {"status": "logged_out"}
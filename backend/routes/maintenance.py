@@ -1,12 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query, Response
 from fastapi.responses import StreamingResponse
 from database import db
 from auth_utils import get_current_user
+from access import require_access
+from counters import allocate_receipt_numbers, financial_year
+import jobs
+import outbox
+import pubsub
+import unread
+from loaders import USER_PROJECTION, UserLoader, get_user_loader
+from pagination import KEYSET_SORT, after_cursor, set_next_cursor
+from outbox import notification, notify
+from rollups import record_transaction, record_transactions
+from txn_dates import date_fields
+from bill_status import effective_bill, effective_fields, late_fee_for, status_filter
 from models import (
     MaintenanceSettingsCreate, MaintenanceSettingsResponse,
     DiscountSchemeCreate, DiscountSchemeResponse,
     GenerateBillsRequest, MaintenanceBillResponse, BillPreviewResponse,
-    RecordPaymentRequest, PaymentResponse, ReceiptResponse,
+    RecordPaymentRequest, ImportPaymentRow, PaymentResponse, ReceiptResponse,
     LedgerEntryResponse, LedgerSummaryResponse,
     AnnualPaymentPreviewRequest, AnnualPaymentPreviewResponse,
     CollectionDashboardResponse,
@@ -14,26 +26,45 @@ from models import (
 import uuid
 from datetime import datetime, timezone, timedelta
 from typing import Optional
+from pydantic import ValidationError
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import asyncio
 import io
+import os
+import logging
+import csv
+import json
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/societies/{society_id}/maintenance", tags=["Maintenance"])
 
+# Max documents per insert_many call in bulk write paths
+BULK_CHUNK_SIZE = 500
+BILL_JOB_CHUNK_SIZE = 200
+PAYMENT_ALLOCATION_ATTEMPTS = 5
+ACCOUNT_RESYNC_ATTEMPTS = 5
+MAX_IMPORT_ROWS = 5000
+OPEN_BILL_STATUSES = ["pending", "partial", "overdue"]
+# Nightly overdue report, HH:MM UTC (00:30 IST)
+OVERDUE_REPORT_AT = os.environ.get("OVERDUE_REPORT_AT", "19:00")
+
+# Statement column names accepted as aliases for ImportPaymentRow fields
+IMPORT_COLUMN_ALIASES = {
+    "flat": "flat_number",
+    "amount": "amount_paid",
+    "date": "payment_date",
+    "mode": "payment_mode",
+    "reference": "transaction_reference",
+    "utr": "transaction_reference",
+}
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # HELPERS
 # ═══════════════════════════════════════════════════════════════════════════════
 
-async def _verify(user_id: str, society_id: str, roles: list = None):
-    """Verify user membership and optionally check role."""
-    q = {"user_id": user_id, "society_id": society_id, "status": "active"}
-    m = await db.memberships.find_one(q, {"_id": 0})
-    if not m:
-        raise HTTPException(status_code=403, detail="Not a member of this society")
-    if roles and m["role"] not in roles:
-        raise HTTPException(status_code=403, detail="Insufficient permissions")
-    return m
-
-
 async def _get_or_create_settings(society_id: str) -> dict:
     """Get society maintenance settings, create default if not exists."""
     settings = await db.maintenance_settings.find_one({"society_id": society_id}, {"_id": 0})
@@ -59,11 +90,29 @@ async def _get_primary_member(flat_id: str, society_id: str) -> dict:
         {"flat_id": flat_id, "society_id": society_id, "is_primary": True}, {"_id": 0}
     )
     if fm:
-        user = await db.users.find_one({"id": fm["user_id"]}, {"_id": 0})
+        user = await db.users.find_one({"id": fm["user_id"]}, USER_PROJECTION)
         return {"user_id": fm["user_id"], "user_name": user["name"] if user else ""}
     return {"user_id": "", "user_name": ""}
 
 
+async def _get_primary_members(society_id: str, flat_ids: list = None) -> dict:
+    """Get primary members for many flats at once, keyed by flat_id."""
+    query = {"society_id": society_id, "is_primary": True}
+    if flat_ids is not None:
+        query["flat_id"] = {"$in": flat_ids}
+    fms = await db.flat_members.find(query, {"_id": 0, "flat_id": 1, "user_id": 1}).to_list(None)
+    user_ids = list({fm["user_id"] for fm in fms})
+    users = await db.users.find(
+        {"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "name": 1}
+    ).to_list(None) if user_ids else []
+    names = {u["id"]: u["name"] for u in users}
+
+    result = {}
+    for fm in fms:
+        result.setdefault(fm["flat_id"], {"user_id": fm["user_id"], "user_name": names.get(fm["user_id"], "")})
+    return result
+
+
 async def _calculate_bill_amount(area_sqft: float, rate_per_sqft: float, months: int = 1) -> float:
     """Calculate maintenance amount based on area."""
     return round(area_sqft * rate_per_sqft * months, 2)
@@ -89,26 +138,126 @@ async def _apply_discount(total_amount: float, scheme: dict) -> tuple[float, flo
     return discount, final
 
 
+async def _insert_chunked(collection, docs: list):
+    """Insert documents in bounded insert_many batches."""
+    for i in range(0, len(docs), BULK_CHUNK_SIZE):
+        await collection.insert_many(docs[i:i + BULK_CHUNK_SIZE], ordered=False)
+
+
+async def _insert_missing(collection, docs: list) -> list:
+    """Insert documents, skipping those whose id is already stored (the id
+    index is unique); returns the documents this call inserted."""
+    inserted = []
+    for i in range(0, len(docs), BULK_CHUNK_SIZE):
+        chunk = docs[i:i + BULK_CHUNK_SIZE]
+        try:
+            await collection.insert_many(chunk, ordered=False)
+            inserted += chunk
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            failed = {err["index"] for err in errors}
+            inserted += [d for j, d in enumerate(chunk) if j not in failed]
+    return inserted
+
+
+async def _resync_accounts(society_id: str, flat_ids: list):
+    """Bring member_accounts balance/seq back to what the ledger holds.
+
+    The correction is an $inc of the difference, fenced on the seq that was
+    read; an account another posting moved in between is read again, so
+    concurrent postings are never overwritten.
+    """
+    for _ in range(ACCOUNT_RESYNC_ATTEMPTS):
+        flat_ids = await _resync_once(society_id, flat_ids)
+        if not flat_ids:
+            return
+    logger.warning(f"Could not resync member accounts for {len(flat_ids)} flats in {society_id}")
+
+
+async def _resync_once(society_id: str, flat_ids: list) -> list:
+    accounts = {
+        a["flat_id"]: a for a in await db.member_accounts.find(
+            {"society_id": society_id, "flat_id": {"$in": flat_ids}}, {"_id": 0, "flat_id": 1, "balance": 1, "seq": 1},
+        ).to_list(None)
+    }
+    pipeline = [
+        {"$match": {"society_id": society_id, "flat_id": {"$in": flat_ids}}},
+        {"$group": {
+            "_id": "$flat_id",
+            "balance": {"$sum": {"$subtract": ["$debit_amount", "$credit_amount"]}},
+            "count": {"$sum": 1},
+            "max_seq": {"$max": "$seq"},
+        }},
+    ]
+    rows = {r["_id"]: r for r in await db.member_ledger.aggregate(pipeline).to_list(None)}
+    missing = [fid for fid in flat_ids if fid not in accounts]
+    if missing:
+        await _init_accounts(society_id, missing)
+    moved = []
+    for flat_id, account in accounts.items():
+        row = rows.get(flat_id, {})
+        balance = round(row.get("balance", 0) - account.get("balance", 0), 2)
+        seq = max(row.get("count", 0), row.get("max_seq") or 0) - account.get("seq", 0)
+        if not balance and not seq:
+            continue
+        result = await db.member_accounts.update_one(
+            {"society_id": society_id, "flat_id": flat_id, "seq": account.get("seq", 0)},
+            {"$inc": {"balance": balance, "seq": seq}},
+        )
+        if not result.modified_count:
+            moved.append(flat_id)
+    return moved
+
+
+async def _init_accounts(society_id: str, flat_ids: list):
+    """Create missing member_accounts docs, seeded from existing ledger entries."""
+    pipeline = [
+        {"$match": {"society_id": society_id, "flat_id": {"$in": flat_ids}}},
+        {"$sort": {"entry_date": -1, "seq": -1}},
+        {"$group": {
+            "_id": "$flat_id",
+            "balance": {"$first": "$balance_after_entry"},
+            "count": {"$sum": 1},
+            "max_seq": {"$max": "$seq"},
+        }},
+    ]
+    rows = {r["_id"]: r for r in await db.member_ledger.aggregate(pipeline).to_list(None)}
+    ops = []
+    for flat_id in flat_ids:
+        row = rows.get(flat_id, {})
+        ops.append(UpdateOne(
+            {"society_id": society_id, "flat_id": flat_id},
+            {"$setOnInsert": {
+                "society_id": society_id,
+                "flat_id": flat_id,
+                "balance": row.get("balance", 0),
+                "seq": max(row.get("count", 0), row.get("max_seq") or 0),
+            }},
+            upsert=True,
+        ))
+    if ops:
+        await db.member_accounts.bulk_write(ops, ordered=False)
+
+
 async def _create_ledger_entry(
     society_id: str, flat_id: str, user_id: str,
     entry_type: str, reference_id: str, reference_type: str,
     debit: float = 0, credit: float = 0, notes: str = ""
 ):
-    """Create a ledger entry and calculate running balance."""
-    # Get current balance
-    last_entry = await db.member_ledger.find_one(
-        {"society_id": society_id, "flat_id": flat_id},
-        {"_id": 0}
+    """Create a ledger entry, updating the flat's running balance atomically."""
+    update = {"$inc": {"balance": round(debit - credit, 2), "seq": 1}}
+    account = await db.member_accounts.find_one_and_update(
+        {"society_id": society_id, "flat_id": flat_id}, update,
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER,
     )
-    if last_entry:
-        entries = await db.member_ledger.find(
-            {"society_id": society_id, "flat_id": flat_id}, {"_id": 0}
-        ).sort("entry_date", -1).to_list(1)
-        current_balance = entries[0]["balance_after_entry"] if entries else 0
-    else:
-        current_balance = 0
-    
-    new_balance = round(current_balance + debit - credit, 2)
+    if account is None:
+        await _init_accounts(society_id, [flat_id])
+        account = await db.member_accounts.find_one_and_update(
+            {"society_id": society_id, "flat_id": flat_id}, update,
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
     
     entry = {
         "id": str(uuid.uuid4()),
@@ -121,18 +270,122 @@ async def _create_ledger_entry(
         "reference_type": reference_type,
         "debit_amount": debit,
         "credit_amount": credit,
-        "balance_after_entry": new_balance,
+        "balance_after_entry": round(account["balance"], 2),
+        "seq": account["seq"],
         "notes": notes,
     }
     await db.member_ledger.insert_one(entry)
     return entry
 
 
-async def _generate_receipt_number(society_id: str) -> str:
-    """Generate unique receipt number."""
-    count = await db.maintenance_payments.count_documents({"society_id": society_id})
-    year = datetime.now(timezone.utc).year
-    return f"RCP-{year}-{count + 1:05d}"
+async def _post_ledger_entries(society_id: str, entries: list):
+    """Post many ledger entries, updating each flat's account once.
+
+    Entries are built without balance_after_entry/seq, in posting order. Each
+    flat's net change is applied with one find_one_and_update $inc, so the
+    account it returns is the state right after this flat's block of
+    postings, even when other ledger writes for the flat run concurrently.
+    """
+    if not entries:
+        return
+    deltas = {}
+    for e in entries:
+        d = deltas.setdefault(e["flat_id"], [0, 0])
+        d[0] = round(d[0] + e["debit_amount"] - e["credit_amount"], 2)
+        d[1] += 1
+    flat_ids = list(deltas)
+    
+    existing = await db.member_accounts.find(
+        {"society_id": society_id, "flat_id": {"$in": flat_ids}}, {"_id": 0, "flat_id": 1}
+    ).to_list(None)
+    missing = set(flat_ids) - {a["flat_id"] for a in existing}
+    if missing:
+        await _init_accounts(society_id, list(missing))
+    
+    def reserve(fid):
+        d = deltas[fid]
+        return db.member_accounts.find_one_and_update(
+            {"society_id": society_id, "flat_id": fid}, {"$inc": {"balance": d[0], "seq": d[1]}},
+            projection={"_id": 0, "flat_id": 1, "balance": 1, "seq": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+    accounts = []
+    for i in range(0, len(flat_ids), BULK_CHUNK_SIZE):
+        accounts += await asyncio.gather(*(reserve(fid) for fid in flat_ids[i:i + BULK_CHUNK_SIZE]))
+    
+    # Walk each flat's postings backwards from its post-update state
+    state = {a["flat_id"]: [a["balance"], a["seq"]] for a in accounts}
+    for e in reversed(entries):
+        st = state[e["flat_id"]]
+        e["balance_after_entry"] = round(st[0], 2)
+        e["seq"] = st[1]
+        st[0] -= e["debit_amount"] - e["credit_amount"]
+        st[1] -= 1
+    inserted = await _insert_missing(db.member_ledger, entries)
+    if len(inserted) < len(entries):
+        # Some entries (stable ids) were already posted, so the $inc above
+        # counted them twice; recompute these accounts from the ledger
+        await _resync_accounts(society_id, list({e["flat_id"] for e in entries}))
+
+
+async def _allocate_payment(society_id: str, payment_id: str, bill_ids: list, amount: float) -> dict:
+    """Apply a payment across bills in the given order; returns {bill_id: amount}.
+
+    Bills are read with one $in query and written with one bulk_write of $inc
+    updates, each conditional on the paid_amount that was read. A bill changed
+    by a concurrent payment fails its condition and is re-read and allocated
+    again. payment_ids on the bill marks which updates already landed.
+    """
+    applied = {}
+    remaining = amount
+    for _ in range(PAYMENT_ALLOCATION_ATTEMPTS):
+        pending_ids = [b for b in bill_ids if b not in applied]
+        if remaining <= 0 or not pending_ids:
+            break
+        bills = await db.maintenance_bills_v2.find(
+            {"society_id": society_id, "id": {"$in": pending_ids}},
+            {"_id": 0, "id": 1, "final_payable_amount": 1, "paid_amount": 1, "payment_ids": 1},
+        ).to_list(None)
+        by_id = {b["id"]: b for b in bills}
+        
+        plan = {}
+        ops = []
+        budget = remaining
+        for bill_id in pending_ids:
+            bill = by_id.get(bill_id)
+            if budget <= 0 or not bill or payment_id in bill.get("payment_ids", []):
+                continue
+            paid = bill.get("paid_amount", 0)
+            pay_now = round(min(budget, bill["final_payable_amount"] - paid), 2)
+            if pay_now <= 0:
+                continue
+            plan[bill_id] = pay_now
+            budget -= pay_now
+            ops.append(UpdateOne(
+                {"id": bill_id, "paid_amount": paid if paid else {"$in": [0, None]},
+                 "payment_ids": {"$ne": payment_id}},
+                {"$inc": {"paid_amount": pay_now},
+                 "$set": {"status": "paid" if paid + pay_now >= bill["final_payable_amount"] else "partial"},
+                 "$push": {"payment_ids": payment_id}},
+            ))
+        if not ops:
+            break
+        
+        result = await db.maintenance_bills_v2.bulk_write(ops, ordered=False)
+        if result.modified_count == len(ops):
+            landed = plan
+        else:
+            landed = {
+                b["id"]: plan[b["id"]]
+                for b in await db.maintenance_bills_v2.find(
+                    {"id": {"$in": list(plan)}, "payment_ids": payment_id}, {"_id": 0, "id": 1}
+                ).to_list(None)
+            }
+        applied.update(landed)
+        remaining = round(remaining - sum(landed.values()), 2)
+        if len(landed) == len(plan):
+            break
+    return applied
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -140,9 +393,9 @@ async def _generate_receipt_number(society_id: str) -> str:
 # ═══════════════════════════════════════════════════════════════════════════════
 
 @router.get("/settings", response_model=MaintenanceSettingsResponse)
-async def get_maintenance_settings(society_id: str, current_user: dict = Depends(get_current_user)):
+async def get_maintenance_settings(society_id: str, current_user: dict = Depends(get_current_user),
+                                   access: dict = Depends(require_access())):
     """Get society maintenance settings."""
-    await _verify(current_user["sub"], society_id)
     settings = await _get_or_create_settings(society_id)
     return MaintenanceSettingsResponse(**settings)
 
@@ -150,11 +403,10 @@ async def get_maintenance_settings(society_id: str, current_user: dict = Depends
 @router.put("/settings", response_model=MaintenanceSettingsResponse)
 async def update_maintenance_settings(
     society_id: str, data: MaintenanceSettingsCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
     """Update society maintenance settings (Manager only)."""
-    await _verify(current_user["sub"], society_id, ["manager"])
-    
     settings = await _get_or_create_settings(society_id)
     
     update_data = {
@@ -180,9 +432,9 @@ async def update_maintenance_settings(
 # ═══════════════════════════════════════════════════════════════════════════════
 
 @router.get("/discount-schemes", response_model=list[DiscountSchemeResponse])
-async def list_discount_schemes(society_id: str, current_user: dict = Depends(get_current_user)):
+async def list_discount_schemes(society_id: str, current_user: dict = Depends(get_current_user),
+                                access: dict = Depends(require_access())):
     """List all discount schemes for a society."""
-    await _verify(current_user["sub"], society_id)
     schemes = await db.discount_schemes.find({"society_id": society_id}, {"_id": 0}).to_list(100)
     return [DiscountSchemeResponse(**s) for s in schemes]
 
@@ -190,11 +442,10 @@ async def list_discount_schemes(society_id: str, current_user: dict = Depends(ge
 @router.post("/discount-schemes", response_model=DiscountSchemeResponse)
 async def create_discount_scheme(
     society_id: str, data: DiscountSchemeCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
     """Create a new discount scheme (Manager only)."""
-    await _verify(current_user["sub"], society_id, ["manager"])
-    
     scheme = {
         "id": str(uuid.uuid4()),
         "society_id": society_id,
@@ -213,11 +464,10 @@ async def create_discount_scheme(
 @router.put("/discount-schemes/{scheme_id}", response_model=DiscountSchemeResponse)
 async def update_discount_scheme(
     society_id: str, scheme_id: str, data: DiscountSchemeCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
     """Update a discount scheme (Manager only)."""
-    await _verify(current_user["sub"], society_id, ["manager"])
-    
     scheme = await db.discount_schemes.find_one({"id": scheme_id, "society_id": society_id}, {"_id": 0})
     if not scheme:
         raise HTTPException(status_code=404, detail="Discount scheme not found")
@@ -239,11 +489,10 @@ async def update_discount_scheme(
 @router.delete("/discount-schemes/{scheme_id}")
 async def delete_discount_scheme(
     society_id: str, scheme_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
     """Delete a discount scheme (Manager only)."""
-    await _verify(current_user["sub"], society_id, ["manager"])
-    
     result = await db.discount_schemes.delete_one({"id": scheme_id, "society_id": society_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Discount scheme not found")
@@ -258,11 +507,10 @@ async def delete_discount_scheme(
 @router.post("/bills/preview", response_model=BillPreviewResponse)
 async def preview_bills(
     society_id: str, data: GenerateBillsRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
     """Preview bills before generation (Manager only)."""
-    await _verify(current_user["sub"], society_id, ["manager"])
-    
     settings = await _get_or_create_settings(society_id)
     flats = await db.flats.find({"society_id": society_id}, {"_id": 0}).to_list(1000)
     
@@ -280,6 +528,7 @@ async def preview_bills(
     total_before_discount = 0
     total_discount = 0
     bills_preview = []
+    primaries = await _get_primary_members(society_id)
     
     for flat in flats:
         area = flat.get("area_sqft", 0)
@@ -289,7 +538,7 @@ async def preview_bills(
         total_before_discount += amount
         total_discount += discount
         
-        primary = await _get_primary_member(flat["id"], society_id)
+        primary = primaries.get(flat["id"], {"user_id": "", "user_name": ""})
         
         bills_preview.append({
             "flat_id": flat["id"],
@@ -314,31 +563,88 @@ async def preview_bills(
     )
 
 
-@router.post("/bills/generate")
+def _bill_period(data: GenerateBillsRequest) -> tuple[str, str]:
+    """(key, label) for a billing period, e.g. ("2026-06", "6/2026") or ("2026", "2026")."""
+    if data.bill_period_type == "monthly":
+        return f"{data.year}-{data.month:02d}", f"{data.month}/{data.year}"
+    return str(data.year), str(data.year)
+
+
+def _stable_id(*parts: str) -> str:
+    """Deterministic id, so a resumed job writes the same documents again."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, ":".join(parts)))
+
+
+@router.post("/bills/generate", status_code=202)
 async def generate_bills(
     society_id: str, data: GenerateBillsRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
-    """Generate maintenance bills for all flats (Manager only)."""
-    await _verify(current_user["sub"], society_id, ["manager"])
+    """Queue bill generation for all flats (Manager only).
     
+    Returns the job; poll GET /maintenance/jobs/{job_id} for progress.
+    """
+    job = await _submit_bill_job(society_id, data, current_user["sub"])
+    return {"job_id": job["id"], **jobs.public_view(job)}
+
+
+async def _submit_bill_job(society_id: str, data: GenerateBillsRequest, created_by: str, claim: bool = False) -> dict:
     # Validate request
     if data.bill_period_type == "monthly" and data.month is None:
         raise HTTPException(status_code=400, detail="Month is required for monthly bills")
+    period_key, period = _bill_period(data)
     
     # Check for duplicate bills
     query = {"society_id": society_id, "year": data.year, "bill_period_type": data.bill_period_type}
     if data.bill_period_type == "monthly":
         query["month"] = data.month
-    
-    existing = await db.maintenance_bills_v2.find_one(query, {"_id": 0})
+    existing = await db.maintenance_bills_v2.find_one(query, {"_id": 0, "id": 1})
     if existing:
-        period = f"{data.month}/{data.year}" if data.bill_period_type == "monthly" else str(data.year)
         raise HTTPException(status_code=400, detail=f"Bills already generated for {period}")
     
+    # Rate and due date are fixed when the job is queued, so a resumed run bills the same amounts
     settings = await _get_or_create_settings(society_id)
-    society = await db.societies.find_one({"id": society_id}, {"_id": 0})
-    flats = await db.flats.find({"society_id": society_id}, {"_id": 0}).to_list(1000)
+    due_day = settings["due_date_day"]
+    if data.bill_period_type == "monthly":
+        due_date = datetime(data.year, data.month, min(due_day, 28))
+    else:
+        due_date = datetime(data.year, 12, 31)
+    params = {
+        **data.model_dump(),
+        "rate_per_sqft": settings["default_rate_per_sqft"],
+        "due_date": due_date.strftime("%Y-%m-%d"),
+    }
+    total_flats = await db.flats.count_documents({"society_id": society_id})
+    try:
+        return await jobs.submit(
+            "generate_bills", society_id, params, created_by,
+            active_key=f"generate_bills:{society_id}:{period_key}",
+            progress={"total_flats": total_flats, "processed_flats": 0, "bills_created": 0, "total_amount": 0},
+            claim=claim,
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=f"Bill generation for {period} is already in progress")
+
+
+@jobs.handler("generate_bills")
+async def _generate_bills_job(ctx: jobs.JobContext) -> dict:
+    """Bill flats in id order, BILL_JOB_CHUNK_SIZE at a time, checkpointing after each chunk.
+    
+    Bills, ledger entries and notifications get ids derived from the period
+    and flat. The chunk that was in flight when an earlier attempt died is
+    redone by writing only the documents that are missing, after resetting
+    its flats' accounts from the ledger.
+    """
+    job = ctx.job
+    society_id = job["society_id"]
+    params = job["params"]
+    data = GenerateBillsRequest(**{k: v for k, v in params.items() if k in GenerateBillsRequest.model_fields})
+    period_key, _ = _bill_period(data)
+    period = f"{data.month}/{data.year}" if data.bill_period_type == "monthly" else f"Year {data.year}"
+    rate = params["rate_per_sqft"]
+    due_date = datetime.strptime(params["due_date"], "%Y-%m-%d")
+    months = 12 if data.bill_period_type == "yearly" else 1
     
     # Get discount scheme
     scheme = None
@@ -347,94 +653,159 @@ async def generate_bills(
             {"id": data.discount_scheme_id, "society_id": society_id, "is_active": True}, {"_id": 0}
         )
     
-    now = datetime.now(timezone.utc)
-    rate = settings["default_rate_per_sqft"]
-    months = 12 if data.bill_period_type == "yearly" else 1
-    
-    # Calculate due date
-    due_day = settings["due_date_day"]
-    if data.bill_period_type == "monthly":
-        due_date = datetime(data.year, data.month, min(due_day, 28))
-    else:
-        due_date = datetime(data.year, 12, 31)
-    
-    bills_created = 0
-    total_amount = 0
+    progress = dict(job["progress"])
+    last_flat_id = ctx.state.get("last_flat_id", "")
+    redo = ctx.resumed
     
-    for flat in flats:
-        area = flat.get("area_sqft", 0)
-        if area <= 0:
-            continue
-        
-        amount_before = await _calculate_bill_amount(area, rate, months)
-        discount, final_amount = await _apply_discount(amount_before, scheme) if scheme else (0, amount_before)
-        
-        primary = await _get_primary_member(flat["id"], society_id)
-        
-        bill_id = str(uuid.uuid4())
-        bill = {
-            "id": bill_id,
-            "society_id": society_id,
-            "flat_id": flat["id"],
-            "flat_number": flat["flat_number"],
-            "wing": flat.get("wing", ""),
-            "primary_user_id": primary["user_id"],
-            "bill_period_type": data.bill_period_type,
-            "month": data.month if data.bill_period_type == "monthly" else None,
-            "year": data.year,
-            "area_sqft": area,
-            "rate_per_sqft": rate,
-            "total_before_discount": amount_before,
-            "discount_applied": discount,
-            "discount_scheme_id": data.discount_scheme_id if scheme else None,
-            "final_payable_amount": final_amount,
-            "late_fee": 0,
-            "due_date": due_date.strftime("%Y-%m-%d"),
-            "status": "pending",
-            "paid_amount": 0,
-            "created_at": now.isoformat(),
-        }
-        await db.maintenance_bills_v2.insert_one(bill)
-        bills_created += 1
-        total_amount += final_amount
-        
-        # Create ledger entry (debit)
-        period = f"{data.month}/{data.year}" if data.bill_period_type == "monthly" else f"Year {data.year}"
-        await _create_ledger_entry(
-            society_id, flat["id"], primary["user_id"],
-            "bill_generated", bill_id, "bill",
-            debit=final_amount, notes=f"Maintenance bill for {period}"
-        )
-        
-        # If discount applied, create separate ledger entry
-        if discount > 0:
-            await _create_ledger_entry(
-                society_id, flat["id"], primary["user_id"],
-                "discount_applied", bill_id, "bill",
-                credit=discount, notes=f"Discount: {scheme['scheme_name'] if scheme else ''}"
-            )
+    while True:
+        flats = await db.flats.find(
+            {"society_id": society_id, "id": {"$gt": last_flat_id}},
+            {"_id": 0, "id": 1, "flat_number": 1, "wing": 1, "area_sqft": 1},
+        ).sort("id", 1).to_list(BILL_JOB_CHUNK_SIZE)
+        if not flats:
+            break
+        now = datetime.now(timezone.utc)
+        billable = [f for f in flats if f.get("area_sqft", 0) > 0]
+        primaries = await _get_primary_members(society_id, [f["id"] for f in billable])
         
-        # Send notification to primary member
-        if primary["user_id"]:
-            await db.notifications.insert_one({
-                "id": str(uuid.uuid4()),
+        bills, ledger_entries, notifications = [], [], []
+        chunk_amount = 0
+        for flat in billable:
+            area = flat["area_sqft"]
+            amount_before = await _calculate_bill_amount(area, rate, months)
+            discount, final_amount = await _apply_discount(amount_before, scheme) if scheme else (0, amount_before)
+            
+            primary = primaries.get(flat["id"], {"user_id": "", "user_name": ""})
+            
+            bill_id = _stable_id("bill", society_id, data.bill_period_type, period_key, flat["id"])
+            bills.append({
+                "id": bill_id,
                 "society_id": society_id,
-                "user_id": primary["user_id"],
-                "title": "Maintenance Bill Generated",
-                "message": f"Your maintenance bill of ₹{final_amount:,.0f} for {period} is due on {due_date.strftime('%d %b %Y')}",
-                "type": "billing",
-                "read": False,
+                "flat_id": flat["id"],
+                "flat_number": flat["flat_number"],
+                "wing": flat.get("wing", ""),
+                "primary_user_id": primary["user_id"],
+                "bill_period_type": data.bill_period_type,
+                "month": data.month if data.bill_period_type == "monthly" else None,
+                "year": data.year,
+                "area_sqft": area,
+                "rate_per_sqft": rate,
+                "total_before_discount": amount_before,
+                "discount_applied": discount,
+                "discount_scheme_id": data.discount_scheme_id if scheme else None,
+                "final_payable_amount": final_amount,
+                "late_fee": 0,
+                "due_date": params["due_date"],
+                "status": "pending",
+                "paid_amount": 0,
+                "job_id": job["id"],
                 "created_at": now.isoformat(),
             })
+            chunk_amount += final_amount
+            
+            # Ledger entries (debit, plus a separate credit if discount applied)
+            postings = [("bill_generated", final_amount, 0, f"Maintenance bill for {period}")]
+            if discount > 0:
+                postings.append((
+                    "discount_applied", 0, discount,
+                    f"Discount: {scheme['scheme_name'] if scheme else ''}",
+                ))
+            for entry_type, debit, credit, notes in postings:
+                ledger_entries.append({
+                    "id": _stable_id("ledger", bill_id, entry_type),
+                    "society_id": society_id,
+                    "flat_id": flat["id"],
+                    "user_id": primary["user_id"],
+                    "entry_date": now.isoformat(),
+                    "entry_type": entry_type,
+                    "reference_id": bill_id,
+                    "reference_type": "bill",
+                    "debit_amount": debit,
+                    "credit_amount": credit,
+                    "notes": notes,
+                })
+            
+            # Notification to primary member
+            if primary["user_id"]:
+                notifications.append({
+                    "id": _stable_id("notification", bill_id),
+                    "society_id": society_id,
+                    "user_id": primary["user_id"],
+                    "title": "Maintenance Bill Generated",
+                    "message": f"Your maintenance bill of ₹{final_amount:,.0f} for {period} is due on {due_date.strftime('%d %b %Y')}",
+                    "type": "billing",
+                    "read": False,
+                    "created_at": now.isoformat(),
+                })
+        
+        # Make sure no other worker has taken over the job before writing
+        await ctx.renew()
+        if redo:
+            await _insert_missing(db.maintenance_bills_v2, bills)
+            posted = {
+                e["id"] for e in await db.member_ledger.find(
+                    {"id": {"$in": [e["id"] for e in ledger_entries]}}, {"_id": 0, "id": 1}
+                ).to_list(None)
+            }
+            await _resync_accounts(society_id, [f["id"] for f in billable])
+            await _post_ledger_entries(society_id, [e for e in ledger_entries if e["id"] not in posted])
+            inserted = await _insert_missing(db.notifications, notifications)
+            await unread.add_unread(inserted)
+            pubsub.publish_notifications(inserted)
+            redo = False
+        else:
+            await _insert_missing(db.maintenance_bills_v2, bills)
+            await _post_ledger_entries(society_id, ledger_entries)
+            inserted = await _insert_missing(db.notifications, notifications)
+            await unread.add_unread(inserted)
+            pubsub.publish_notifications(inserted)
+        
+        last_flat_id = flats[-1]["id"]
+        progress["processed_flats"] += len(flats)
+        progress["bills_created"] += len(bills)
+        progress["total_amount"] = round(progress["total_amount"] + chunk_amount, 2)
+        await ctx.checkpoint({"last_flat_id": last_flat_id}, progress)
     
     return {
         "status": "success",
-        "bills_created": bills_created,
-        "total_amount": round(total_amount, 2),
-        "period": f"{data.month}/{data.year}" if data.bill_period_type == "monthly" else str(data.year),
+        "bills_created": progress["bills_created"],
+        "total_amount": progress["total_amount"],
+        "period": _bill_period(data)[1],
     }
 
 
+@router.get("/jobs/{job_id}")
+async def get_job(
+    society_id: str, job_id: str,
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
+):
+    """Status and progress of a background maintenance job (Manager only)."""
+    job = await db.jobs.find_one({"id": job_id, "society_id": society_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.public_view(job)
+
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_job(
+    society_id: str, job_id: str,
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
+):
+    """Resume a failed job from its last checkpoint (Manager only)."""
+    job = await db.jobs.find_one({"id": job_id, "society_id": society_id}, {"_id": 0, "id": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        retried = await jobs.retry(job_id)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A newer job for the same work has been submitted")
+    if not retried:
+        raise HTTPException(status_code=400, detail="Only failed jobs can be retried")
+    return {"status": "queued"}
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # BILLS LISTING
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -449,21 +820,19 @@ async def list_bills(
     flat_id: str = None,
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=200),
+    cursor: str = None,
+    response: Response = None,
     current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access()),
+    users: UserLoader = Depends(get_user_loader),
 ):
     """List maintenance bills with filters."""
-    membership = await _verify(current_user["sub"], society_id)
-    
     query = {"society_id": society_id}
     
     # Members can only see their own bills (linked flats)
-    if membership["role"] == "member":
-        user_flats = await db.flat_members.find(
-            {"society_id": society_id, "user_id": current_user["sub"]}, {"_id": 0}
-        ).to_list(100)
-        flat_ids = [f["flat_id"] for f in user_flats]
-        if flat_ids:
-            query["flat_id"] = {"$in": flat_ids}
+    if access["role"] == "member":
+        if access["flat_ids"]:
+            query["flat_id"] = {"$in": access["flat_ids"]}
         else:
             return []
     
@@ -473,27 +842,35 @@ async def list_bills(
         query["month"] = month
     if year:
         query["year"] = year
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     if status:
-        query["status"] = status
+        query.update(status_filter(status, today))
     if flat_id:
         query["flat_id"] = flat_id
     
-    skip = (page - 1) * limit
-    bills = await db.maintenance_bills_v2.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).to_list(limit)
+    # Keyset pagination when a cursor is given; offset pages keep working
+    skip = 0
+    if cursor:
+        query = after_cursor(query, cursor)
+    else:
+        skip = (page - 1) * limit
+    bills = await db.maintenance_bills_v2.find(query, {"_id": 0}).sort(KEYSET_SORT).skip(skip).to_list(limit)
+    set_next_cursor(response, bills, limit)
+    settings = await _get_or_create_settings(society_id)
+    bills = [effective_bill(b, settings, today) for b in bills]
+    
+    names = await users.load_many(b.get("primary_user_id", "") for b in bills)
+    scheme_ids = list({b["discount_scheme_id"] for b in bills if b.get("discount_scheme_id")})
+    schemes = await db.discount_schemes.find(
+        {"id": {"$in": scheme_ids}}, {"_id": 0, "id": 1, "scheme_name": 1}
+    ).to_list(None) if scheme_ids else []
+    scheme_names = {s["id"]: s["scheme_name"] for s in schemes}
     
     result = []
     for b in bills:
-        # Get user name
-        user_name = ""
-        if b.get("primary_user_id"):
-            user = await db.users.find_one({"id": b["primary_user_id"]}, {"_id": 0})
-            user_name = user["name"] if user else ""
-        
-        # Get discount scheme name
-        scheme_name = ""
-        if b.get("discount_scheme_id"):
-            scheme = await db.discount_schemes.find_one({"id": b["discount_scheme_id"]}, {"_id": 0})
-            scheme_name = scheme["scheme_name"] if scheme else ""
+        user = names.get(b.get("primary_user_id", ""))
+        user_name = user["name"] if user else ""
+        scheme_name = scheme_names.get(b.get("discount_scheme_id"), "")
         
         result.append(MaintenanceBillResponse(
             **b,
@@ -507,19 +884,18 @@ async def list_bills(
 @router.get("/bills/{bill_id}", response_model=MaintenanceBillResponse)
 async def get_bill(
     society_id: str, bill_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access()),
+    users: UserLoader = Depends(get_user_loader),
 ):
     """Get a specific bill."""
-    await _verify(current_user["sub"], society_id)
-    
     bill = await db.maintenance_bills_v2.find_one({"id": bill_id, "society_id": society_id}, {"_id": 0})
     if not bill:
         raise HTTPException(status_code=404, detail="Bill not found")
+    settings = await _get_or_create_settings(society_id)
+    bill = effective_bill(bill, settings, datetime.now(timezone.utc).strftime("%Y-%m-%d"))
     
-    user_name = ""
-    if bill.get("primary_user_id"):
-        user = await db.users.find_one({"id": bill["primary_user_id"]}, {"_id": 0})
-        user_name = user["name"] if user else ""
+    user_name = await users.name(bill.get("primary_user_id", ""))
     
     scheme_name = ""
     if bill.get("discount_scheme_id"):
@@ -536,11 +912,10 @@ async def get_bill(
 @router.post("/payments", response_model=PaymentResponse)
 async def record_payment(
     society_id: str, data: RecordPaymentRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
     """Record a maintenance payment (Manager only)."""
-    await _verify(current_user["sub"], society_id, ["manager"])
-    
     flat = await db.flats.find_one({"id": data.flat_id, "society_id": society_id}, {"_id": 0})
     if not flat:
         raise HTTPException(status_code=404, detail="Flat not found")
@@ -549,9 +924,6 @@ async def record_payment(
     now = datetime.now(timezone.utc)
     payment_date = data.payment_date or now.strftime("%Y-%m-%d")
     
-    # Generate receipt number
-    receipt_number = await _generate_receipt_number(society_id)
-    
     # Get discount for annual payment
     discount_applied = 0
     if data.is_annual_payment and data.discount_scheme_id:
@@ -565,7 +937,8 @@ async def record_payment(
             total = monthly * scheme.get("eligible_months", 12)
             discount_applied, _ = await _apply_discount(total, scheme)
     
-    # Create payment record
+    # Create payment record; the receipt number is taken just before the insert
+    receipt_number = (await allocate_receipt_numbers(society_id, on_date=payment_date))[0]
     payment_id = str(uuid.uuid4())
     payment = {
         "id": payment_id,
@@ -586,24 +959,13 @@ async def record_payment(
     }
     await db.maintenance_payments.insert_one(payment)
     
-    # Update bill statuses
-    remaining = data.amount_paid
-    for bill_id in data.bill_ids:
-        if remaining <= 0:
-            break
-        
-        bill = await db.maintenance_bills_v2.find_one({"id": bill_id}, {"_id": 0})
-        if bill:
-            due = bill["final_payable_amount"] - bill.get("paid_amount", 0)
-            pay_now = min(remaining, due)
-            new_paid = bill.get("paid_amount", 0) + pay_now
-            new_status = "paid" if new_paid >= bill["final_payable_amount"] else "partial"
-            
-            await db.maintenance_bills_v2.update_one(
-                {"id": bill_id},
-                {"$set": {"paid_amount": new_paid, "status": new_status}}
-            )
-            remaining -= pay_now
+    # Charge any late fee now due on these bills, then update their statuses
+    if data.bill_ids:
+        settings = await _get_or_create_settings(society_id)
+        await _process_overdue(
+            society_id, settings, now.strftime("%Y-%m-%d"), payment_id, bill_filter={"id": {"$in": data.bill_ids}}
+        )
+    await _allocate_payment(society_id, payment_id, data.bill_ids, data.amount_paid)
     
     # Create ledger entry (credit)
     await _create_ledger_entry(
@@ -615,7 +977,7 @@ async def record_payment(
     # Create inward transaction
     period_desc = "Annual" if data.is_annual_payment else "Monthly"
     txn_id = str(uuid.uuid4())
-    await db.transactions.insert_one({
+    txn_doc = {
         "id": txn_id,
         "society_id": society_id,
         "type": "inward",
@@ -626,23 +988,19 @@ async def record_payment(
         "payment_mode": data.payment_mode,
         "invoice_path": "",
         "date": payment_date,
+        **date_fields(payment_date, now.isoformat()),
         "created_by": current_user["sub"],
         "created_at": now.isoformat(),
         "approval_status": "approved",
-    })
+    }
+    await db.transactions.insert_one(txn_doc)
+    await record_transaction(txn_doc)
     
     # Notify member
     if primary["user_id"]:
-        await db.notifications.insert_one({
-            "id": str(uuid.uuid4()),
-            "society_id": society_id,
-            "user_id": primary["user_id"],
-            "title": "Payment Received",
-            "message": f"Your payment of ₹{data.amount_paid:,.0f} has been recorded. Receipt: {receipt_number}",
-            "type": "payment",
-            "read": False,
-            "created_at": now.isoformat(),
-        })
+        notify(society_id, primary["user_id"], "Payment Received",
+               f"Your payment of ₹{data.amount_paid:,.0f} has been recorded. Receipt: {receipt_number}",
+               "payment", now.isoformat())
     
     return PaymentResponse(
         **payment,
@@ -650,40 +1008,335 @@ async def record_payment(
     )
 
 
+def _parse_statement(filename: str, content: bytes) -> list[dict]:
+    """Rows of a CSV or JSON payment statement, with column aliases resolved."""
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        rows = json.loads(text)
+        if isinstance(rows, dict):
+            rows = rows.get("payments", [])
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    if not isinstance(rows, list):
+        raise ValueError("Statement must be a list of payments")
+    parsed = []
+    for row in rows:
+        if not isinstance(row, dict):
+            raise ValueError("Each payment must be an object")
+        parsed.append({
+            IMPORT_COLUMN_ALIASES.get(k.strip().lower(), k.strip().lower()): v.strip() if isinstance(v, str) else v
+            for k, v in row.items() if k
+        })
+    return parsed
+
+
+@router.post("/payments/import")
+async def import_payments(
+    society_id: str, file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
+):
+    """Record a bank/UPI statement of payments in bulk (Manager only).
+    
+    Every row is validated before anything is written. Rows whose
+    transaction_reference was already recorded are skipped, so re-uploading
+    a statement is safe. Each payment is applied to the flat's open bills,
+    oldest first.
+    """
+    try:
+        raw_rows = _parse_statement(file.filename or "", await file.read())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read statement: {e}")
+    if not raw_rows:
+        raise HTTPException(status_code=400, detail="Statement has no payments")
+    if len(raw_rows) > MAX_IMPORT_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_IMPORT_ROWS} payments per import")
+    
+    # Validate every row up front
+    errors, rows = [], []
+    for i, raw in enumerate(raw_rows, start=1):
+        try:
+            row = ImportPaymentRow(**raw)
+        except ValidationError as e:
+            errors.append(f"Row {i}: {e.errors()[0]['loc'][0]} {e.errors()[0]['msg'].lower()}")
+            continue
+        if row.amount_paid <= 0:
+            errors.append(f"Row {i}: amount must be positive")
+        elif not row.transaction_reference:
+            errors.append(f"Row {i}: transaction reference is required")
+        elif not row.flat_id and not row.flat_number:
+            errors.append(f"Row {i}: flat is required")
+        elif row.payment_date and not date_fields(row.payment_date):
+            errors.append(f"Row {i}: invalid date {row.payment_date}")
+        else:
+            rows.append((i, row))
+    
+    flats = await db.flats.find(
+        {"society_id": society_id}, {"_id": 0, "id": 1, "flat_number": 1}
+    ).to_list(None)
+    by_id = {f["id"]: f for f in flats}
+    by_number = {}
+    for f in flats:
+        by_number.setdefault(f["flat_number"].lower(), []).append(f)
+    resolved = []
+    for i, row in rows:
+        flat = by_id.get(row.flat_id) if row.flat_id else None
+        if not flat and not row.flat_id:
+            matches = by_number.get(row.flat_number.lower(), [])
+            if len(matches) > 1:
+                errors.append(f"Row {i}: flat {row.flat_number} is ambiguous, use flat_id")
+                continue
+            flat = matches[0] if matches else None
+        if not flat:
+            errors.append(f"Row {i}: flat {row.flat_id or row.flat_number} not found")
+            continue
+        resolved.append((row, flat))
+    if errors:
+        more = f" (and {len(errors) - 20} more)" if len(errors) > 20 else ""
+        raise HTTPException(status_code=400, detail="; ".join(errors[:20]) + more)
+    
+    # Idempotency: skip references already recorded, or repeated in the file
+    refs = [row.transaction_reference for row, _ in resolved]
+    seen = {
+        p["transaction_reference"]
+        for p in await db.maintenance_payments.find(
+            {"society_id": society_id, "transaction_reference": {"$in": refs, "$gt": ""}},
+            {"_id": 0, "transaction_reference": 1},
+        ).to_list(None)
+    }
+    skipped, to_import = [], []
+    for row, flat in resolved:
+        if row.transaction_reference in seen:
+            skipped.append(row.transaction_reference)
+        else:
+            seen.add(row.transaction_reference)
+            to_import.append((row, flat))
+    if not to_import:
+        return {"status": "success", "imported": 0, "skipped": skipped, "total_amount": 0}
+    
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    flat_ids = list({flat["id"] for _, flat in to_import})
+    primaries = await _get_primary_members(society_id, flat_ids)
+    
+    # Charge late fees now due on these flats' bills before allocating
+    settings = await _get_or_create_settings(society_id)
+    await _process_overdue(society_id, settings, today, str(uuid.uuid4()), bill_filter={"flat_id": {"$in": flat_ids}})
+    
+    # Plan allocation against open bills, oldest first, in statement order
+    open_bills = await db.maintenance_bills_v2.find(
+        {"society_id": society_id, "flat_id": {"$in": flat_ids}, "status": {"$in": OPEN_BILL_STATUSES}},
+        {"_id": 0, "id": 1, "flat_id": 1, "final_payable_amount": 1, "paid_amount": 1},
+    ).sort([("year", 1), ("month", 1), ("created_at", 1)]).to_list(None)
+    queues = {}
+    for b in open_bills:
+        b["due"] = round(b["final_payable_amount"] - b.get("paid_amount", 0), 2)
+        queues.setdefault(b["flat_id"], []).append(b)
+    
+    payments, txns = [], []
+    allocations = {}  # bill_id -> [(payment_id, amount)]
+    for row, flat in to_import:
+        payment_id = str(uuid.uuid4())
+        payment_date = row.payment_date or today
+        primary = primaries.get(flat["id"], {"user_id": "", "user_name": ""})
+        
+        remaining = row.amount_paid
+        bill_ids = []
+        for bill in queues.get(flat["id"], []):
+            if remaining <= 0:
+                break
+            pay_now = round(min(remaining, bill["due"]), 2)
+            if pay_now <= 0:
+                continue
+            bill["due"] = round(bill["due"] - pay_now, 2)
+            remaining -= pay_now
+            bill_ids.append(bill["id"])
+            allocations.setdefault(bill["id"], []).append((payment_id, pay_now))
+        
+        payments.append({
+            "id": payment_id,
+            "society_id": society_id,
+            "flat_id": flat["id"],
+            "flat_number": flat["flat_number"],
+            "bill_ids": bill_ids,
+            "paid_by_user_id": primary["user_id"],
+            "amount_paid": row.amount_paid,
+            "discount_applied": 0,
+            "payment_mode": row.payment_mode,
+            "payment_date": payment_date,
+            "receipt_number": "",
+            "transaction_reference": row.transaction_reference,
+            "source": "import",
+            "remarks": row.remarks,
+            "created_at": now.isoformat(),
+            "created_by": current_user["sub"],
+        })
+        txns.append({
+            "id": str(uuid.uuid4()),
+            "society_id": society_id,
+            "type": "inward",
+            "category": "Maintenance Payment",
+            "amount": row.amount_paid,
+            "description": f"Monthly maintenance from {flat['flat_number']}",
+            "vendor_name": "",
+            "payment_mode": row.payment_mode,
+            "invoice_path": "",
+            "date": payment_date,
+            **date_fields(payment_date, now.isoformat()),
+            "created_by": current_user["sub"],
+            "created_at": now.isoformat(),
+            "approval_status": "approved",
+        })
+    
+    # The unique reference index settles a concurrent import of the same
+    # statement: rows the other import stored first are skipped from here on
+    duplicate_ids = set()
+    for i in range(0, len(payments), BULK_CHUNK_SIZE):
+        chunk = payments[i:i + BULK_CHUNK_SIZE]
+        try:
+            await db.maintenance_payments.insert_many(chunk, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            duplicate_ids.update(chunk[err["index"]]["id"] for err in errors)
+    if duplicate_ids:
+        # txns line up one-to-one with payments
+        skipped += [p["transaction_reference"] for p in payments if p["id"] in duplicate_ids]
+        txns = [t for t, p in zip(txns, payments) if p["id"] not in duplicate_ids]
+        payments = [p for p in payments if p["id"] not in duplicate_ids]
+        allocations = {
+            bill_id: kept
+            for bill_id, parts in allocations.items()
+            if (kept := [(pid, amount) for pid, amount in parts if pid not in duplicate_ids])
+        }
+    if not payments:
+        return {"status": "success", "imported": 0, "skipped": skipped, "total_amount": 0}
+    
+    # Receipt numbers only for the rows that were stored: one block per
+    # financial year in the statement
+    by_fy = {}
+    for p in payments:
+        by_fy.setdefault(financial_year(p["payment_date"]), []).append(p)
+    for fy_payments in by_fy.values():
+        numbers = await allocate_receipt_numbers(
+            society_id, count=len(fy_payments), on_date=fy_payments[0]["payment_date"]
+        )
+        for p, number in zip(fy_payments, numbers):
+            p["receipt_number"] = number
+    receipt_ops = [UpdateOne({"id": p["id"]}, {"$set": {"receipt_number": p["receipt_number"]}}) for p in payments]
+    for i in range(0, len(receipt_ops), BULK_CHUNK_SIZE):
+        await db.maintenance_payments.bulk_write(receipt_ops[i:i + BULK_CHUNK_SIZE], ordered=False)
+    
+    ledger_entries, notifications = [], []
+    for p in payments:
+        ledger_entries.append({
+            "id": str(uuid.uuid4()),
+            "society_id": society_id,
+            "flat_id": p["flat_id"],
+            "user_id": p["paid_by_user_id"],
+            "entry_date": now.isoformat(),
+            "entry_type": "payment_received",
+            "reference_id": p["id"],
+            "reference_type": "payment",
+            "debit_amount": 0,
+            "credit_amount": p["amount_paid"],
+            "notes": f"Payment via {p['payment_mode']} - {p['receipt_number']}",
+        })
+        if p["paid_by_user_id"]:
+            notifications.append(notification(
+                society_id, p["paid_by_user_id"], "Payment Received",
+                f"Your payment of ₹{p['amount_paid']:,.0f} has been recorded. Receipt: {p['receipt_number']}",
+                "payment", now.isoformat(),
+            ))
+    
+    # Bill updates: one conditional $inc per bill; bills that changed since
+    # they were read fall back to per-payment allocation
+    bills_by_id = {b["id"]: b for b in open_bills}
+    ops = []
+    for bill_id, parts in allocations.items():
+        bill = bills_by_id[bill_id]
+        paid = bill.get("paid_amount", 0)
+        total = round(sum(amount for _, amount in parts), 2)
+        due = round(bill["final_payable_amount"] - paid - total, 2)
+        ops.append(UpdateOne(
+            {"id": bill_id, "paid_amount": paid if paid else {"$in": [0, None]},
+             "payment_ids": {"$ne": parts[0][0]}},
+            {"$inc": {"paid_amount": total},
+             "$set": {"status": "paid" if due <= 0 else "partial"},
+             "$push": {"payment_ids": {"$each": [pid for pid, _ in parts]}}},
+        ))
+    modified = 0
+    for i in range(0, len(ops), BULK_CHUNK_SIZE):
+        result = await db.maintenance_bills_v2.bulk_write(ops[i:i + BULK_CHUNK_SIZE], ordered=False)
+        modified += result.modified_count
+    if modified < len(ops):
+        landed = {
+            b["id"]
+            for b in await db.maintenance_bills_v2.find(
+                {"id": {"$in": list(allocations)}, "payment_ids": {"$in": [p["id"] for p in payments]}},
+                {"_id": 0, "id": 1},
+            ).to_list(None)
+        }
+        retry_bills, retry_amount = {}, {}
+        for bill_id, parts in allocations.items():
+            if bill_id not in landed:
+                for pid, amount in parts:
+                    retry_bills.setdefault(pid, []).append(bill_id)
+                    retry_amount[pid] = retry_amount.get(pid, 0) + amount
+        for pid, bill_ids in retry_bills.items():
+            await _allocate_payment(society_id, pid, bill_ids, round(retry_amount[pid], 2))
+    
+    await _post_ledger_entries(society_id, ledger_entries)
+    await _insert_chunked(db.transactions, txns)
+    await record_transactions(txns)
+    outbox.enqueue(*notifications)
+    
+    return {
+        "status": "success",
+        "imported": len(payments),
+        "skipped": skipped,
+        "total_amount": round(sum(p["amount_paid"] for p in payments), 2),
+    }
+
+
 @router.get("/payments", response_model=list[PaymentResponse])
 async def list_payments(
     society_id: str,
     flat_id: str = None,
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=200),
+    cursor: str = None,
+    response: Response = None,
     current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access()),
+    users: UserLoader = Depends(get_user_loader),
 ):
     """List maintenance payments."""
-    membership = await _verify(current_user["sub"], society_id)
-    
     query = {"society_id": society_id}
     
-    if membership["role"] == "member":
-        user_flats = await db.flat_members.find(
-            {"society_id": society_id, "user_id": current_user["sub"]}, {"_id": 0}
-        ).to_list(100)
-        flat_ids = [f["flat_id"] for f in user_flats]
-        if flat_ids:
-            query["flat_id"] = {"$in": flat_ids}
+    if access["role"] == "member":
+        if access["flat_ids"]:
+            query["flat_id"] = {"$in": access["flat_ids"]}
         else:
             return []
     elif flat_id:
         query["flat_id"] = flat_id
     
-    skip = (page - 1) * limit
-    payments = await db.maintenance_payments.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).to_list(limit)
+    # Keyset pagination when a cursor is given; offset pages keep working
+    skip = 0
+    if cursor:
+        query = after_cursor(query, cursor)
+    else:
+        skip = (page - 1) * limit
+    payments = await db.maintenance_payments.find(query, {"_id": 0}).sort(KEYSET_SORT).skip(skip).to_list(limit)
+    set_next_cursor(response, payments, limit)
     
+    names = await users.load_many(p.get("paid_by_user_id", "") for p in payments)
     result = []
     for p in payments:
-        user_name = ""
-        if p.get("paid_by_user_id"):
-            user = await db.users.find_one({"id": p["paid_by_user_id"]}, {"_id": 0})
-            user_name = user["name"] if user else ""
+        user = names.get(p.get("paid_by_user_id", ""))
+        user_name = user["name"] if user else ""
         result.append(PaymentResponse(**p, paid_by_user_name=user_name))
     
     return result
@@ -696,11 +1349,10 @@ async def list_payments(
 @router.post("/annual-payment/preview", response_model=AnnualPaymentPreviewResponse)
 async def preview_annual_payment(
     society_id: str, data: AnnualPaymentPreviewRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access())
 ):
     """Preview annual payment with discount calculation."""
-    await _verify(current_user["sub"], society_id)
-    
     flat = await db.flats.find_one({"id": data.flat_id, "society_id": society_id}, {"_id": 0})
     if not flat:
         raise HTTPException(status_code=404, detail="Flat not found")
@@ -763,17 +1415,14 @@ async def preview_annual_payment(
 @router.get("/ledger/{flat_id}", response_model=LedgerSummaryResponse)
 async def get_flat_ledger(
     society_id: str, flat_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access()),
+    users: UserLoader = Depends(get_user_loader),
 ):
     """Get complete ledger for a flat."""
-    membership = await _verify(current_user["sub"], society_id)
-    
     # Members can only view their own flats
-    if membership["role"] == "member":
-        is_member = await db.flat_members.find_one(
-            {"flat_id": flat_id, "user_id": current_user["sub"]}, {"_id": 0}
-        )
-        if not is_member:
+    if access["role"] == "member":
+        if flat_id not in access["flat_ids"]:
             raise HTTPException(status_code=403, detail="Not authorized to view this ledger")
     
     flat = await db.flats.find_one({"id": flat_id, "society_id": society_id}, {"_id": 0})
@@ -785,7 +1434,7 @@ async def get_flat_ledger(
     # Get ledger entries
     entries = await db.member_ledger.find(
         {"society_id": society_id, "flat_id": flat_id}, {"_id": 0}
-    ).sort("entry_date", -1).to_list(500)
+    ).sort("seq", -1).to_list(500)
     
     # Calculate totals
     total_billed = sum(e.get("debit_amount", 0) for e in entries if e["entry_type"] == "bill_generated")
@@ -799,15 +1448,18 @@ async def get_flat_ledger(
     last_payment_date = last_payment["payment_date"] if last_payment else None
     
     # Current balance
-    outstanding = entries[0]["balance_after_entry"] if entries else 0
+    account = await db.member_accounts.find_one({"society_id": society_id, "flat_id": flat_id}, {"_id": 0})
+    if account:
+        outstanding = account["balance"]
+    else:
+        outstanding = entries[0]["balance_after_entry"] if entries else 0
     
     # Format entries
+    names = await users.load_many(e.get("user_id", "") for e in entries)
     entry_responses = []
     for e in entries:
-        user_name = ""
-        if e.get("user_id"):
-            user = await db.users.find_one({"id": e["user_id"]}, {"_id": 0})
-            user_name = user["name"] if user else ""
+        user = names.get(e.get("user_id", ""))
+        user_name = user["name"] if user else ""
         
         entry_responses.append(LedgerEntryResponse(
             **e,
@@ -835,11 +1487,10 @@ async def get_flat_ledger(
 @router.get("/receipts/{payment_id}", response_model=ReceiptResponse)
 async def get_receipt(
     society_id: str, payment_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access())
 ):
     """Get receipt details for a payment."""
-    await _verify(current_user["sub"], society_id)
-    
     payment = await db.maintenance_payments.find_one({"id": payment_id, "society_id": society_id}, {"_id": 0})
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
@@ -885,11 +1536,10 @@ async def get_receipt(
 @router.get("/receipts/{payment_id}/pdf")
 async def download_receipt_pdf(
     society_id: str, payment_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access())
 ):
     """Download receipt as PDF."""
-    await _verify(current_user["sub"], society_id)
-    
     payment = await db.maintenance_payments.find_one({"id": payment_id, "society_id": society_id}, {"_id": 0})
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
@@ -962,69 +1612,88 @@ async def get_collection_dashboard(
     society_id: str,
     year: int = None,
     month: int = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager", "committee", "auditor"))
 ):
     """Get maintenance collection dashboard (Manager only)."""
-    await _verify(current_user["sub"], society_id, ["manager", "committee", "auditor"])
-    
     now = datetime.now(timezone.utc)
     if not year:
         year = now.year
     if not month:
         month = now.month
     
-    # Total flats
-    total_flats = await db.flats.count_documents({"society_id": society_id})
-    
-    # Bills for the period
-    bills = await db.maintenance_bills_v2.find({
-        "society_id": society_id, "year": year
-    }, {"_id": 0}).to_list(1000)
-    
-    # If checking specific month, filter
-    if month:
-        monthly_bills = [b for b in bills if b.get("month") == month or b.get("bill_period_type") == "yearly"]
-    else:
-        monthly_bills = bills
+    # Status counts and totals for the period, plus month-wise totals for the
+    # year, in one pass over the year's bills as of today
+    settings = await _get_or_create_settings(society_id)
+    today = now.strftime("%Y-%m-%d")
+    sums = {
+        "billed": {"$sum": "$final_payable_amount"},
+        "collected": {"$sum": {"$ifNull": ["$paid_amount", 0]}},
+    }
+    pipeline = [
+        {"$match": {"society_id": society_id, "year": year}},
+        {"$project": {"_id": 0, "month": 1, "bill_period_type": 1, "status": 1, "due_date": 1,
+                      "late_fee": 1, "final_payable_amount": 1, "paid_amount": 1}},
+        {"$addFields": effective_fields(settings, today)},
+        {"$facet": {
+            "period": [
+                {"$match": {"$or": [{"month": month}, {"bill_period_type": "yearly"}]}},
+                {"$group": {"_id": "$status", "count": {"$sum": 1}, **sums}},
+            ],
+            "months": [
+                {"$match": {"month": {"$gte": 1, "$lte": 12}}},
+                {"$group": {"_id": "$month", **sums}},
+            ],
+        }},
+    ]
+    facets, total_flats, recent = await asyncio.gather(
+        db.maintenance_bills_v2.aggregate(pipeline).to_list(1),
+        db.flats.count_documents({"society_id": society_id}),
+        db.maintenance_payments.find(
+            {"society_id": society_id},
+            {"_id": 0, "flat_id": 1, "flat_number": 1, "receipt_number": 1,
+             "amount_paid": 1, "payment_date": 1, "payment_mode": 1},
+        ).sort(KEYSET_SORT).to_list(10),
+    )
+    facets = facets[0]
     
-    paid_flats = len([b for b in monthly_bills if b.get("status") == "paid"])
-    pending_flats = len([b for b in monthly_bills if b.get("status") in ["pending", "partial"]])
-    overdue_flats = len([b for b in monthly_bills if b.get("status") == "overdue"])
+    by_status = {row["_id"]: row for row in facets["period"]}
+    paid_flats = by_status.get("paid", {}).get("count", 0)
+    pending_flats = sum(by_status.get(s, {}).get("count", 0) for s in ["pending", "partial"])
+    overdue_flats = by_status.get("overdue", {}).get("count", 0)
     
-    total_billed = sum(b.get("final_payable_amount", 0) for b in monthly_bills)
-    total_collected = sum(b.get("paid_amount", 0) for b in monthly_bills)
+    total_billed = sum(row["billed"] for row in facets["period"])
+    total_collected = sum(row["collected"] for row in facets["period"])
     total_outstanding = total_billed - total_collected
     
     collection_pct = (total_collected / total_billed * 100) if total_billed > 0 else 0
     
     # Month-wise collection for the year
+    months = {row["_id"]: row for row in facets["months"]}
     month_wise = []
     for m in range(1, 13):
-        m_bills = [b for b in bills if b.get("month") == m]
-        m_billed = sum(b.get("final_payable_amount", 0) for b in m_bills)
-        m_collected = sum(b.get("paid_amount", 0) for b in m_bills)
+        row = months.get(m, {"billed": 0, "collected": 0})
         month_wise.append({
             "month": m,
-            "billed": round(m_billed, 2),
-            "collected": round(m_collected, 2),
-            "pending": round(m_billed - m_collected, 2),
+            "billed": round(row["billed"], 2),
+            "collected": round(row["collected"], 2),
+            "pending": round(row["billed"] - row["collected"], 2),
         })
     
-    # Recent payments
-    recent = await db.maintenance_payments.find(
-        {"society_id": society_id}, {"_id": 0}
-    ).sort("created_at", -1).to_list(10)
-    
-    recent_payments = []
-    for p in recent:
-        flat = await db.flats.find_one({"id": p["flat_id"]}, {"_id": 0})
-        recent_payments.append({
-            "receipt_number": p["receipt_number"],
-            "flat_number": flat["flat_number"] if flat else "",
-            "amount": p["amount_paid"],
-            "date": p["payment_date"],
-            "mode": p["payment_mode"],
-        })
+    # Recent payments carry flat_number; look up any older ones that don't
+    missing = list({p["flat_id"] for p in recent if not p.get("flat_number")})
+    flat_numbers = {
+        f["id"]: f["flat_number"] for f in await db.flats.find(
+            {"id": {"$in": missing}}, {"_id": 0, "id": 1, "flat_number": 1}
+        ).to_list(None)
+    } if missing else {}
+    recent_payments = [{
+        "receipt_number": p["receipt_number"],
+        "flat_number": p.get("flat_number") or flat_numbers.get(p["flat_id"], ""),
+        "amount": p["amount_paid"],
+        "date": p["payment_date"],
+        "mode": p["payment_mode"],
+    } for p in recent]
     
     return CollectionDashboardResponse(
         total_flats=total_flats,
@@ -1044,51 +1713,109 @@ async def get_collection_dashboard(
 # OVERDUE PROCESSING
 # ═══════════════════════════════════════════════════════════════════════════════
 
+async def _process_overdue(society_id: str, settings: dict, today: str, run_id: str,
+                           bill_filter: dict = None) -> dict:
+    """Mark a society's past-due bills overdue and charge late fees.
+    
+    This materializes what bill_status computes at read time. It costs a fixed
+    number of bulk operations however many bills are due. Bills charged by
+    this run are tagged with run_id, and their ledger debits have ids derived
+    from the bill, so a debit is never posted twice. bill_filter narrows the
+    pass, e.g. to the bills a payment is about to settle.
+    """
+    scope = {"society_id": society_id, **(bill_filter or {})}
+    past_due = {**scope, "status": {"$in": ["pending", "partial"]}, "due_date": {"$lt": today}}
+    charged = []
+    if settings.get("late_fee_amount", 0) > 0:
+        bills = await db.maintenance_bills_v2.find(
+            {**scope, "status": {"$in": OPEN_BILL_STATUSES}, "due_date": {"$lt": today}, "late_fee": 0},
+            {"_id": 0, "id": 1, "final_payable_amount": 1},
+        ).to_list(None)
+        ops = []
+        for b in bills:
+            fee = late_fee_for(b["final_payable_amount"], settings)
+            ops.append(UpdateOne(
+                {"id": b["id"], "late_fee": 0, "status": {"$in": OPEN_BILL_STATUSES},
+                 "final_payable_amount": b["final_payable_amount"]},
+                {"$set": {"late_fee": fee, "late_fee_run_id": run_id}, "$inc": {"final_payable_amount": fee}},
+            ))
+        for i in range(0, len(ops), BULK_CHUNK_SIZE):
+            await db.maintenance_bills_v2.bulk_write(ops[i:i + BULK_CHUNK_SIZE], ordered=False)
+        
+        charged = await db.maintenance_bills_v2.find(
+            {**scope, "late_fee_run_id": run_id},
+            {"_id": 0, "id": 1, "flat_id": 1, "primary_user_id": 1, "late_fee": 1},
+        ).to_list(None)
+        now = datetime.now(timezone.utc).isoformat()
+        entries = [{
+            "id": _stable_id("ledger", b["id"], "late_fee"),
+            "society_id": society_id,
+            "flat_id": b["flat_id"],
+            "user_id": b.get("primary_user_id", ""),
+            "entry_date": now,
+            "entry_type": "late_fee",
+            "reference_id": b["id"],
+            "reference_type": "bill",
+            "debit_amount": b["late_fee"],
+            "credit_amount": 0,
+            "notes": "Late fee applied",
+        } for b in charged]
+        await _post_ledger_entries(society_id, entries)
+    
+    result = await db.maintenance_bills_v2.update_many(past_due, {"$set": {"status": "overdue"}})
+    return {
+        "society_id": society_id,
+        "bills_marked_overdue": result.modified_count,
+        "late_fees_applied": len(charged),
+        "late_fee_total": round(sum(b["late_fee"] for b in charged), 2),
+    }
+
+
 @router.post("/process-overdue")
 async def process_overdue_bills(
     society_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
     """Mark overdue bills and apply late fees (Manager only)."""
-    await _verify(current_user["sub"], society_id, ["manager"])
-    
     settings = await _get_or_create_settings(society_id)
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    
-    # Find pending bills past due date
-    overdue_bills = await db.maintenance_bills_v2.find({
-        "society_id": society_id,
-        "status": {"$in": ["pending", "partial"]},
-        "due_date": {"$lt": today}
-    }, {"_id": 0}).to_list(1000)
-    
-    updated_count = 0
-    late_fee_amount = settings.get("late_fee_amount", 0)
-    
-    for bill in overdue_bills:
-        update_data = {"status": "overdue"}
-        
-        # Apply late fee if not already applied
-        if late_fee_amount > 0 and bill.get("late_fee", 0) == 0:
-            if settings.get("late_fee_type") == "percentage":
-                fee = bill["final_payable_amount"] * (late_fee_amount / 100)
-            else:
-                fee = late_fee_amount
-            
-            update_data["late_fee"] = round(fee, 2)
-            update_data["final_payable_amount"] = round(bill["final_payable_amount"] + fee, 2)
-            
-            # Create ledger entry for late fee
-            await _create_ledger_entry(
-                society_id, bill["flat_id"], bill.get("primary_user_id", ""),
-                "late_fee", bill["id"], "bill",
-                debit=fee, notes="Late fee applied"
-            )
-        
-        await db.maintenance_bills_v2.update_one({"id": bill["id"]}, {"$set": update_data})
-        updated_count += 1
-    
-    return {"status": "success", "overdue_bills_processed": updated_count}
+    summary = await _process_overdue(society_id, settings, today, str(uuid.uuid4()))
+    return {"status": "success", "overdue_bills_processed": summary["bills_marked_overdue"], **summary}
+
+
+@jobs.handler("overdue_report")
+async def _overdue_report_job(ctx: jobs.JobContext) -> dict:
+    """Nightly count of overdue bills per society.
+
+    Report only: overdue status is evaluated at read time, and late fees are
+    written when a payment is recorded against the bills.
+    """
+    today = ctx.job["params"]["run_date"]
+    societies = await db.maintenance_bills_v2.aggregate([
+        {"$match": status_filter("overdue", today)},
+        {"$group": {
+            "_id": "$society_id",
+            "overdue_bills": {"$sum": 1},
+            "overdue_amount": {"$sum": {"$subtract": [
+                "$final_payable_amount", {"$ifNull": ["$paid_amount", 0]},
+            ]}},
+        }},
+        {"$sort": {"_id": 1}},
+    ]).to_list(None)
+    societies = [
+        {"society_id": s["_id"], "overdue_bills": s["overdue_bills"], "overdue_amount": round(s["overdue_amount"], 2)}
+        for s in societies
+    ]
+    total_bills = sum(s["overdue_bills"] for s in societies)
+    total_amount = round(sum(s["overdue_amount"] for s in societies), 2)
+    logger.info(
+        f"Overdue report {today}: {total_bills} bills (Rs.{total_amount:,.2f}) across {len(societies)} societies"
+    )
+    return {"run_date": today, "overdue_bills": total_bills, "overdue_amount": total_amount, "societies": societies}
+
+
+jobs.schedule_daily("overdue_report", OVERDUE_REPORT_AT)
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1103,19 +1830,33 @@ async def generate_bills_legacy(
     amount_per_flat: float,
     due_date: str,
     late_fee: float = 0,
-    current_user: dict = Depends(get_current_user)
+    response: Response = None,
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
-    """Legacy bill generation endpoint for backward compatibility."""
-    await _verify(current_user["sub"], society_id, ["manager"])
+    """Legacy bill generation endpoint for backward compatibility.
     
-    # Redirect to new endpoint
+    Answers with the bill summary once the job completes. If the run fails
+    and the job is requeued, answers 202 with the job, as /bills/generate does.
+    """
+    # Run a bill generation job inline and answer with its result
     data = GenerateBillsRequest(
         bill_period_type="monthly",
         month=month,
         year=year,
         apply_discount_scheme=False,
     )
-    return await generate_bills(society_id, data, current_user)
+    # Claimed at insert, so the background worker cannot pick it up first
+    job = await _submit_bill_job(society_id, data, current_user["sub"], claim=True)
+    await jobs.run_claimed(job)
+    job = await db.jobs.find_one({"id": job["id"]}, {"_id": 0})
+    if job["status"] == "completed":
+        return job["result"]
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job.get("error") or "Bill generation failed")
+    # Requeued after a failed attempt, or resumed by another worker
+    response.status_code = 202
+    return {"job_id": job["id"], **jobs.public_view(job)}
 
 
 @router.post("/pay")
@@ -1124,7 +1865,8 @@ async def record_payment_legacy(
     bill_id: str,
     amount_paid: float,
     payment_mode: str = "bank",
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager"))
 ):
     """Legacy payment endpoint for backward compatibility."""
     bill = await db.maintenance_bills_v2.find_one({"id": bill_id}, {"_id": 0})
@@ -1141,4 +1883,4 @@ async def record_payment_legacy(
         amount_paid=amount_paid,
         payment_mode=payment_mode,
     )
-    return await record_payment(society_id, data, current_user)
+    return await record_payment(society_id, data, current_user, access)
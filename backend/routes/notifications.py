@@ -1,45 +1,115 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from database import db
 from auth_utils import get_current_user
+from access import require_admin
+from notification_retention import NOTIFY_RETENTION_DAYS, NOTIFY_ARCHIVE_DIR, volume_by_society
 from models import NotificationResponse
+from pagination import KEYSET_SORT, after_cursor, set_next_cursor
 from datetime import datetime, timezone
+import asyncio
+import json
+import pubsub
+import unread
 
 router = APIRouter(prefix="/api/notifications", tags=["Notifications"])
 
+STREAM_HEARTBEAT_SECONDS = 20
+
 
 @router.get("/", response_model=list[NotificationResponse])
-async def list_notifications(society_id: str = None, current_user: dict = Depends(get_current_user)):
+async def list_notifications(society_id: str = None, limit: int = Query(100, ge=1, le=200),
+                             cursor: str = None, response: Response = None,
+                             current_user: dict = Depends(get_current_user)):
     query = {"user_id": current_user["sub"]}
     if society_id:
         query["society_id"] = society_id
-    notifs = await db.notifications.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+    if cursor:
+        query = after_cursor(query, cursor)
+    notifs = await db.notifications.find(query, {"_id": 0}).sort(KEYSET_SORT).to_list(limit)
+    set_next_cursor(response, notifs, limit)
     return [NotificationResponse(**n) for n in notifs]
 
 
 @router.get("/unread-count")
 async def unread_count(society_id: str = None, current_user: dict = Depends(get_current_user)):
-    query = {"user_id": current_user["sub"], "read": False}
-    if society_id:
-        query["society_id"] = society_id
-    count = await db.notifications.count_documents(query)
-    return {"count": count}
+    return {"count": await unread.unread_count(current_user["sub"], society_id)}
+
+
+@router.get("/volume")
+async def notification_volume(admin: dict = Depends(require_admin)):
+    """Notification counts per society, with the retention settings in force."""
+    return {
+        "retention_days": NOTIFY_RETENTION_DAYS,
+        "archive_enabled": bool(NOTIFY_ARCHIVE_DIR),
+        "societies": await volume_by_society(),
+    }
+
+
+@router.get("/stream")
+async def notification_stream(request: Request, society_id: str = None,
+                              current_user: dict = Depends(get_current_user)):
+    """Server-sent events: `notification` for each new notification and
+    `unread` with the change in unread count. Fetch /unread-count once on
+    connect and apply the deltas from there."""
+    user_id = current_user["sub"]
+    queue = pubsub.subscribe(user_id)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    break
+                name, data = event
+                if society_id and data.get("society_id") not in (society_id, None):
+                    continue
+                yield f"event: {name}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            pubsub.unsubscribe(user_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @router.put("/{notification_id}/read")
 async def mark_read(notification_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.notifications.update_one(
-        {"id": notification_id, "user_id": current_user["sub"]},
-        {"$set": {"read": True}},
+    notif = await db.notifications.find_one_and_update(
+        {"id": notification_id, "user_id": current_user["sub"], "read": False},
+        {"$set": {"read": True, "read_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0, "society_id": 1},
     )
-    if result.modified_count == 0:
+    if not notif:
+        # Already read: leave read_at (and so its expiry) and the counter alone
+        if await db.notifications.find_one({"id": notification_id, "user_id": current_user["sub"]}, {"_id": 0, "id": 1}):
+            return {"status": "read"}
         raise HTTPException(status_code=404, detail="Notification not found")
+    await unread.adjust(current_user["sub"], notif["society_id"], -1)
+    pubsub.publish_unread(current_user["sub"], notif["society_id"], -1)
     return {"status": "read"}
 
 
 @router.post("/mark-all-read")
 async def mark_all_read(society_id: str = None, current_user: dict = Depends(get_current_user)):
-    query = {"user_id": current_user["sub"], "read": False}
+    user_id = current_user["sub"]
     if society_id:
-        query["society_id"] = society_id
-    result = await db.notifications.update_many(query, {"$set": {"read": True}})
-    return {"marked": result.modified_count}
+        society_ids = [society_id]
+    else:
+        society_ids = await db.notifications.distinct("society_id", {"user_id": user_id, "read": False})
+    marked = 0
+    for sid in society_ids:
+        result = await db.notifications.update_many(
+            {"user_id": user_id, "society_id": sid, "read": False},
+            {"$set": {"read": True, "read_at": datetime.now(timezone.utc)}},
+        )
+        await unread.adjust(user_id, sid, -result.modified_count)
+        pubsub.publish_unread(user_id, sid, -result.modified_count)
+        marked += result.modified_count
+    return {"marked": marked}
@@ -0,0 +1,159 @@
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query
+from database import db
+from auth_utils import get_current_user
+from access import require_access
+from reconciliation import parse_statement, parse_date, match
+from txn_dates import year_range
+from datetime import datetime, timezone, timedelta
+import re
+import uuid
+
+router = APIRouter(prefix="/api/societies/{society_id}/reconciliation", tags=["Reconciliation"])
+
+ITEM_CHUNK_SIZE = 1000
+MAX_STATEMENT_LINES = 100000
+
+
+def _period_range(period: str) -> tuple[datetime, datetime]:
+    m = re.fullmatch(r"(\d{4})(?:-(\d{2}))?", period)
+    if not m or (m.group(2) and not 1 <= int(m.group(2)) <= 12):
+        raise HTTPException(status_code=400, detail="Period must be YYYY or YYYY-MM")
+    bounds = year_range(int(m.group(1)), int(m.group(2)) if m.group(2) else None)
+    return bounds["$gte"], bounds["$lt"]
+
+
+async def _book_records(society_id: str, start: datetime, end: datetime) -> list:
+    """Payments (with references) plus every other approved transaction in range.
+
+    Records whose date cannot be read are left out rather than failing the run.
+    """
+    records = []
+    payments = await db.maintenance_payments.find(
+        {"society_id": society_id,
+         "payment_date": {"$gte": start.strftime("%Y-%m-%d"), "$lt": end.strftime("%Y-%m-%d")}},
+        {"_id": 0, "id": 1, "payment_date": 1, "amount_paid": 1, "transaction_reference": 1,
+         "receipt_number": 1, "flat_number": 1},
+    ).to_list(None)
+    for p in payments:
+        try:
+            day = parse_date(p["payment_date"]).isoformat()
+        except ValueError:
+            continue
+        records.append({
+            "id": p["id"], "kind": "payment", "date": day, "amount": p["amount_paid"],
+            "reference": p.get("transaction_reference", ""),
+            "label": f"{p.get('receipt_number', '')} {p.get('flat_number', '')}".strip(),
+        })
+    # Maintenance payments already appear above through their payment records
+    txns = await db.transactions.find(
+        {"society_id": society_id, "txn_date": {"$gte": start, "$lt": end},
+         "approval_status": "approved", "category": {"$ne": "Maintenance Payment"}},
+        {"_id": 0, "id": 1, "txn_date": 1, "type": 1, "amount": 1, "category": 1, "vendor_name": 1},
+    ).to_list(None)
+    for t in txns:
+        records.append({
+            "id": t["id"], "kind": "transaction", "date": t["txn_date"].strftime("%Y-%m-%d"),
+            "amount": t["amount"] if t["type"] == "inward" else -t["amount"],
+            "reference": "",
+            "label": f"{t['category']} {t.get('vendor_name', '')}".strip(),
+        })
+    return records
+
+
+def _record_ref(r: dict) -> dict:
+    return {"kind": r["kind"], "id": r["id"], "date": r["date"], "amount": r["amount"], "label": r["label"]}
+
+
+@router.post("/")
+async def reconcile_statement(
+    society_id: str, period: str, window_days: int = Query(3, ge=0, le=15),
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager", "auditor")),
+):
+    """Match a bank statement against the books for a period (YYYY or YYYY-MM).
+
+    The result replaces any earlier reconciliation of the same period. Lines
+    whose date or amount cannot be read are reported as unmatched with a reason.
+    """
+    start, end = _period_range(period)
+    try:
+        lines, invalid = parse_statement(file.filename or "", await file.read())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read statement: {e}")
+    if len(lines) + len(invalid) > MAX_STATEMENT_LINES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STATEMENT_LINES} lines per statement")
+
+    # Fetch a window's margin either side so lines near the edges can still match
+    margin = timedelta(days=window_days)
+    records = await _book_records(society_id, start - margin, end + margin)
+    result = match(lines, records, window_days)
+
+    run_id = str(uuid.uuid4())
+    base = {"run_id": run_id, "society_id": society_id, "period": period}
+    items = []
+    for line, record, method in result["matched"]:
+        items.append({**base, "status": "matched", "method": method, "line_no": line["line_no"],
+                      "line": line, "record": _record_ref(record)})
+    for line, candidates in result["ambiguous"]:
+        items.append({**base, "status": "ambiguous", "line_no": line["line_no"],
+                      "line": line, "candidates": [_record_ref(r) for r in candidates]})
+    for line in result["unmatched_lines"]:
+        items.append({**base, "status": "unmatched_line", "line_no": line["line_no"], "line": line})
+    for line in invalid:
+        items.append({**base, "status": "unmatched_line", "line_no": line["line_no"],
+                      "line": {"line_no": line["line_no"], "raw": line["raw"]}, "reason": line["reason"]})
+    # Book records outside the period were only fetched to match edge lines
+    lo, hi = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+    for r in result["unmatched_records"]:
+        if lo <= r["date"] < hi:
+            items.append({**base, "status": "unmatched_record", "line_no": None, "record": _record_ref(r)})
+
+    summary = {"lines": len(lines) + len(invalid), "invalid_lines": len(invalid), "records": len(records)}
+    for status in ("matched", "ambiguous", "unmatched_line", "unmatched_record"):
+        summary[status] = sum(1 for i in items if i["status"] == status)
+
+    for i in range(0, len(items), ITEM_CHUNK_SIZE):
+        await db.reconciliation_items.insert_many(items[i:i + ITEM_CHUNK_SIZE])
+    run = {
+        "id": run_id,
+        "society_id": society_id,
+        "period": period,
+        "filename": file.filename or "",
+        "window_days": window_days,
+        "summary": summary,
+        "created_by": current_user["sub"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    previous = await db.reconciliations.find_one_and_replace(
+        {"society_id": society_id, "period": period}, run, projection={"_id": 0, "id": 1}, upsert=True,
+    )
+    if previous:
+        await db.reconciliation_items.delete_many({"run_id": previous["id"]})
+    run.pop("_id", None)
+    return run
+
+
+@router.get("/")
+async def list_reconciliations(society_id: str, current_user: dict = Depends(get_current_user),
+                               access: dict = Depends(require_access("manager", "committee", "auditor"))):
+    return await db.reconciliations.find({"society_id": society_id}, {"_id": 0}).sort("period", -1).to_list(100)
+
+
+@router.get("/{period}")
+async def get_reconciliation(
+    society_id: str, period: str, status: str = None,
+    page: int = Query(1, ge=1), limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager", "committee", "auditor")),
+):
+    run = await db.reconciliations.find_one({"society_id": society_id, "period": period}, {"_id": 0})
+    if not run:
+        raise HTTPException(status_code=404, detail="No reconciliation for this period")
+    query = {"run_id": run["id"]}
+    if status:
+        query["status"] = status
+    items = await db.reconciliation_items.find(
+        query, {"_id": 0, "run_id": 0, "society_id": 0, "period": 0}
+    ).sort([("status", 1), ("line_no", 1)]).skip((page - 1) * limit).to_list(limit)
+    return {**run, "items": items}
@@ -1,43 +1,41 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, Depends
 from fastapi.responses import StreamingResponse
 from database import db
 from auth_utils import get_current_user
+from access import require_access
+from loaders import UserLoader, get_user_loader
 from models import MonthlySummary, CategorySpending
+from txn_dates import year_range
+from bill_status import status_expr
+from excel_stream import stream_workbook
 from datetime import datetime, timezone
 import io
 
 router = APIRouter(prefix="/api/societies/{society_id}/reports", tags=["Reports"])
 
-
-async def _verify(user_id, society_id):
-    q = {"user_id": user_id, "society_id": society_id, "status": "active"}
-    m = await db.memberships.find_one(q, {"_id": 0})
-    if not m:
-        raise HTTPException(status_code=403, detail="Not a member")
-    return m
+EXPORT_BATCH_SIZE = 1000
+EXPORT_PROJECTION = {
+    "_id": 0, "date": 1, "type": 1, "category": 1, "amount": 1,
+    "vendor_name": 1, "payment_mode": 1, "description": 1, "approval_status": 1,
+}
 
 
 @router.get("/monthly-summary")
 async def monthly_summary(society_id: str, year: int = None,
-                          current_user: dict = Depends(get_current_user)):
-    await _verify(current_user["sub"], society_id)
+                          current_user: dict = Depends(get_current_user),
+                          access: dict = Depends(require_access())):
     if not year:
         year = datetime.now(timezone.utc).year
 
-    txns = await db.transactions.find(
-        {"society_id": society_id, "approval_status": "approved"}, {"_id": 0}
-    ).to_list(50000)
+    rollups = await db.txn_rollups.find({"society_id": society_id, "year": year}, {"_id": 0}).to_list(None)
 
     monthly = {}
-    for t in txns:
-        date_str = t.get("date", t.get("created_at", ""))[:7]
-        if not date_str.startswith(str(year)):
-            continue
-        month = int(date_str[5:7])
+    for r in rollups:
+        month = r["month"]
         if month not in monthly:
             monthly[month] = {"inward": 0, "outward": 0, "count": 0}
-        monthly[month][t["type"]] += t["amount"]
-        monthly[month]["count"] += 1
+        monthly[month][r["type"]] += r["amount"]
+        monthly[month]["count"] += r["count"]
 
     result = []
     for m in range(1, 13):
@@ -54,27 +52,25 @@ async def monthly_summary(society_id: str, year: int = None,
 
 @router.get("/category-spending")
 async def category_spending(society_id: str, year: int = None, month: int = None,
-                            current_user: dict = Depends(get_current_user)):
-    await _verify(current_user["sub"], society_id)
-    query = {"society_id": society_id, "type": "outward", "approval_status": "approved"}
-
-    txns = await db.transactions.find(query, {"_id": 0}).to_list(50000)
-
-    # Filter by year/month if provided
+                            current_user: dict = Depends(get_current_user),
+                            access: dict = Depends(require_access())):
+    query = {"society_id": society_id, "type": "outward"}
     if year:
-        txns = [t for t in txns if t.get("date", t.get("created_at", ""))[:4] == str(year)]
+        query["year"] = year
     if month:
-        txns = [t for t in txns if t.get("date", t.get("created_at", ""))[5:7] == f"{month:02d}"]
+        query["month"] = month
+
+    rollups = await db.txn_rollups.find(query, {"_id": 0}).to_list(None)
 
     cats = {}
     total = 0
-    for t in txns:
-        cat = t["category"]
+    for r in rollups:
+        cat = r["category"]
         if cat not in cats:
             cats[cat] = {"total": 0, "count": 0}
-        cats[cat]["total"] += t["amount"]
-        cats[cat]["count"] += 1
-        total += t["amount"]
+        cats[cat]["total"] += r["amount"]
+        cats[cat]["count"] += r["count"]
+        total += r["amount"]
 
     result = []
     for cat, data in sorted(cats.items(), key=lambda x: -x[1]["total"]):
@@ -88,38 +84,49 @@ async def category_spending(society_id: str, year: int = None, month: int = None
 
 
 @router.get("/outstanding-dues")
-async def outstanding_dues(society_id: str, current_user: dict = Depends(get_current_user)):
-    await _verify(current_user["sub"], society_id)
-    bills = await db.maintenance_bills.find(
-        {"society_id": society_id, "status": {"$in": ["pending", "overdue", "partial"]}},
-        {"_id": 0},
-    ).to_list(5000)
+async def outstanding_dues(society_id: str, current_user: dict = Depends(get_current_user),
+                           access: dict = Depends(require_access()),
+                           users: UserLoader = Depends(get_user_loader)):
+    # Legacy bills carry their own late fee, due once the bill is effectively overdue
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    bills = await db.maintenance_bills.aggregate([
+        {"$match": {"society_id": society_id, "status": {"$in": ["pending", "overdue", "partial"]}}},
+        {"$project": {"_id": 0}},
+        {"$addFields": {"status": status_expr(today)}},
+        {"$addFields": {"outstanding": {"$subtract": [
+            {"$add": ["$amount", {"$cond": [{"$eq": ["$status", "overdue"]}, {"$ifNull": ["$late_fee", 0]}, 0]}]},
+            {"$ifNull": ["$paid_amount", 0]},
+        ]}}},
+    ]).to_list(5000)
+
+    flat_ids = list({b["flat_id"] for b in bills if b.get("flat_id")})
+    accounts = await db.member_accounts.find(
+        {"society_id": society_id, "flat_id": {"$in": flat_ids}}, {"_id": 0, "flat_id": 1, "balance": 1}
+    ).to_list(None)
+    balances = {a["flat_id"]: round(a["balance"], 2) for a in accounts}
+    names = await users.load_many(b.get("member_id", "") for b in bills)
 
     result = []
     for b in bills:
-        user = await db.users.find_one({"id": b.get("member_id", "")}, {"_id": 0})
+        user = names.get(b.get("member_id", ""))
         result.append({
             **b,
             "member_name": user["name"] if user else "Unassigned",
-            "outstanding": b["amount"] - b.get("paid_amount", 0),
+            "flat_balance": balances.get(b.get("flat_id"), 0),
         })
     return result
 
 
 @router.get("/annual-summary")
 async def annual_summary(society_id: str, year: int = None,
-                         current_user: dict = Depends(get_current_user)):
-    await _verify(current_user["sub"], society_id)
+                         current_user: dict = Depends(get_current_user),
+                         access: dict = Depends(require_access())):
     if not year:
         year = datetime.now(timezone.utc).year
 
-    txns = await db.transactions.find(
-        {"society_id": society_id, "approval_status": "approved"}, {"_id": 0}
-    ).to_list(50000)
-
-    year_txns = [t for t in txns if t.get("date", t.get("created_at", ""))[:4] == str(year)]
-    total_in = sum(t["amount"] for t in year_txns if t["type"] == "inward")
-    total_out = sum(t["amount"] for t in year_txns if t["type"] == "outward")
+    rollups = await db.txn_rollups.find({"society_id": society_id, "year": year}, {"_id": 0}).to_list(None)
+    total_in = sum(r["amount"] for r in rollups if r["type"] == "inward")
+    total_out = sum(r["amount"] for r in rollups if r["type"] == "outward")
 
     bills = await db.maintenance_bills.find(
         {"society_id": society_id, "year": year}, {"_id": 0}
@@ -135,41 +142,37 @@ async def annual_summary(society_id: str, year: int = None,
         "total_billed": total_billed,
         "total_collected": total_collected,
         "collection_rate": round(total_collected / total_billed * 100, 1) if total_billed > 0 else 0,
-        "transaction_count": len(year_txns),
+        "transaction_count": sum(r["count"] for r in rollups),
     }
 
 
 @router.get("/export/excel")
 async def export_excel(society_id: str, year: int = None,
-                       current_user: dict = Depends(get_current_user)):
-    await _verify(current_user["sub"], society_id)
+                       current_user: dict = Depends(get_current_user),
+                       access: dict = Depends(require_access())):
     if not year:
         year = datetime.now(timezone.utc).year
 
-    import openpyxl
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Transactions"
-    ws.append(["Date", "Type", "Category", "Amount", "Vendor", "Payment Mode", "Description", "Status"])
-
-    txns = await db.transactions.find({"society_id": society_id}, {"_id": 0}).sort("created_at", -1).to_list(50000)
-    year_txns = [t for t in txns if t.get("date", t.get("created_at", ""))[:4] == str(year)]
-
-    for t in year_txns:
-        ws.append([
-            t.get("date", ""), t["type"], t["category"], t["amount"],
-            t.get("vendor_name", ""), t.get("payment_mode", ""),
-            t.get("description", ""), t.get("approval_status", ""),
-        ])
-
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-
-    soc = await db.societies.find_one({"id": society_id}, {"_id": 0})
+    async def rows():
+        cursor = db.transactions.find(
+            {"society_id": society_id, "txn_date": year_range(year)}, EXPORT_PROJECTION,
+            batch_size=EXPORT_BATCH_SIZE,
+        ).sort("txn_date", -1)
+        while True:
+            txns = await cursor.to_list(EXPORT_BATCH_SIZE)
+            if not txns:
+                return
+            yield [[
+                t.get("date", ""), t["type"], t["category"], t["amount"],
+                t.get("vendor_name", ""), t.get("payment_mode", ""),
+                t.get("description", ""), t.get("approval_status", ""),
+            ] for t in txns]
+
+    soc = await db.societies.find_one({"id": society_id}, {"_id": 0, "name": 1})
     name = soc["name"].replace(" ", "_") if soc else "society"
+    header = ["Date", "Type", "Category", "Amount", "Vendor", "Payment Mode", "Description", "Status"]
     return StreamingResponse(
-        buf,
+        stream_workbook("Transactions", header, rows()),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": f"attachment; filename={name}_transactions_{year}.xlsx"},
     )
@@ -177,8 +180,8 @@ async def export_excel(society_id: str, year: int = None,
 
 @router.get("/export/pdf")
 async def export_pdf(society_id: str, year: int = None,
-                     current_user: dict = Depends(get_current_user)):
-    await _verify(current_user["sub"], society_id)
+                     current_user: dict = Depends(get_current_user),
+                     access: dict = Depends(require_access())):
     if not year:
         year = datetime.now(timezone.utc).year
 
@@ -198,11 +201,13 @@ async def export_pdf(society_id: str, year: int = None,
     elements.append(Paragraph(f"{soc_name} - Financial Report {year}", styles["Title"]))
     elements.append(Spacer(1, 20))
 
-    txns = await db.transactions.find({"society_id": society_id}, {"_id": 0}).sort("created_at", -1).to_list(50000)
-    year_txns = [t for t in txns if t.get("date", t.get("created_at", ""))[:4] == str(year)]
+    rollups = await db.txn_rollups.find({"society_id": society_id, "year": year}, {"_id": 0}).to_list(None)
+    total_in = sum(r["amount"] for r in rollups if r["type"] == "inward")
+    total_out = sum(r["amount"] for r in rollups if r["type"] == "outward")
 
-    total_in = sum(t["amount"] for t in year_txns if t["type"] == "inward")
-    total_out = sum(t["amount"] for t in year_txns if t["type"] == "outward")
+    year_txns = await db.transactions.find(
+        {"society_id": society_id, "txn_date": year_range(year)}, {"_id": 0}
+    ).sort("txn_date", -1).to_list(100)
 
     summary_data = [
         ["Total Income", f"Rs. {total_in:,.2f}"],
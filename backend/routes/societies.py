@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends
 from database import db
 from auth_utils import get_current_user
+from access import require_access, invalidate_access
+from loaders import UserLoader, get_user_loader
 from models import (
     SocietyCreate, SocietyResponse, SocietyWithRole, SocietyUpdate,
     FlatCreate, FlatResponse,
@@ -8,23 +10,13 @@ from models import (
     FlatMemberCreate, FlatMemberResponse,
     DashboardData,
 )
+import asyncio
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 router = APIRouter(prefix="/api/societies", tags=["Societies"])
 
 
-# ─── Helper: verify user belongs to society ──────────
-async def verify_membership(user_id: str, society_id: str, roles: list = None):
-    query = {"user_id": user_id, "society_id": society_id, "status": "active"}
-    m = await db.memberships.find_one(query, {"_id": 0})
-    if not m:
-        raise HTTPException(status_code=403, detail="Not a member of this society")
-    if roles and m["role"] not in roles:
-        raise HTTPException(status_code=403, detail="Insufficient permissions")
-    return m
-
-
 # ─── Society CRUD ────────────────────────────────────
 @router.get("/", response_model=list[SocietyWithRole])
 async def list_my_societies(current_user: dict = Depends(get_current_user)):
@@ -75,8 +67,8 @@ async def create_society(data: SocietyCreate, current_user: dict = Depends(get_c
 
 
 @router.get("/{society_id}")
-async def get_society(society_id: str, current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id)
+async def get_society(society_id: str, current_user: dict = Depends(get_current_user),
+                      access: dict = Depends(require_access())):
     soc = await db.societies.find_one({"id": society_id}, {"_id": 0})
     if not soc:
         raise HTTPException(status_code=404, detail="Society not found")
@@ -84,8 +76,8 @@ async def get_society(society_id: str, current_user: dict = Depends(get_current_
 
 
 @router.put("/{society_id}")
-async def update_society(society_id: str, data: SocietyUpdate, current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id, ["manager"])
+async def update_society(society_id: str, data: SocietyUpdate, current_user: dict = Depends(get_current_user),
+                         access: dict = Depends(require_access("manager"))):
     update = {}
     if data.name is not None:
         update["name"] = data.name
@@ -106,15 +98,15 @@ async def update_society(society_id: str, data: SocietyUpdate, current_user: dic
 
 # ─── Flats ───────────────────────────────────────────
 @router.get("/{society_id}/flats", response_model=list[FlatResponse])
-async def list_flats(society_id: str, current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id)
+async def list_flats(society_id: str, current_user: dict = Depends(get_current_user),
+                     access: dict = Depends(require_access())):
     flats = await db.flats.find({"society_id": society_id}, {"_id": 0}).to_list(1000)
     return [FlatResponse(**f) for f in flats]
 
 
 @router.post("/{society_id}/flats", response_model=FlatResponse)
-async def create_flat(society_id: str, data: FlatCreate, current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id, ["manager"])
+async def create_flat(society_id: str, data: FlatCreate, current_user: dict = Depends(get_current_user),
+                      access: dict = Depends(require_access("manager"))):
     flat_id = str(uuid.uuid4())
     flat_doc = {
         "id": flat_id,
@@ -131,12 +123,14 @@ async def create_flat(society_id: str, data: FlatCreate, current_user: dict = De
 
 # ─── Members / Memberships ──────────────────────────
 @router.get("/{society_id}/members", response_model=list[MembershipResponse])
-async def list_members(society_id: str, current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id)
+async def list_members(society_id: str, current_user: dict = Depends(get_current_user),
+                       access: dict = Depends(require_access()),
+                       users: UserLoader = Depends(get_user_loader)):
     mems = await db.memberships.find({"society_id": society_id}, {"_id": 0}).to_list(1000)
+    found = await users.load_many(m["user_id"] for m in mems)
     result = []
     for m in mems:
-        user = await db.users.find_one({"id": m["user_id"]}, {"_id": 0})
+        user = found.get(m["user_id"])
         result.append(MembershipResponse(
             id=m["id"], user_id=m["user_id"], society_id=m["society_id"],
             role=m["role"], status=m["status"],
@@ -146,8 +140,8 @@ async def list_members(society_id: str, current_user: dict = Depends(get_current
 
 
 @router.post("/{society_id}/members", response_model=MembershipResponse)
-async def add_member(society_id: str, data: MembershipCreate, current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id, ["manager"])
+async def add_member(society_id: str, data: MembershipCreate, current_user: dict = Depends(get_current_user),
+                     access: dict = Depends(require_access("manager"))):
     user = await db.users.find_one({"email": data.email}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found with that email")
@@ -168,6 +162,7 @@ async def add_member(society_id: str, data: MembershipCreate, current_user: dict
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
     await db.memberships.insert_one(mem_doc)
+    invalidate_access(society_id, user["id"])
     return MembershipResponse(
         id=mem_id, user_id=user["id"], society_id=society_id,
         role=data.role, status="active",
@@ -177,8 +172,8 @@ async def add_member(society_id: str, data: MembershipCreate, current_user: dict
 
 @router.put("/{society_id}/members/{membership_id}")
 async def update_membership(society_id: str, membership_id: str, role: str = None, status: str = None,
-                            current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id, ["manager"])
+                            current_user: dict = Depends(get_current_user),
+                            access: dict = Depends(require_access("manager"))):
     update = {}
     if role:
         update["role"] = role
@@ -186,18 +181,24 @@ async def update_membership(society_id: str, membership_id: str, role: str = Non
         update["status"] = status
     if not update:
         raise HTTPException(status_code=400, detail="Nothing to update")
-    await db.memberships.update_one({"id": membership_id}, {"$set": update})
+    mem = await db.memberships.find_one_and_update(
+        {"id": membership_id}, {"$set": update}, {"_id": 0, "user_id": 1}
+    )
+    if mem:
+        invalidate_access(society_id, mem["user_id"])
     return {"status": "updated"}
 
 
 # ─── Flat Members ────────────────────────────────────
 @router.get("/{society_id}/flats/{flat_id}/members", response_model=list[FlatMemberResponse])
-async def list_flat_members(society_id: str, flat_id: str, current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id)
+async def list_flat_members(society_id: str, flat_id: str, current_user: dict = Depends(get_current_user),
+                            access: dict = Depends(require_access()),
+                            users: UserLoader = Depends(get_user_loader)):
     fms = await db.flat_members.find({"flat_id": flat_id, "society_id": society_id}, {"_id": 0}).to_list(100)
+    found = await users.load_many(fm["user_id"] for fm in fms)
     result = []
     for fm in fms:
-        user = await db.users.find_one({"id": fm["user_id"]}, {"_id": 0})
+        user = found.get(fm["user_id"])
         result.append(FlatMemberResponse(
             id=fm["id"], flat_id=fm["flat_id"], user_id=fm["user_id"],
             society_id=fm["society_id"], relation_type=fm["relation_type"],
@@ -209,8 +210,9 @@ async def list_flat_members(society_id: str, flat_id: str, current_user: dict =
 
 @router.post("/{society_id}/flats/{flat_id}/members", response_model=FlatMemberResponse)
 async def add_flat_member(society_id: str, flat_id: str, data: FlatMemberCreate,
-                          current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id, ["manager"])
+                          current_user: dict = Depends(get_current_user),
+                          access: dict = Depends(require_access("manager")),
+                          users: UserLoader = Depends(get_user_loader)):
     fm_id = str(uuid.uuid4())
     fm_doc = {
         "id": fm_id,
@@ -221,7 +223,8 @@ async def add_flat_member(society_id: str, flat_id: str, data: FlatMemberCreate,
         "is_primary": data.is_primary,
     }
     await db.flat_members.insert_one(fm_doc)
-    user = await db.users.find_one({"id": data.user_id}, {"_id": 0})
+    invalidate_access(society_id, data.user_id)
+    user = await users.load(data.user_id)
     return FlatMemberResponse(
         **fm_doc,
         user_name=user["name"] if user else "",
@@ -231,65 +234,59 @@ async def add_flat_member(society_id: str, flat_id: str, data: FlatMemberCreate,
 
 @router.delete("/{society_id}/flats/{flat_id}/members/{fm_id}")
 async def remove_flat_member(society_id: str, flat_id: str, fm_id: str,
-                             current_user: dict = Depends(get_current_user)):
-    await verify_membership(current_user["sub"], society_id, ["manager"])
-    result = await db.flat_members.delete_one({"id": fm_id, "society_id": society_id})
-    if result.deleted_count == 0:
+                             current_user: dict = Depends(get_current_user),
+                             access: dict = Depends(require_access("manager"))):
+    fm = await db.flat_members.find_one_and_delete({"id": fm_id, "society_id": society_id}, {"_id": 0})
+    if not fm:
         raise HTTPException(status_code=404, detail="Flat member not found")
+    invalidate_access(society_id, fm["user_id"])
     return {"status": "removed"}
 
 
 # ─── Dashboard ───────────────────────────────────────
 @router.get("/{society_id}/dashboard", response_model=DashboardData)
-async def get_dashboard(society_id: str, current_user: dict = Depends(get_current_user)):
-    membership = await verify_membership(current_user["sub"], society_id)
-
-    # Aggregate totals
-    inward_txns = await db.transactions.find(
-        {"society_id": society_id, "type": "inward", "approval_status": "approved"}, {"_id": 0}
-    ).to_list(10000)
-    outward_txns = await db.transactions.find(
-        {"society_id": society_id, "type": "outward", "approval_status": "approved"}, {"_id": 0}
-    ).to_list(10000)
-
-    total_inward = sum(t["amount"] for t in inward_txns)
-    total_outward = sum(t["amount"] for t in outward_txns)
-
-    # Recent transactions
-    recent = await db.transactions.find(
-        {"society_id": society_id}, {"_id": 0}
-    ).sort("created_at", -1).to_list(10)
-
-    # Pending dues
-    pending_bills = await db.maintenance_bills.count_documents(
-        {"society_id": society_id, "status": {"$in": ["pending", "overdue"]}}
-    )
-
-    # Pending approvals
-    pending_approvals = await db.approvals.count_documents(
-        {"society_id": society_id, "status": "pending"}
-    )
-
-    # Member & flat count
-    member_count = await db.memberships.count_documents({"society_id": society_id, "status": "active"})
-    flat_count = await db.flats.count_documents({"society_id": society_id})
-
-    # Monthly trend (last 6 months)
-    from datetime import timedelta
+async def get_dashboard(society_id: str, current_user: dict = Depends(get_current_user),
+                        access: dict = Depends(require_access())):
     now = datetime.now(timezone.utc)
-    monthly_trend = []
+    trend_months = []
     for i in range(5, -1, -1):
         d = now - timedelta(days=30 * i)
-        m, y = d.month, d.year
-        m_in = sum(
-            t["amount"] for t in inward_txns
-            if t.get("date", t.get("created_at", ""))[:7] == f"{y}-{m:02d}"
-        )
-        m_out = sum(
-            t["amount"] for t in outward_txns
-            if t.get("date", t.get("created_at", ""))[:7] == f"{y}-{m:02d}"
-        )
-        monthly_trend.append({"month": f"{y}-{m:02d}", "inward": m_in, "outward": m_out})
+        trend_months.append((d.year, d.month))
+
+    # Totals and monthly trend from the monthly rollups
+    pipeline = [
+        {"$match": {"society_id": society_id}},
+        {"$facet": {
+            "totals": [
+                {"$group": {"_id": "$type", "total": {"$sum": "$amount"}}},
+            ],
+            "trend": [
+                {"$match": {"$or": [{"year": y, "month": m} for y, m in trend_months]}},
+                {"$group": {"_id": {"year": "$year", "month": "$month", "type": "$type"}, "total": {"$sum": "$amount"}}},
+            ],
+        }},
+    ]
+    facets, recent, pending_bills, pending_approvals, member_count, flat_count = await asyncio.gather(
+        db.txn_rollups.aggregate(pipeline).to_list(1),
+        db.transactions.find({"society_id": society_id}, {"_id": 0}).sort("created_at", -1).to_list(10),
+        db.maintenance_bills.count_documents(
+            {"society_id": society_id, "status": {"$in": ["pending", "overdue"]}}
+        ),
+        db.approvals.count_documents({"society_id": society_id, "status": "pending"}),
+        db.memberships.count_documents({"society_id": society_id, "status": "active"}),
+        db.flats.count_documents({"society_id": society_id}),
+    )
+    facets = facets[0]
+
+    totals = {row["_id"]: row["total"] for row in facets["totals"]}
+    total_inward = totals.get("inward", 0)
+    total_outward = totals.get("outward", 0)
+
+    trend = {(row["_id"]["year"], row["_id"]["month"], row["_id"]["type"]): row["total"] for row in facets["trend"]}
+    monthly_trend = [
+        {"month": f"{y}-{m:02d}", "inward": trend.get((y, m, "inward"), 0), "outward": trend.get((y, m, "outward"), 0)}
+        for y, m in trend_months
+    ]
 
     return DashboardData(
         society_balance=total_inward - total_outward,
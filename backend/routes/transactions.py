@@ -1,7 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query, Response
 from database import db
 from auth_utils import get_current_user
+from access import require_access
+from loaders import UserLoader, get_user_loader
+from pagination import KEYSET_SORT, after_cursor, set_next_cursor
+from rollups import record_transaction
+from txn_dates import date_fields
 from models import TransactionCreate, TransactionResponse
+from outbox import notification
+import outbox
 import uuid
 from datetime import datetime, timezone
 import os
@@ -24,16 +31,6 @@ OUTWARD_CATEGORIES = [
 ]
 
 
-async def _verify_membership(user_id, society_id, roles=None):
-    q = {"user_id": user_id, "society_id": society_id, "status": "active"}
-    m = await db.memberships.find_one(q, {"_id": 0})
-    if not m:
-        raise HTTPException(status_code=403, detail="Not a member of this society")
-    if roles and m["role"] not in roles:
-        raise HTTPException(status_code=403, detail="Insufficient permissions")
-    return m
-
-
 @router.get("/categories")
 async def get_categories():
     return {"inward": INWARD_CATEGORIES, "outward": OUTWARD_CATEGORIES}
@@ -46,21 +43,31 @@ async def list_transactions(
     category: str = None,
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    response: Response = None,
     current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access()),
+    users: UserLoader = Depends(get_user_loader),
 ):
-    await _verify_membership(current_user["sub"], society_id)
     query = {"society_id": society_id}
     if type:
         query["type"] = type
     if category:
         query["category"] = category
 
-    skip = (page - 1) * limit
-    txns = await db.transactions.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).to_list(limit)
+    # Keyset pagination when a cursor is given; offset pages keep working
+    skip = 0
+    if cursor:
+        query = after_cursor(query, cursor)
+    else:
+        skip = (page - 1) * limit
+    txns = await db.transactions.find(query, {"_id": 0}).sort(KEYSET_SORT).skip(skip).to_list(limit)
+    set_next_cursor(response, txns, limit)
 
+    names = await users.load_many(t["created_by"] for t in txns)
     result = []
     for t in txns:
-        user = await db.users.find_one({"id": t["created_by"]}, {"_id": 0})
+        user = names.get(t["created_by"])
         result.append(TransactionResponse(
             **t,
             created_by_name=user["name"] if user else "",
@@ -74,8 +81,8 @@ async def count_transactions(
     type: str = None,
     category: str = None,
     current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access()),
 ):
-    await _verify_membership(current_user["sub"], society_id)
     query = {"society_id": society_id}
     if type:
         query["type"] = type
@@ -90,8 +97,8 @@ async def create_transaction(
     society_id: str,
     data: TransactionCreate,
     current_user: dict = Depends(get_current_user),
+    access: dict = Depends(require_access("manager")),
 ):
-    await _verify_membership(current_user["sub"], society_id, ["manager"])
     now = datetime.now(timezone.utc).isoformat()
     txn_id = str(uuid.uuid4())
 
@@ -114,11 +121,13 @@ async def create_transaction(
         "payment_mode": data.payment_mode,
         "invoice_path": data.invoice_path,
         "date": data.date or now[:10],
+        **date_fields(data.date, now),
         "created_by": current_user["sub"],
         "created_at": now,
         "approval_status": approval_status,
     }
     await db.transactions.insert_one(txn_doc)
+    await record_transaction(txn_doc)
 
     # Create approval request if pending
     if approval_status == "pending":
@@ -137,17 +146,12 @@ async def create_transaction(
         committee = await db.memberships.find(
             {"society_id": society_id, "role": "committee", "status": "active"}, {"_id": 0}
         ).to_list(100)
-        for cm in committee:
-            await db.notifications.insert_one({
-                "id": str(uuid.uuid4()),
-                "society_id": society_id,
-                "user_id": cm["user_id"],
-                "title": "Expense Approval Required",
-                "message": f"New expense of Rs.{data.amount:,.0f} for {data.category} needs approval",
-                "type": "approval",
-                "read": False,
-                "created_at": now,
-            })
+        outbox.enqueue(*(
+            notification(society_id, cm["user_id"], "Expense Approval Required",
+                         f"New expense of Rs.{data.amount:,.0f} for {data.category} needs approval",
+                         "approval", now)
+            for cm in committee
+        ))
 
     return TransactionResponse(
         **{k: v for k, v in txn_doc.items() if k != "_id"},
@@ -156,20 +160,20 @@ async def create_transaction(
 
 
 @router.get("/{txn_id}", response_model=TransactionResponse)
-async def get_transaction(society_id: str, txn_id: str, current_user: dict = Depends(get_current_user)):
-    await _verify_membership(current_user["sub"], society_id)
+async def get_transaction(society_id: str, txn_id: str, current_user: dict = Depends(get_current_user),
+                          access: dict = Depends(require_access()),
+                          users: UserLoader = Depends(get_user_loader)):
     txn = await db.transactions.find_one({"id": txn_id, "society_id": society_id}, {"_id": 0})
     if not txn:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    user = await db.users.find_one({"id": txn["created_by"]}, {"_id": 0})
-    return TransactionResponse(**txn, created_by_name=user["name"] if user else "")
+    return TransactionResponse(**txn, created_by_name=await users.name(txn["created_by"]))
 
 
 # ─── File Upload ─────────────────────────────────────
 @router.post("/upload")
 async def upload_invoice(society_id: str, file: UploadFile = File(...),
-                         current_user: dict = Depends(get_current_user)):
-    await _verify_membership(current_user["sub"], society_id, ["manager"])
+                         current_user: dict = Depends(get_current_user),
+                         access: dict = Depends(require_access("manager"))):
     ext = os.path.splitext(file.filename)[1]
     filename = f"{uuid.uuid4()}{ext}"
     filepath = os.path.join(UPLOAD_DIR, filename)
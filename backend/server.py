@@ -5,12 +5,22 @@ import os
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Depends
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from starlette.middleware.cors import CORSMiddleware
 from database import db, client
-from auth_utils import hash_password
+from auth_utils import hash_password_async, password_pool_stats, shutdown_password_pool, token_cache_stats
+from counters import financial_year
+from access import invalidate_access, require_admin
+from rollups import record_transactions
+from indexes import ensure_indexes
+from txn_dates import date_fields, backfill as backfill_txn_dates
+import jobs
+import outbox
+import pubsub
+from unread import add_unread
+import asyncio
 import logging
 import uuid
 from datetime import datetime, timezone, timedelta
@@ -25,6 +35,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Logging
@@ -39,6 +50,7 @@ from routes.maintenance import router as maintenance_router
 from routes.approvals import router as approvals_router
 from routes.reports import router as reports_router
 from routes.notifications import router as notifications_router
+from routes.reconciliation import router as reconciliation_router
 
 app.include_router(auth_router)
 app.include_router(societies_router)
@@ -47,6 +59,7 @@ app.include_router(maintenance_router)
 app.include_router(approvals_router)
 app.include_router(reports_router)
 app.include_router(notifications_router)
+app.include_router(reconciliation_router)
 
 # Static file serving for uploads
 UPLOAD_DIR = ROOT_DIR / "uploads"
@@ -67,6 +80,11 @@ async def root():
     return {"message": "Society Financial Manager API", "version": "1.0.0"}
 
 
+@app.get("/api/metrics")
+async def metrics(admin: dict = Depends(require_admin)):
+    return {"password_pool": password_pool_stats(), "token_cache": token_cache_stats()}
+
+
 # ─── Seed Demo Data ──────────────────────────────────
 @app.post("/api/seed")
 async def seed_demo_data():
@@ -74,29 +92,33 @@ async def seed_demo_data():
     for col in ["users", "societies", "memberships", "flats", "flat_members",
                 "transactions", "maintenance_bills", "maintenance_bills_v2", 
                 "maintenance_settings", "discount_schemes", "maintenance_payments",
-                "member_ledger", "approvals", "notifications"]:
+                "member_ledger", "member_accounts", "approvals", "notifications", "counters",
+                "txn_rollups", "reconciliations", "reconciliation_items", "jobs",
+                "notification_counters"]:
         await db[col].delete_many({})
+    invalidate_access()
 
     now = datetime.now(timezone.utc)
 
     # ─── Users ───────────────────────────────────────
+    password_hashes = await asyncio.gather(*(hash_password_async("password123") for _ in range(8)))
     users = [
         {"id": str(uuid.uuid4()), "name": "Vikram Sharma", "email": "vikram@demo.com",
-         "phone": "9876543210", "password_hash": hash_password("password123"), "created_at": now.isoformat()},
+         "phone": "9876543210", "password_hash": password_hashes[0], "created_at": now.isoformat()},
         {"id": str(uuid.uuid4()), "name": "Priya Patel", "email": "priya@demo.com",
-         "phone": "9876543211", "password_hash": hash_password("password123"), "created_at": now.isoformat()},
+         "phone": "9876543211", "password_hash": password_hashes[1], "created_at": now.isoformat()},
         {"id": str(uuid.uuid4()), "name": "Rajesh Kumar", "email": "rajesh@demo.com",
-         "phone": "9876543212", "password_hash": hash_password("password123"), "created_at": now.isoformat()},
+         "phone": "9876543212", "password_hash": password_hashes[2], "created_at": now.isoformat()},
         {"id": str(uuid.uuid4()), "name": "Anita Desai", "email": "anita@demo.com",
-         "phone": "9876543213", "password_hash": hash_password("password123"), "created_at": now.isoformat()},
+         "phone": "9876543213", "password_hash": password_hashes[3], "created_at": now.isoformat()},
         {"id": str(uuid.uuid4()), "name": "Suresh Gupta", "email": "suresh@demo.com",
-         "phone": "9876543214", "password_hash": hash_password("password123"), "created_at": now.isoformat()},
+         "phone": "9876543214", "password_hash": password_hashes[4], "created_at": now.isoformat()},
         {"id": str(uuid.uuid4()), "name": "Meera Joshi", "email": "meera@demo.com",
-         "phone": "9876543215", "password_hash": hash_password("password123"), "created_at": now.isoformat()},
+         "phone": "9876543215", "password_hash": password_hashes[5], "created_at": now.isoformat()},
         {"id": str(uuid.uuid4()), "name": "Amit Singh", "email": "amit@demo.com",
-         "phone": "9876543216", "password_hash": hash_password("password123"), "created_at": now.isoformat()},
+         "phone": "9876543216", "password_hash": password_hashes[6], "created_at": now.isoformat()},
         {"id": str(uuid.uuid4()), "name": "Kavita Reddy", "email": "kavita@demo.com",
-         "phone": "9876543217", "password_hash": hash_password("password123"), "created_at": now.isoformat()},
+         "phone": "9876543217", "password_hash": password_hashes[7], "created_at": now.isoformat()},
     ]
     await db.users.insert_many(users)
     logger.info(f"Seeded {len(users)} users")
@@ -209,6 +231,7 @@ async def seed_demo_data():
             "payment_mode": random.choice(payment_modes),
             "invoice_path": "",
             "date": date_str,
+            **date_fields(date_str),
             "created_by": users[0]["id"],
             "created_at": txn_date.isoformat(),
             "approval_status": "approved",
@@ -228,6 +251,7 @@ async def seed_demo_data():
             "payment_mode": "bank",
             "invoice_path": "",
             "date": now.strftime("%Y-%m-%d"),
+            **date_fields(now.strftime("%Y-%m-%d")),
             "created_by": users[0]["id"],
             "created_at": now.isoformat(),
             "approval_status": "pending",
@@ -235,6 +259,7 @@ async def seed_demo_data():
         transactions.append(txn)
 
     await db.transactions.insert_many(transactions)
+    await record_transactions(transactions)
 
     # ─── Approvals for pending transactions ──────────
     pending_txns = [t for t in transactions if t["approval_status"] == "pending"]
@@ -347,6 +372,7 @@ async def seed_demo_data():
     # ─── V2 Maintenance Bills with Ledger Entries ─────
     bills_v2 = []
     ledger_entries = []
+    member_accounts = []
     payments = []
     
     for idx, flat in enumerate(flats_s1[:5]):
@@ -354,6 +380,7 @@ async def seed_demo_data():
         area_sqft = flat.get("area_sqft", 1000)
         rate = 5.0
         monthly_amount = area_sqft * rate
+        balance, seq = 0, 0
         
         for m in [1, 2]:
             bill_id = str(uuid.uuid4())
@@ -388,6 +415,8 @@ async def seed_demo_data():
             
             # Ledger entry for bill generation (debit)
             ledger_id = str(uuid.uuid4())
+            balance += monthly_amount
+            seq += 1
             ledger_entries.append({
                 "id": ledger_id,
                 "society_id": soc1_id,
@@ -399,15 +428,16 @@ async def seed_demo_data():
                 "reference_type": "bill",
                 "debit_amount": monthly_amount,
                 "credit_amount": 0,
-                "balance_after_entry": monthly_amount * m if not is_paid else monthly_amount,
+                "balance_after_entry": balance,
+                "seq": seq,
                 "notes": f"Maintenance bill for {m}/2026",
             })
             
             # Payment entry for paid bills
             if is_paid:
                 payment_id = str(uuid.uuid4())
-                receipt_num = f"RCP-2026-{(idx * 2) + m:05d}"
                 payment_date = datetime(2026, m, 5, tzinfo=timezone.utc)
+                receipt_num = f"RCP-{financial_year(payment_date.date())}-{len(payments) + 1:05d}"
                 
                 payments.append({
                     "id": payment_id,
@@ -421,13 +451,15 @@ async def seed_demo_data():
                     "payment_mode": random.choice(["upi", "bank", "cash"]),
                     "payment_date": payment_date.strftime("%Y-%m-%d"),
                     "receipt_number": receipt_num,
-                    "transaction_reference": f"TXN{random.randint(100000, 999999)}",
+                    "transaction_reference": f"TXN{uuid.uuid4().hex[:10].upper()}",
                     "remarks": "",
                     "created_at": payment_date.isoformat(),
                     "created_by": users[0]["id"],
                 })
                 
                 # Ledger entry for payment (credit)
+                balance -= monthly_amount
+                seq += 1
                 ledger_entries.append({
                     "id": str(uuid.uuid4()),
                     "society_id": soc1_id,
@@ -439,16 +471,26 @@ async def seed_demo_data():
                     "reference_type": "payment",
                     "debit_amount": 0,
                     "credit_amount": monthly_amount,
-                    "balance_after_entry": 0,
+                    "balance_after_entry": balance,
+                    "seq": seq,
                     "notes": f"Payment via {payments[-1]['payment_mode']} - {receipt_num}",
                 })
+        
+        member_accounts.append({
+            "society_id": soc1_id, "flat_id": flat["id"], "balance": balance, "seq": seq,
+        })
     
     if bills_v2:
         await db.maintenance_bills_v2.insert_many(bills_v2)
     if ledger_entries:
         await db.member_ledger.insert_many(ledger_entries)
+    if member_accounts:
+        await db.member_accounts.insert_many(member_accounts)
     if payments:
         await db.maintenance_payments.insert_many(payments)
+        await db.counters.insert_one({
+            "society_id": soc1_id, "name": "receipt", "period": "2025-26", "seq": len(payments),
+        })
 
     # ─── Notifications ───────────────────────────────
     notifications = [
@@ -466,24 +508,10 @@ async def seed_demo_data():
          "type": "approval", "read": False, "created_at": now.isoformat()},
     ]
     await db.notifications.insert_many(notifications)
+    await add_unread(notifications)
 
-    # Create indexes
-    await db.users.create_index("email", unique=True)
-    await db.users.create_index("id", unique=True)
-    await db.societies.create_index("id", unique=True)
-    await db.memberships.create_index([("user_id", 1), ("society_id", 1)])
-    await db.flats.create_index([("society_id", 1)])
-    await db.flat_members.create_index([("flat_id", 1), ("society_id", 1)])
-    await db.transactions.create_index([("society_id", 1), ("created_at", -1)])
-    await db.maintenance_bills.create_index([("society_id", 1), ("month", 1), ("year", 1)])
-    await db.maintenance_bills_v2.create_index([("society_id", 1), ("year", 1), ("month", 1)])
-    await db.maintenance_bills_v2.create_index([("society_id", 1), ("flat_id", 1)])
-    await db.maintenance_settings.create_index([("society_id", 1)], unique=True)
-    await db.discount_schemes.create_index([("society_id", 1)])
-    await db.maintenance_payments.create_index([("society_id", 1), ("created_at", -1)])
-    await db.member_ledger.create_index([("society_id", 1), ("flat_id", 1), ("entry_date", -1)])
-    await db.approvals.create_index([("society_id", 1), ("status", 1)])
-    await db.notifications.create_index([("user_id", 1), ("read", 1)])
+    # Indexes survive delete_many, but a fresh database needs them
+    await ensure_indexes()
 
     return {
         "status": "success",
@@ -509,6 +537,55 @@ async def seed_demo_data():
     }
 
 
+@app.on_event("startup")
+async def bootstrap_indexes():
+    try:
+        await ensure_indexes()
+    except Exception:
+        logger.exception("Index bootstrap failed")
+
+
+_background_tasks = set()
+
+
+async def _backfill_txn_dates():
+    try:
+        count = await backfill_txn_dates()
+        if count:
+            logger.info(f"Backfilled date fields on {count} transactions")
+    except Exception:
+        logger.exception("Transaction date backfill failed")
+
+
+@app.on_event("startup")
+async def start_txn_date_backfill():
+    task = asyncio.create_task(_backfill_txn_dates())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("startup")
+async def start_job_worker():
+    task = asyncio.create_task(jobs.worker_loop())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("startup")
+async def start_notification_writer():
+    outbox.start()
+    if pubsub.NOTIFY_CHANGE_STREAM:
+        task = asyncio.create_task(pubsub.watch_changes())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in list(_background_tasks):
+        task.cancel()
+    jobs.shutdown()
+    await outbox.shutdown()
+    pubsub.close_all()
     client.close()
+    shutdown_password_pool()
@@ -5,6 +5,8 @@ Tests: Maintenance Settings, Discount Schemes, Bill Generation, Payments, Ledger
 import pytest
 import requests
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
@@ -332,8 +334,19 @@ class TestBillPreviewAndGeneration:
             "discount_scheme_id": None
         }
         response = manager_client.post(f"{BASE_URL}/api/societies/{society_id}/maintenance/bills/generate", json=generate_data)
-        assert response.status_code == 200
-        data = response.json()
+        assert response.status_code == 202
+        job = response.json()
+        assert "job_id" in job
+        
+        # Poll the job until it finishes
+        for _ in range(60):
+            job = manager_client.get(f"{BASE_URL}/api/societies/{society_id}/maintenance/jobs/{job['id']}").json()
+            if job["status"] not in ("queued", "running"):
+                break
+            time.sleep(1)
+        assert job["status"] == "completed"
+        assert job["progress"]["processed_flats"] == job["progress"]["total_flats"]
+        data = job["result"]
         
         # Validate response
         assert data["status"] == "success"
@@ -535,6 +548,40 @@ class TestPayments:
             assert "payment_date" in payment
 
 
+class TestPaymentImport:
+    """Bulk payment import tests - POST /api/societies/{id}/maintenance/payments/import"""
+    
+    def test_import_is_idempotent_on_reference(self, manager_client, society_id, flat_id):
+        """Test re-uploading the same statement skips already recorded references"""
+        flats = manager_client.get(f"{BASE_URL}/api/societies/{society_id}/flats").json()
+        flat_number = next(f["flat_number"] for f in flats if f["id"] == flat_id)
+        reference = f"TEST_UTR_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        statement = f"flat,amount,date,mode,reference\n{flat_number},500,{datetime.now().strftime('%Y-%m-%d')},upi,{reference}\n"
+        files = {"file": ("statement.csv", statement, "text/csv")}
+        
+        response = manager_client.post(f"{BASE_URL}/api/societies/{society_id}/maintenance/payments/import", files=files, headers={"Content-Type": None})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["imported"] == 1
+        assert data["total_amount"] == 500
+        
+        response = manager_client.post(f"{BASE_URL}/api/societies/{society_id}/maintenance/payments/import", files=files, headers={"Content-Type": None})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["imported"] == 0
+        assert data["skipped"] == [reference]
+        print(f"✓ Statement import recorded once for {reference}")
+    
+    def test_import_rejects_invalid_rows(self, manager_client, society_id):
+        """Test a statement with an unknown flat is rejected before anything is written"""
+        statement = "flat,amount,reference\nNO-SUCH-FLAT,500,TEST_BAD_ROW\n"
+        files = {"file": ("statement.csv", statement, "text/csv")}
+        response = manager_client.post(f"{BASE_URL}/api/societies/{society_id}/maintenance/payments/import", files=files, headers={"Content-Type": None})
+        assert response.status_code == 400
+        assert "Row 1" in response.json()["detail"]
+        print("✓ Invalid statement rejected")
+
+
 class TestLedger:
     """Ledger API tests - GET /api/societies/{id}/maintenance/ledger/{flat_id}"""
     
@@ -686,5 +733,143 @@ class TestOverdueProcessing:
         print(f"✓ Overdue processing completed: {data['overdue_bills_processed']} bills processed")
 
 
+class TestCursorPagination:
+    """Keyset pagination tests - X-Next-Cursor on bills and payments listings"""
+    
+    def _walk(self, client, url, limit):
+        ids, pages, cursor = [], 0, None
+        while pages < 100:
+            params = {"limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get(url, params=params)
+            assert response.status_code == 200
+            page = response.json()
+            ids += [item["id"] for item in page]
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            assert len(page) == limit
+        return ids, pages
+    
+    @pytest.mark.parametrize("listing", ["bills", "payments"])
+    def test_cursor_walk_has_no_duplicates_or_gaps(self, manager_client, society_id, listing):
+        """Test following X-Next-Cursor visits every row exactly once, in the offset order"""
+        url = f"{BASE_URL}/api/societies/{society_id}/maintenance/{listing}"
+        full = manager_client.get(url, params={"limit": 200}).json()
+        if len(full) < 4 or len(full) == 200:
+            pytest.skip(f"Need between 4 and 199 {listing} to compare against one full page")
+        
+        limit = max(2, len(full) // 3)
+        ids, pages = self._walk(manager_client, url, limit)
+        assert len(ids) == len(set(ids)), "a row appeared on two pages"
+        assert ids == [item["id"] for item in full], "cursor pages differ from the full listing"
+        assert pages >= 3
+        print(f"✓ {listing}: {len(ids)} rows over {pages} cursor pages, no duplicates or gaps")
+    
+    def test_last_page_has_no_cursor(self, manager_client, society_id):
+        """Test a page shorter than the limit carries no X-Next-Cursor"""
+        response = manager_client.get(f"{BASE_URL}/api/societies/{society_id}/maintenance/bills", params={"limit": 200})
+        assert response.status_code == 200
+        if len(response.json()) == 200:
+            pytest.skip("More than one page of bills")
+        assert "X-Next-Cursor" not in response.headers
+        print("✓ Last page has no cursor")
+    
+    def test_invalid_cursor_rejected(self, manager_client, society_id):
+        """Test a malformed cursor is a 400, not a 500"""
+        response = manager_client.get(
+            f"{BASE_URL}/api/societies/{society_id}/maintenance/bills", params={"cursor": "not-a-cursor"}
+        )
+        assert response.status_code == 400
+        print("✓ Invalid cursor rejected")
+
+
+class TestConcurrentPayments:
+    """Parallel payments against one bill - allocation must never exceed what is due"""
+    
+    def test_parallel_payments_do_not_over_allocate(self, manager_client, society_id):
+        """Test several payments racing for the same bill settle it exactly once"""
+        bills = manager_client.get(f"{BASE_URL}/api/societies/{society_id}/maintenance/bills?status=pending").json()
+        bill = next((b for b in bills if b["final_payable_amount"] - b.get("paid_amount", 0) >= 10), None)
+        if bill is None:
+            pytest.skip("No pending bill to pay")
+        due = round(bill["final_payable_amount"] - bill.get("paid_amount", 0), 2)
+        # Five payments of half the due amount: at most two fit
+        part = round(due / 2, 2)
+        url = f"{BASE_URL}/api/societies/{society_id}/maintenance/payments"
+        headers = dict(manager_client.headers)
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        
+        def pay(i):
+            return requests.post(url, headers=headers, json={
+                "flat_id": bill["flat_id"],
+                "bill_ids": [bill["id"]],
+                "amount_paid": part,
+                "payment_mode": "upi",
+                "payment_date": datetime.now().strftime("%Y-%m-%d"),
+                "transaction_reference": f"TEST_PARALLEL_{stamp}_{i}",
+            })
+        
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            responses = list(pool.map(pay, range(5)))
+        assert all(r.status_code == 200 for r in responses), [r.text for r in responses if r.status_code != 200]
+        
+        updated = manager_client.get(f"{BASE_URL}/api/societies/{society_id}/maintenance/bills/{bill['id']}").json()
+        assert updated["paid_amount"] <= updated["final_payable_amount"] + 0.01, "bill over-allocated"
+        assert abs(updated["paid_amount"] - updated["final_payable_amount"]) <= 0.01
+        assert updated["status"] == "paid"
+        print(f"✓ 5 parallel payments of ₹{part} settled a ₹{due} bill without over-allocation")
+
+
+class TestReceiptNumbering:
+    """Receipt numbers - one sequence per financial year (April-March)"""
+    
+    def _pay(self, client, society_id, flat_id, payment_date):
+        response = client.post(f"{BASE_URL}/api/societies/{society_id}/maintenance/payments", json={
+            "flat_id": flat_id,
+            "bill_ids": [],
+            "amount_paid": 1,
+            "payment_mode": "cash",
+            "payment_date": payment_date,
+            "transaction_reference": "CASH",
+            "remarks": "Test receipt numbering",
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["receipt_number"]
+    
+    def _split(self, receipt):
+        prefix, fy_start, fy_end, number = receipt.split("-")
+        assert prefix == "RCP"
+        return f"{fy_start}-{fy_end}", int(number)
+    
+    def test_receipts_follow_financial_year(self, manager_client, society_id, flat_id):
+        """Test 31 March and 1 April payments draw from different financial years"""
+        march = self._split(self._pay(manager_client, society_id, flat_id, "2025-03-31"))
+        april = self._split(self._pay(manager_client, society_id, flat_id, "2025-04-01"))
+        assert march[0] == "2024-25"
+        assert april[0] == "2025-26"
+        print(f"✓ 2025-03-31 -> FY {march[0]} #{march[1]}, 2025-04-01 -> FY {april[0]} #{april[1]}")
+    
+    def test_numbers_are_consecutive_within_a_year(self, manager_client, society_id, flat_id):
+        """Test a payment in another year does not take a number from this year's sequence"""
+        first = self._split(self._pay(manager_client, society_id, flat_id, "2025-04-02"))
+        other = self._split(self._pay(manager_client, society_id, flat_id, "2025-03-30"))
+        second = self._split(self._pay(manager_client, society_id, flat_id, "2026-03-31"))
+        assert first[0] == second[0] == "2025-26"
+        assert other[0] == "2024-25"
+        assert second[1] == first[1] + 1
+        print(f"✓ FY 2025-26 receipts #{first[1]} and #{second[1]} are consecutive")
+    
+    def test_manual_payments_may_share_a_reference(self, manager_client, society_id, flat_id):
+        """Test manual payments reusing a reference such as CASH are both recorded"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        first = self._pay(manager_client, society_id, flat_id, today)
+        second = self._pay(manager_client, society_id, flat_id, today)
+        assert first != second
+        print(f"✓ Two CASH payments recorded as {first} and {second}")
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,154 @@
+"""
+Tests for bank statement matching (reconciliation.match and parse_statement)
+Tests: Exact reference match, Fuzzy amount/date match, Ties, Matching window, Unreadable lines
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from reconciliation import match, parse_statement  # noqa: E402
+
+
+def line(line_no, date, amount, reference=""):
+    return {"line_no": line_no, "date": date, "amount": amount, "reference": reference, "description": ""}
+
+
+def record(id, date, amount, reference=""):
+    return {"id": id, "kind": "payment", "date": date, "amount": amount, "reference": reference, "label": id}
+
+
+class TestExactMatch:
+    """Pass 1 - lines and records with the same reference"""
+
+    def test_reference_match_ignores_date_and_formatting(self):
+        """Test a reference match is made even far outside the date window"""
+        result = match([line(1, "2024-05-01", 1500, "utr 123 456")],
+                       [record("p1", "2024-06-20", 1500, "UTR123456")])
+        assert [(l["line_no"], r["id"], m) for l, r, m in result["matched"]] == [(1, "p1", "reference")]
+        assert result["unmatched_lines"] == [] and result["unmatched_records"] == []
+        print("✓ Reference match ignores date and formatting")
+
+    def test_reference_match_requires_same_direction(self):
+        """Test a debit line does not take a credit record with the same reference"""
+        result = match([line(1, "2024-05-01", -1500, "REF1")], [record("p1", "2024-05-01", 1500, "REF1")])
+        assert result["matched"] == []
+        assert len(result["unmatched_lines"]) == 1 and len(result["unmatched_records"]) == 1
+        print("✓ Reference match requires the same direction")
+
+
+class TestFuzzyMatch:
+    """Pass 2 - same amount, closest date within the window"""
+
+    def test_closest_date_wins(self):
+        """Test the record closest in date is matched"""
+        records = [record("far", "2024-05-01", 1000), record("near", "2024-05-04", 1000)]
+        result = match([line(1, "2024-05-05", 1000)], records)
+        assert [(r["id"], m) for _, r, m in result["matched"]] == [("near", "amount_date")]
+        assert [r["id"] for r in result["unmatched_records"]] == ["far"]
+        print("✓ Closest date wins")
+
+    def test_used_records_are_not_matched_twice(self):
+        """Test a used record is skipped and the next closest unused one is taken"""
+        records = [record("a", "2024-05-08", 500), record("b", "2024-05-10", 500)]
+        lines = [line(1, "2024-05-10", 500), line(2, "2024-05-10", 500), line(3, "2024-05-10", 500)]
+        result = match(lines, records)
+        assert [(l["line_no"], r["id"]) for l, r, _ in result["matched"]] == [(1, "b"), (2, "a")]
+        assert [l["line_no"] for l in result["unmatched_lines"]] == [3]
+        print("✓ Records are matched at most once")
+
+    def test_many_lines_same_amount(self):
+        """Test a long run of identical amounts pairs off one-to-one in date order"""
+        records = [record(f"p{d}", f"2024-05-{d:02d}", 2500) for d in range(1, 29)]
+        lines = [line(d, f"2024-05-{d:02d}", 2500) for d in range(1, 29)]
+        result = match(lines, records)
+        assert [(l["line_no"], r["id"]) for l, r, _ in result["matched"]] == [(d, f"p{d}") for d in range(1, 29)]
+        assert result["unmatched_lines"] == [] and result["unmatched_records"] == []
+        print("✓ Many lines with the same amount pair off one-to-one")
+
+    def test_amount_must_match_exactly(self):
+        """Test amounts differing by a paisa do not match"""
+        result = match([line(1, "2024-05-01", 1000.01)], [record("p1", "2024-05-01", 1000)])
+        assert result["matched"] == []
+        print("✓ Amount must match exactly")
+
+
+class TestTies:
+    """Lines with more than one equally close record"""
+
+    def test_tie_either_side_is_ambiguous(self):
+        """Test records equally far before and after make the line ambiguous"""
+        records = [record("before", "2024-05-08", 750), record("after", "2024-05-12", 750),
+                   record("further", "2024-05-13", 750)]
+        result = match([line(1, "2024-05-10", 750)], records)
+        assert result["matched"] == []
+        (l, candidates), = result["ambiguous"]
+        assert sorted(r["id"] for r in candidates) == ["after", "before"]
+        # Candidates are neither matched nor reported unmatched; the rest are
+        assert [r["id"] for r in result["unmatched_records"]] == ["further"]
+        print("✓ Tie either side is ambiguous")
+
+    def test_tie_same_day_is_ambiguous(self):
+        """Test two records on the same day make the line ambiguous"""
+        records = [record("a", "2024-05-10", 750), record("b", "2024-05-10", 750)]
+        result = match([line(1, "2024-05-10", 750)], records)
+        assert len(result["ambiguous"]) == 1 and len(result["ambiguous"][0][1]) == 2
+        print("✓ Tie on the same day is ambiguous")
+
+    def test_duplicate_reference_is_ambiguous(self):
+        """Test a reference shared by two records makes the line ambiguous"""
+        records = [record("a", "2024-05-10", 750, "CHQ1"), record("b", "2024-05-11", 750, "CHQ1")]
+        result = match([line(1, "2024-05-10", 750, "CHQ1")], records)
+        assert result["matched"] == [] and len(result["ambiguous"]) == 1
+        print("✓ Duplicate reference is ambiguous")
+
+
+class TestWindow:
+    """Dates outside +/- window_days"""
+
+    def test_outside_window_is_unmatched(self):
+        """Test records just outside the window are not matched"""
+        records = [record("early", "2024-05-06", 300), record("late", "2024-05-14", 300)]
+        result = match([line(1, "2024-05-10", 300)], records, window_days=3)
+        assert result["matched"] == [] and result["ambiguous"] == []
+        assert [l["line_no"] for l in result["unmatched_lines"]] == [1]
+        assert sorted(r["id"] for r in result["unmatched_records"]) == ["early", "late"]
+        print("✓ Records outside the window are unmatched")
+
+    def test_window_edge_is_inclusive(self):
+        """Test a record exactly window_days away matches, across a month end"""
+        result = match([line(1, "2024-03-02", 300)], [record("p1", "2024-02-28", 300)], window_days=3)
+        assert [r["id"] for _, r, _ in result["matched"]] == ["p1"]
+        print("✓ Window edge is inclusive")
+
+    def test_zero_window_same_day_only(self):
+        """Test window_days=0 only matches the same day"""
+        records = [record("p1", "2024-05-09", 300), record("p2", "2024-05-10", 300)]
+        result = match([line(1, "2024-05-10", 300), line(2, "2024-05-11", 300)], records, window_days=0)
+        assert [(l["line_no"], r["id"]) for l, r, _ in result["matched"]] == [(1, "p2")]
+        print("✓ Zero window matches the same day only")
+
+
+class TestParseStatement:
+    """Statement parsing - unreadable lines are returned, not raised"""
+
+    def test_invalid_lines_are_reported(self):
+        """Test bad dates and amounts come back with a reason alongside the good lines"""
+        content = (
+            "Date,Description,Amount,Reference\n"
+            "01/05/2024,Rent,1500,UTR1\n"
+            "someday,Rent,1500,UTR2\n"
+            "02/05/2024,Rent,lots,UTR3\n"
+        ).encode()
+        lines, invalid = parse_statement("statement.csv", content)
+        assert [l["line_no"] for l in lines] == [1]
+        assert [(i["line_no"], i["reason"].split()[1]) for i in invalid] == [(2, "date"), (3, "amount")]
+        print("✓ Invalid lines are reported with a reason")
+
+    def test_json_non_object(self):
+        """Test a JSON entry that is not an object is reported"""
+        lines, invalid = parse_statement("statement.json", json.dumps(
+            [{"date": "2024-05-01", "amount": 10}, 5]).encode())
+        assert len(lines) == 1 and invalid[0]["reason"] == "not an object"
+        print("✓ Non-object JSON entries are reported")
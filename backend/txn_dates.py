@@ -0,0 +1,79 @@
+"""Typed date fields on transactions.
+
+Transactions keep the free-form `date` string they were created with, plus
+`year`, `month` and `txn_date` (a UTC datetime at midnight of that day) so
+reports can filter with indexed range queries instead of string slicing.
+
+Backfill for documents written before these fields existed:
+    python txn_dates.py [--batch N] [--pause SECONDS]
+"""
+from pymongo import UpdateOne
+from database import db
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def date_fields(date_str: str, fallback: str = "") -> dict:
+    """year/month/txn_date for a YYYY-MM-DD[...] string, falling back to created_at."""
+    for value in (date_str, fallback):
+        try:
+            d = datetime.strptime((value or "")[:10], "%Y-%m-%d")
+        except ValueError:
+            continue
+        return {"year": d.year, "month": d.month, "txn_date": d.replace(tzinfo=timezone.utc)}
+    return {}
+
+
+def year_range(year: int, month: int = None) -> dict:
+    """txn_date bounds for a calendar year, or for one month of it."""
+    if month:
+        start = datetime(year, month, 1, tzinfo=timezone.utc)
+        end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    else:
+        start = datetime(year, 1, 1, tzinfo=timezone.utc)
+        end = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    return {"$gte": start, "$lt": end}
+
+
+async def backfill(batch: int = 500, pause: float = 0.2) -> int:
+    """Add date fields to transactions missing them, one batch at a time.
+
+    Walks the collection in _id order so it can run while the app is serving
+    traffic; `pause` seconds between batches keeps the write load bounded.
+    """
+    updated = 0
+    last_id = None
+    while True:
+        query = {"txn_date": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await db.transactions.find(
+            query, {"_id": 1, "date": 1, "created_at": 1}
+        ).sort("_id", 1).to_list(batch)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        ops = []
+        for d in docs:
+            fields = date_fields(d.get("date", ""), d.get("created_at", ""))
+            if fields:
+                ops.append(UpdateOne({"_id": d["_id"], "txn_date": {"$exists": False}}, {"$set": fields}))
+            else:
+                logger.warning(f"Transaction {d['_id']} has no parseable date")
+        if ops:
+            result = await db.transactions.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+        await asyncio.sleep(pause)
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.2)
+    args = parser.parse_args()
+    print(f"{asyncio.run(backfill(args.batch, args.pause))} transactions updated")
@@ -0,0 +1,91 @@
+"""Materialized unread-notification counters.
+
+notification_counters holds one document per (user_id, society_id) with
+the number of unread notifications, kept current with $inc as
+notifications are written and marked read, so the badge is a point read.
+A daily job recounts from the notifications collection and corrects any
+drift (a write that failed between the two updates, a retried batch); the
+same job runs once on first deploy to seed the counters.
+"""
+from pymongo import UpdateOne
+from database import db
+import jobs
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+UNREAD_RECONCILE_AT = os.environ.get("UNREAD_RECONCILE_AT", "03:00")
+
+
+async def add_unread(docs: list):
+    """Count freshly inserted notifications towards their recipients' counters."""
+    deltas = {}
+    for doc in docs:
+        if not doc.get("read"):
+            key = (doc["user_id"], doc["society_id"])
+            deltas[key] = deltas.get(key, 0) + 1
+    if not deltas:
+        return
+    await db.notification_counters.bulk_write([
+        UpdateOne({"user_id": user_id, "society_id": society_id}, {"$inc": {"unread": n}}, upsert=True)
+        for (user_id, society_id), n in deltas.items()
+    ], ordered=False)
+
+
+async def adjust(user_id: str, society_id: str, delta: int):
+    if delta:
+        await db.notification_counters.update_one(
+            {"user_id": user_id, "society_id": society_id}, {"$inc": {"unread": delta}}, upsert=True,
+        )
+
+
+async def unread_count(user_id: str, society_id: str = None) -> int:
+    if society_id:
+        doc = await db.notification_counters.find_one(
+            {"user_id": user_id, "society_id": society_id}, {"_id": 0, "unread": 1},
+        )
+        return max(doc["unread"], 0) if doc else 0
+    docs = await db.notification_counters.find(
+        {"user_id": user_id}, {"_id": 0, "unread": 1},
+    ).to_list(None)
+    return sum(max(d["unread"], 0) for d in docs)
+
+
+async def reconcile() -> dict:
+    """Bring every counter to the unread count the notifications collection holds.
+
+    Corrections are applied as $inc of the difference, so increments made
+    while the recount runs are kept; a write in flight at that moment can
+    leave a counter one off until the next run.
+    """
+    actual = {
+        (r["_id"]["user_id"], r["_id"]["society_id"]): r["count"]
+        async for r in db.notifications.aggregate([
+            {"$match": {"read": False}},
+            {"$group": {"_id": {"user_id": "$user_id", "society_id": "$society_id"}, "count": {"$sum": 1}}},
+        ])
+    }
+    ops = []
+    async for c in db.notification_counters.find({}, {"_id": 0}):
+        key = (c["user_id"], c["society_id"])
+        count = actual.pop(key, 0)
+        delta = count - c.get("unread", 0)
+        if delta:
+            ops.append(UpdateOne({"user_id": key[0], "society_id": key[1]}, {"$inc": {"unread": delta}}))
+    for (user_id, society_id), count in actual.items():
+        ops.append(UpdateOne({"user_id": user_id, "society_id": society_id}, {"$inc": {"unread": count}}, upsert=True))
+    for i in range(0, len(ops), 1000):
+        await db.notification_counters.bulk_write(ops[i:i + 1000], ordered=False)
+    if ops:
+        logger.info(f"Corrected {len(ops)} unread counters")
+    return {"corrected": len(ops)}
+
+
+@jobs.handler("unread_reconcile")
+async def _reconcile_job(ctx: jobs.JobContext) -> dict:
+    return await reconcile()
+
+
+jobs.schedule_daily("unread_reconcile", UNREAD_RECONCILE_AT)
+jobs.schedule_once("unread_reconcile", "seed")
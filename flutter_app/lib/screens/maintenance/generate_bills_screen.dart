@@ -89,16 +89,27 @@ class _GenerateBillsScreenState extends ConsumerState<GenerateBillsScreen> {
 
     setState(() => _generating = true);
     try {
-      final result = await ApiService.post('/maintenance/bills/generate', {
+      // Generation runs as a background job; poll it until it finishes
+      var job = await ApiService.post('/maintenance/bills/generate', {
         'bill_period_type': _billPeriodType,
         'month': _billPeriodType == 'monthly' ? _month : null,
         'year': _year,
         'apply_discount_scheme': _applyDiscount && _billPeriodType == 'yearly',
         'discount_scheme_id': _applyDiscount && _billPeriodType == 'yearly' ? _selectedScheme : null,
       });
+      while (job['status'] == 'queued' || job['status'] == 'running') {
+        await Future.delayed(const Duration(seconds: 1));
+        job = await ApiService.get('/maintenance/jobs/${job['id']}');
+      }
       if (mounted) {
+        final completed = job['status'] == 'completed';
         ScaffoldMessenger.of(context).showSnackBar(
-          SnackBar(content: Text('${result['bills_created']} bills generated!'), backgroundColor: Colors.green),
+          SnackBar(
+            content: Text(completed
+                ? '${job['result']['bills_created']} bills generated!'
+                : 'Error: ${job['error'] ?? 'Failed to generate bills'}'),
+            backgroundColor: completed ? Colors.green : Colors.red,
+          ),
         );
         _loadPreview();
       }
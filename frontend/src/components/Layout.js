@@ -1,8 +1,8 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useCallback } from "react";
 import { Link, useLocation, useNavigate } from "react-router-dom";
 import { useAuth } from "@/contexts/AuthContext";
 import { useSociety } from "@/contexts/SocietyContext";
-import api from "@/lib/api";
+import api, { subscribeNotifications } from "@/lib/api";
 import { Button } from "@/components/ui/button";
 import { Badge } from "@/components/ui/badge";
 import {
@@ -76,13 +76,29 @@ export default function Layout({ children }) {
 
   const items = navItems[role] || navItems.member;
 
+  const refreshUnread = useCallback(() => {
+    if (!currentSociety) return;
+    api.get(`/notifications/unread-count?society_id=${currentSociety.id}`)
+      .then((r) => setUnreadCount(r.data.count))
+      .catch(() => {});
+  }, [currentSociety]);
+
+  // Recount on navigation too, in case the stream missed events
+  useEffect(() => {
+    refreshUnread();
+  }, [refreshUnread, location.pathname]);
+
   useEffect(() => {
-    if (currentSociety) {
-      api.get(`/notifications/unread-count?society_id=${currentSociety.id}`)
-        .then((r) => setUnreadCount(r.data.count))
-        .catch(() => {});
-    }
-  }, [currentSociety, location.pathname]);
+    if (!currentSociety) return undefined;
+    // Count once per connection, then follow the stream's deltas
+    return subscribeNotifications(currentSociety.id, (event, data) => {
+      if (event === "open") refreshUnread();
+      else if (event === "unread") {
+        if (data.society_id === null) refreshUnread();
+        else setUnreadCount((count) => Math.max(0, count + data.delta));
+      }
+    });
+  }, [currentSociety, refreshUnread]);
 
   return (
     <div className="flex h-screen overflow-hidden noise-bg">
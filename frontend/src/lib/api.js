@@ -29,4 +29,54 @@ api.interceptors.response.use(
   }
 );
 
+// Server-sent notification events. EventSource cannot send the bearer
+// token, so read the stream with fetch. Reconnects until the returned
+// function is called.
+export function subscribeNotifications(societyId, onEvent) {
+  const controller = new AbortController();
+  let stopped = false;
+
+  const connect = async () => {
+    while (!stopped) {
+      try {
+        const res = await fetch(`${API_BASE}/api/notifications/stream?society_id=${societyId}`, {
+          headers: { Authorization: `Bearer ${localStorage.getItem("sfm_token")}` },
+          signal: controller.signal,
+        });
+        if (res.status === 401) return;
+        if (!res.ok) throw new Error(`stream ${res.status}`);
+        onEvent("open", null);
+        const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = "";
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += value;
+          let end;
+          while ((end = buffer.indexOf("\n\n")) >= 0) {
+            const block = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            let name = "message";
+            let data = "";
+            for (const line of block.split("\n")) {
+              if (line.startsWith("event: ")) name = line.slice(7);
+              else if (line.startsWith("data: ")) data += line.slice(6);
+            }
+            if (data) onEvent(name, JSON.parse(data));
+          }
+        }
+      } catch (err) {
+        if (stopped) return;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 5000));
+    }
+  };
+
+  connect();
+  return () => {
+    stopped = true;
+    controller.abort();
+  };
+}
+
 export default api;
@@ -85,7 +85,16 @@ export default function GenerateBills() {
         discount_scheme_id: applyDiscount && billPeriodType === "yearly" ? selectedScheme : null,
       };
       const res = await api.post(`/societies/${currentSociety.id}/maintenance/bills/generate`, body);
-      toast.success(`${res.data.bills_created} bills generated successfully!`);
+      let job = res.data;
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = (await api.get(`/societies/${currentSociety.id}/maintenance/jobs/${job.id}`)).data;
+      }
+      if (job.status === "completed") {
+        toast.success(`${job.result.bills_created} bills generated successfully!`);
+      } else {
+        toast.error(job.error || "Failed to generate bills");
+      }
       fetchPreview();
     } catch (e) {
       toast.error(e.response?.data?.detail || "Failed to generate bills");
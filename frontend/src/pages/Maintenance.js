@@ -71,7 +71,8 @@ export default function Maintenance() {
         due_date: genForm.due_date,
         late_fee: parseFloat(genForm.late_fee || 0),
       });
-      toast.success(`${res.data.bills_created} bills generated successfully`);
+      if (res.status === 202) toast.info("Bill generation was requeued and will finish in the background");
+      else toast.success(`${res.data.bills_created} bills generated successfully`);
       setGenOpen(false);
       fetchBills();
     } catch (err) {